@@ -1,16 +1,22 @@
 import os
-from flask import Flask, send_from_directory, jsonify
+import time
+from flask import Flask, send_from_directory, jsonify, request, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_migrate import Migrate
 from models import db
 from routes import register_blueprints
-from seed import seed_games_and_movies  # Import seeding logic
+from seed import seed_games_and_movies, seed_command  # Import seeding logic
+from collaborative import train_cf_command
+from batch import precompute_command
+from metrics import REQUEST_SECONDS, registry, start_trace
 
 load_dotenv()
 
 migrate = Migrate()
 
+CORS_ORIGINS = ["https://rexys-frontend.vercel.app", "http://localhost:5173"]
+
 def create_app():
     # Serve frontend files
     app = Flask(__name__, static_folder='frontend/dist')
@@ -20,16 +26,35 @@ def create_app():
 
     # CORS configuration
     CORS(app, resources={
-        r"/*": {"origins": ["https://rexys-frontend.vercel.app", "http://localhost:5173"]}
+        r"/*": {"origins": CORS_ORIGINS}
     })
 
     # Initialize database and migrations
     db.init_app(app)
     migrate.init_app(app, db)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(train_cf_command)
+    app.cli.add_command(precompute_command)
 
     # Register routes
     register_blueprints(app)
 
+    # Request-level tracing: an id for every request's logs, and its latency
+    @app.before_request
+    def start_request_trace():
+        g.request_id = start_trace(request.headers.get('X-Request-ID'))
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request_trace(response):
+        if 'request_start' in g:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                    method=request.method, endpoint=endpoint, status=response.status_code)
+            response.headers['X-Request-ID'] = g.request_id
+        registry.flush_if_due()
+        return response
+
     # Serve Vue frontend
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
@@ -48,23 +73,20 @@ def create_app():
 
 
 def initialize_data(app):
-    """Function to reset the database and initialize it with data."""
+    """Create missing tables and ingest new or changed catalog rows; user ratings are kept."""
     with app.app_context():
-        # Drop all tables if they exist
-        db.drop_all()
-        print("Existing tables dropped!")
-
-        # Create fresh tables
         db.create_all()
-        print("Database tables created!")
+        print("Database tables ready!")
 
         # Seed database
         seed_games_and_movies()
 
 
-if __name__ == '__main__':
-    app = create_app()
+# Module-level app for `gunicorn app:app`; with --preload it is built once before workers fork
+app = create_app()
+
 
+if __name__ == '__main__':
     initialize_data(app)
 
     # Start the app with Gunicorn for production
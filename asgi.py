@@ -0,0 +1,243 @@
+"""
+Async serving mode: the same create_app() routes and JSON, behind ASGI.
+
+The recommendation and rating endpoints run as coroutines. recommend()
+reads through async SQLAlchemy sessions and scores on a bounded thread
+pool, so a slow query or a long ranking no longer holds a whole worker.
+Ratings are written by the Flask route's own save_ratings(), on a
+separate thread pool. Every other route is passed to the Flask app
+unchanged.
+
+Run with:
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 asgi:app
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import CORS_ORIGINS, app as flask_app
+from batch import preferences_hash, version_key
+from cache import result_cache
+from catalog import movie_catalog, game_catalog
+from metrics import REQUEST_SECONDS, registry, start_trace, timed_query
+from models import Movie, Game, UserGameRating, UserMovieRating, UserProfile, UserRecommendation
+from recommender import Ranking
+from routes.rating import parse_game_ratings, parse_movie_ratings, ratings_response, save_ratings
+from routes.recommend import cache_key, page_from_stored, parse_recommend_request, ranking_page
+
+# Threads that run recommend() scoring, and how many requests may wait for one
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', str(os.cpu_count() or 1)))
+SCORING_QUEUE = int(os.getenv('SCORING_QUEUE', str(4 * SCORING_WORKERS)))
+# Threads for the synchronous calls: catalog refreshes, hard filters and rating writes
+BLOCKING_WORKERS = int(os.getenv('BLOCKING_WORKERS', '4'))
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_database_url(url):
+    """DATABASE_URL with its driver swapped for the asyncio one."""
+    scheme, rest = url.split('://', 1)
+    driver = ASYNC_DRIVERS.get(scheme.split('+')[0])
+    if driver is None:
+        raise RuntimeError(f"No async driver for {scheme} databases.")
+    return f'{driver}://{rest}'
+
+
+class AsyncServer:
+    """
+    ASGI application. POST /recommend/movies|games and
+    /ratings/rate/movies|games are handled here; everything else, including
+    CORS preflights, goes to the wrapped Flask app.
+    """
+
+    def __init__(self, flask_app, database_url=None, scoring_workers=SCORING_WORKERS, scoring_queue=SCORING_QUEUE):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = create_async_engine(
+            async_database_url(database_url or flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.scoring = ThreadPoolExecutor(scoring_workers, thread_name_prefix='scoring')
+        self.scoring_slots = asyncio.Semaphore(scoring_queue)
+        self.blocking = ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix='blocking')
+        self.routes = {
+            '/recommend/movies': partial(self.recommend, movie_catalog),
+            '/recommend/games': partial(self.recommend, game_catalog),
+            '/ratings/rate/movies': partial(self.rate, movie_catalog, UserMovieRating, Movie, 'movie_id',
+                                            parse_movie_ratings, 'Movie'),
+            '/ratings/rate/games': partial(self.rate, game_catalog, UserGameRating, Game, 'game_id',
+                                           parse_game_ratings, 'Game'),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        start = time.perf_counter()
+        request_id = start_trace(dict(scope.get('headers', [])).get(b'x-request-id', b'').decode() or None)
+        try:
+            body = await read_body(receive)
+            data = json.loads(body) if body else None
+            payload, status = await handler(data)
+        except json.JSONDecodeError:
+            payload, status = {"error": "Request body must be JSON"}, 400
+        except Exception as e:
+            print(f"Error in {scope['path']}: {e}")
+            payload, status = {"error": "Internal server error"}, 500
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method='POST', endpoint=scope['path'], status=status)
+        registry.flush_if_due()
+        await send_json(scope, send, payload, status, request_id)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.scoring.shutdown(wait=False)
+                self.blocking.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _in_app_context(self, function, *args):
+        with self.flask_app.app_context():
+            return function(*args)
+
+    async def run_blocking(self, function, *args):
+        """Run a call that needs Flask-SQLAlchemy's session off the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.blocking, partial(contextvars.copy_context().run, self._in_app_context, function, *args)
+        )
+
+    async def run_scoring(self, function, *args, **kwargs):
+        """Run CPU-bound scoring on the bounded pool; callers wait for a slot instead of queueing without limit."""
+        async with self.scoring_slots:
+            # Executor threads don't inherit the task's context; copy it so logs keep the request's trace
+            return await asyncio.get_running_loop().run_in_executor(
+                self.scoring, partial(contextvars.copy_context().run, function, *args, **kwargs)
+            )
+
+    async def run_cache(self, function, *args):
+        """Result cache calls: in place on the local cache, on the blocking pool when they go to Redis."""
+        if not result_cache.remote:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.blocking, partial(function, *args))
+
+    async def recommender(self, store):
+        # Only the periodic version check touches the database
+        recommender = store.fresh_recommender()
+        if recommender is None:
+            recommender = await self.run_blocking(store.recommender)
+        return recommender
+
+    async def recommend(self, store, data):
+        parsed, error = parse_recommend_request(data or {})
+        if error:
+            return error
+        user_id, preferences, filters = parsed['user_id'], parsed['preferences'], parsed['filters']
+        k, offset = parsed['k'], parsed['offset']
+
+        recommender = await self.recommender(store)
+        key = cache_key(preferences, filters)
+        rating_model, item_column = store.rating_model, store.rating_item_column
+        async with self.sessions() as session:
+            with timed_query('rating_revision'):
+                revision = (await session.execute(
+                    select(UserProfile.updated_at).filter_by(user_id=user_id, catalog=store.name)
+                )).scalar()
+            version = (store.version, revision)
+            cached = await self.run_cache(result_cache.get, store.name, user_id, key, version)
+            if cached is not None:
+                return ranking_page(store.name, Ranking(recommender.catalog, *cached), offset, k), 200
+
+            if not filters:
+                with timed_query('stored_recommendations'):
+                    row = (await session.execute(
+                        select(UserRecommendation.items, UserRecommendation.total).filter_by(
+                            user_id=user_id, catalog=store.name, preferences_hash=preferences_hash(preferences),
+                            catalog_version=version_key(store),
+                        )
+                    )).first()
+                stored = page_from_stored(store, None if row is None else (row.items, row.total), offset, k)
+                if stored is not None:
+                    return stored, 200
+
+            with timed_query('user_ratings'):
+                ratings = dict((await session.execute(
+                    select(item_column, rating_model.rating).where(rating_model.user_id == user_id)
+                )).all())
+            profile_terms = None
+            if ratings:
+                with timed_query('user_profile'):
+                    profile_terms = (await session.execute(
+                        select(UserProfile.terms).filter_by(user_id=user_id, catalog=store.name)
+                    )).scalar() or None
+
+        candidates = None
+        if filters:
+            with timed_query('candidate_ids'):
+                candidates = np.fromiter(await self.run_blocking(store.candidate_ids, filters), dtype=np.int64)
+
+        def score():
+            # Everything proportional to the catalog size runs here, off the event loop
+            history = set(ratings)
+            if candidates is not None:
+                history = recommender.history_mask(history) | ~np.isin(recommender.item_ids, candidates)
+            return recommender.rank(
+                preferences, history,
+                collaborative_scores=store.collaborative_scores(ratings, recommender.catalog),
+                profile_terms=profile_terms,
+            )
+
+        ranking = await self.run_scoring(score)
+        await self.run_cache(result_cache.set, store.name, user_id, key, version, (ranking.rows, ranking.scores))
+        return ranking_page(store.name, ranking, offset, k), 200
+
+    async def rate(self, store, rating_model, item_model, item_key, parse, label, data):
+        parsed, error = parse(data or {})
+        if error:
+            return error
+        user_id, ratings = parsed
+        # The same write path as the Flask route, on the blocking pool
+        accepted, rejected = await self.run_blocking(
+            save_ratings, store, rating_model, item_model, item_key, user_id, ratings
+        )
+        await self.run_cache(result_cache.invalidate_user, store.name, user_id)
+        return ratings_response(label, accepted, rejected), 201
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_json(scope, send, payload, status, request_id):
+    # Flask's jsonify output: compact, sorted keys, trailing newline
+    body = (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode()
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+               (b'x-request-id', request_id.encode())]
+    origin = dict(scope.get('headers', [])).get(b'origin', b'').decode()
+    if origin in CORS_ORIGINS:
+        headers.extend([(b'access-control-allow-origin', origin.encode()), (b'vary', b'Origin')])
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = AsyncServer(flask_app)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import click
+from flask.cli import with_appcontext
+
+from cache import preferences_key
+from models import db, User, UserRecommendation
+from profiles import profile_terms_for_users
+from recommender import top_k_indices
+from upsert import bulk_upsert
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(os.cpu_count() or 1)))
+# Users ranked per rank_many() call, and per task sent to the pool
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '100'))
+PRECOMPUTE_K = int(os.getenv('PRECOMPUTE_K', '50'))
+# Users whose ratings and profiles are loaded and written per transaction by the precompute job
+PRECOMPUTE_PAGE_SIZE = int(os.getenv('PRECOMPUTE_PAGE_SIZE', '5000'))
+
+# Set before the pool forks, so workers inherit the warm recommender instead of unpickling it
+_store = None
+_recommender = None
+
+
+def preferences_hash(preferences):
+    return hashlib.sha1(preferences_key(preferences).encode()).hexdigest()
+
+
+def version_key(store):
+    return json.dumps(store.version, default=str)
+
+
+def _rank_chunk(requests, k):
+    """(item ids, scores, ranking length) of the top k for each (user id, preferences, ratings, profile) request."""
+    catalog = _recommender.catalog
+    rankings = _recommender.rank_many([
+        (preferences, set(ratings), _store.collaborative_scores(ratings, catalog), profile_terms)
+        for _, preferences, ratings, profile_terms in requests
+    ])
+
+    results = []
+    for ranking in rankings:
+        positions = top_k_indices(ranking.scores, k)
+        results.append((catalog.ids[ranking.rows[positions]].tolist(), ranking.scores[positions].tolist(), len(ranking)))
+    return results
+
+
+def recommend_batch(store, requests, k, workers=1, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Yield (chunk of (user id, preferences, ratings, profile) requests, their
+    _rank_chunk results) for (user id, preferences) pairs, in order.
+
+    Ratings and profiles of every user are loaded in two queries, and all
+    users share one recommender, so the catalog, TF-IDF matrix and fuzzy
+    system are prepared once. With workers > 1 the chunks are ranked in a
+    forked process pool.
+    """
+    global _store, _recommender
+
+    recommender = store.recommender()
+    user_ids = sorted({user_id for user_id, _ in requests})
+    ratings = store.ratings_for_users(user_ids)
+    profiles = profile_terms_for_users(store.name, user_ids)
+    prepared = [
+        (user_id, preferences, ratings.get(user_id, {}), profiles.get(user_id) if user_id in ratings else None)
+        for user_id, preferences in requests
+    ]
+    chunks = [prepared[start:start + chunk_size] for start in range(0, len(prepared), chunk_size)]
+
+    _store, _recommender = store, recommender
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield chunk, _rank_chunk(chunk, k)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        yield from zip(chunks, executor.map(_rank_chunk, chunks, repeat(k)))
+
+
+def save_batch(store, version, chunk, results):
+    """Upsert one chunk of results into user_recommendations. Does not commit."""
+    bulk_upsert(
+        UserRecommendation,
+        [
+            {
+                'user_id': user_id,
+                'catalog': store.name,
+                'preferences_hash': preferences_hash(preferences),
+                'catalog_version': version,
+                'items': [[item_id, score] for item_id, score in zip(item_ids, scores)],
+                'total': total,
+            }
+            for (user_id, preferences, _, _), (item_ids, scores, total) in zip(chunk, results)
+        ],
+        ['user_id', 'catalog', 'preferences_hash'],
+        ['catalog_version', 'items', 'total'],
+    )
+
+
+def stored_recommendations(store, user_id, preferences):
+    """(items, total) precomputed for the user at the current catalog version, or None."""
+    row = db.session.query(UserRecommendation.items, UserRecommendation.total).filter_by(
+        user_id=user_id, catalog=store.name, preferences_hash=preferences_hash(preferences),
+        catalog_version=version_key(store),
+    ).first()
+    return None if row is None else (row.items, row.total)
+
+
+def discard_stored_recommendations(name, user_id):
+    """Drop a user's precomputed lists once their ratings change. Does not commit."""
+    db.session.query(UserRecommendation).filter_by(user_id=user_id, catalog=name).delete(synchronize_session=False)
+
+
+def read_requests(path):
+    """(user id, preferences) pairs from a JSON-lines file of {"user_id": ..., "preferences": {...}}."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield int(entry['user_id']), entry.get('preferences') or {}
+
+
+def all_user_requests(page_size=PRECOMPUTE_PAGE_SIZE):
+    """
+    Every user with empty preferences, in id order. Each page of ids is a
+    separate keyset query (id > last id), so the job can commit between
+    pages without a server-side cursor being open.
+    """
+    last_id = None
+    while True:
+        query = db.session.query(User.id)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        user_ids = [user_id for (user_id,) in query.order_by(User.id).limit(page_size)]
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            yield user_id, {}
+        last_id = user_ids[-1]
+
+
+def pages(requests, size=PRECOMPUTE_PAGE_SIZE):
+    page = []
+    for request in requests:
+        page.append(request)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+@click.command('precompute-recommendations')
+@click.option('--catalog', 'catalog_name', type=click.Choice(['movies', 'games', 'all']), default='all',
+              show_default=True)
+@click.option('--input', 'input_path', type=click.Path(exists=True, dir_okay=False),
+              help='JSON lines of {"user_id", "preferences"}; defaults to every user with no preferences.')
+@click.option('--k', default=PRECOMPUTE_K, show_default=True, help='Items stored per user.')
+@click.option('--workers', default=BATCH_WORKERS, show_default=True, help='Ranking processes.')
+@click.option('--chunk-size', default=BATCH_CHUNK_SIZE, show_default=True, help='Users per ranking task.')
+@with_appcontext
+def precompute_command(catalog_name, input_path, k, workers, chunk_size):
+    """Rank many users against one shared catalog pass and store their top-k lists."""
+    from catalog import movie_catalog, game_catalog
+
+    stores = [store for store in (movie_catalog, game_catalog) if catalog_name in ('all', store.name)]
+    for store in stores:
+        requests = read_requests(input_path) if input_path else all_user_requests()
+        start = time.perf_counter()
+        total = 0
+        for page in pages(requests):
+            store.recommender()
+            version = version_key(store)
+            for chunk, results in recommend_batch(store, page, k, workers, chunk_size):
+                save_batch(store, version, chunk, results)
+            db.session.commit()
+            total += len(page)
+            elapsed = time.perf_counter() - start
+            print(f"  {store.name}: {total} users ({total / elapsed:.0f} users/s)")
+        print(f"Precomputed {store.name} recommendations for {total} users in {time.perf_counter() - start:.1f}s.")
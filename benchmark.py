@@ -0,0 +1,629 @@
+"""
+Micro-benchmarks for the recommendation hot paths.
+
+Usage:
+    python benchmark.py cb --sizes 1000 5000 50000
+    python benchmark.py fuzzy --items 5000
+    python benchmark.py surface --resolutions 11 21 41 81
+    python benchmark.py stress --threads 8 --rounds 20
+    python benchmark.py prefs --sizes 1000 5000 50000
+    python benchmark.py ratings --batches 10 100 1000
+    python benchmark.py keywords --documents 20000 --workers 1 4
+    python benchmark.py snapshot --sizes 10000 100000
+    python benchmark.py cf --ratings 10000 100000 1000000
+    python benchmark.py similar --sizes 10000 100000
+    python benchmark.py profiles --history 100 1000 10000
+    python benchmark.py batch --users 100 1000 --items 20000
+    python benchmark.py load --url http://localhost:8000 --concurrency 32 --requests 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from collaborative import RatingFactors
+from fuzzy_engine import (
+    FUZZY_TOLERANCE, BatchFuzzyEngine, FuzzyLookupSurface, compare_with_skfuzzy, surface_accuracy,
+)
+from item_catalog import ItemCatalog
+from keywords import KeywordExtractor, top_n_per_row
+from models import db, Movie, User, UserMovieRating
+from profiles import rating_deltas
+from recommender import BaseRecommender, GameRecommender, MovieRecommender, top_k_indices
+from similarity_index import TagLSH, recall_at_k
+from snapshot import load_snapshot, save_snapshot
+from tag_index import TagIndex
+from upsert import bulk_upsert
+
+
+def synthetic_tfidf(n_items, n_terms=1000, tags_per_item=5, seed=42):
+    """Random L2-normalized tag matrix shaped like the catalog index."""
+    rng = np.random.default_rng(seed)
+    rows = np.repeat(np.arange(n_items), tags_per_item)
+    cols = rng.integers(0, n_terms, size=n_items * tags_per_item)
+    data = rng.random(n_items * tags_per_item)
+    matrix = sp.csr_matrix((data, (rows, cols)), shape=(n_items, n_terms))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    return sp.diags(1 / np.where(norms == 0, 1, norms)) @ matrix
+
+
+def synthetic_items(n_items):
+    return [{'id': i, 'tags': []} for i in range(n_items)]
+
+
+GENRES = ['Drama', 'Crime', 'Action', 'Comedy', 'Adventure', 'Thriller', 'Romance', 'Sci-Fi']
+
+
+def synthetic_movies(n_items, n_tags=500, n_actors=2000, seed=42):
+    """Movie dicts in the shape Movie.to_dict() returns."""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'id': i + 1,
+            'title': f'Movie {i + 1}',
+            'genre': ', '.join(rng.choice(GENRES, size=rng.integers(1, 4), replace=False)),
+            'tags': [f'tag{t}' for t in rng.choice(n_tags, size=5, replace=False)],
+            'actors': [f'Actor {a}' for a in rng.choice(n_actors, size=4, replace=False)],
+            'rating': round(float(rng.uniform(5, 10)), 1),
+            'popularity': int(rng.integers(1000, 2500000)),
+        }
+        for i in range(n_items)
+    ]
+
+
+def synthetic_preferences(n_sets, seed=7):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'genre': str(rng.choice(GENRES)),
+            'tags': [f'tag{t}' for t in rng.choice(500, size=3, replace=False)],
+            'rating': {'min': float(rng.uniform(5, 8)), 'max': 10},
+            'actors': [f'Actor {a}' for a in rng.choice(2000, size=2, replace=False)],
+        }
+        for _ in range(n_sets)
+    ]
+
+
+def bench_cb(sizes, loop_sample=500):
+    print(f"{'items':>8} {'loop/item ms':>13} {'loop est s':>11} {'batch s':>9} {'speedup':>9} {'max diff':>10}")
+    for n_items in sizes:
+        tfidf_matrix = synthetic_tfidf(n_items)
+        recommender = BaseRecommender.__new__(BaseRecommender)
+        recommender.catalog = ItemCatalog.from_items(synthetic_items(n_items))
+
+        start = time.perf_counter()
+        batch_scores = recommender.calculate_cb_scores(tfidf_matrix)
+        batch_time = time.perf_counter() - start
+
+        # The per-item loop is quadratic, so time a sample and extrapolate
+        sample = min(n_items, loop_sample)
+        start = time.perf_counter()
+        loop_scores = [recommender.calculate_cb_score(idx, tfidf_matrix) for idx in range(sample)]
+        loop_per_item = (time.perf_counter() - start) / sample
+        loop_time = loop_per_item * n_items
+
+        max_diff = np.max(np.abs(batch_scores[:sample] - np.asarray(loop_scores)))
+        print(f"{n_items:>8} {loop_per_item * 1000:>13.3f} {loop_time:>11.2f} {batch_time:>9.4f} "
+              f"{loop_time / batch_time:>8.0f}x {max_diff:>10.2e}")
+
+
+def synthetic_fuzzy_inputs(engine, n_items, seed=42):
+    """Uniform samples over each antecedent universe, slightly past both ends."""
+    rng = np.random.default_rng(seed)
+    inputs = {}
+    for label, antecedent in engine.antecedents.items():
+        low, high = antecedent.universe.min(), antecedent.universe.max()
+        span = high - low
+        inputs[label] = rng.uniform(low - 0.05 * span, high + 0.05 * span, size=n_items)
+    return inputs
+
+
+def bench_fuzzy(n_items):
+    within_tolerance = True
+    print(f"{'system':>7} {'items':>6} {'skfuzzy s':>10} {'batch s':>9} {'speedup':>9} {'max diff':>10} {'no output':>10}")
+    for name, recommender_class in (('movies', MovieRecommender), ('games', GameRecommender)):
+        control_system = recommender_class([]).fuzzy_system
+        engine = BatchFuzzyEngine(control_system)
+        inputs = synthetic_fuzzy_inputs(engine, n_items)
+
+        start = time.perf_counter()
+        engine.compute(**inputs)
+        batch_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch, reference = compare_with_skfuzzy(control_system, inputs)
+        reference_time = time.perf_counter() - start - batch_time
+
+        same_failures = np.array_equal(np.isnan(batch), np.isnan(reference))
+        fired = ~np.isnan(reference)
+        max_diff = np.max(np.abs(batch[fired] - reference[fired])) if fired.any() else 0.
+        within_tolerance &= same_failures and max_diff <= FUZZY_TOLERANCE
+
+        print(f"{name:>7} {n_items:>6} {reference_time:>10.2f} {batch_time:>9.4f} "
+              f"{reference_time / batch_time:>8.0f}x {max_diff:>10.2e} {int((~fired).sum()):>10}")
+
+    print(f"Tolerance {FUZZY_TOLERANCE:.0e}: {'OK' if within_tolerance else 'EXCEEDED'}")
+    return within_tolerance
+
+
+def bench_surface(resolutions, n_items):
+    print(f"{'system':>7} {'grid':>5} {'build s':>8} {'lookup ms':>10} {'exact ms':>9} "
+          f"{'mean err':>9} {'p99 err':>9} {'max err':>9} {'mismatch':>9}")
+    for name, recommender_class in (('movies', MovieRecommender), ('games', GameRecommender)):
+        engine = BatchFuzzyEngine(recommender_class([]).fuzzy_system)
+        inputs = synthetic_fuzzy_inputs(engine, n_items)
+
+        start = time.perf_counter()
+        engine.compute(**inputs)
+        exact_time = time.perf_counter() - start
+
+        for resolution in resolutions:
+            start = time.perf_counter()
+            surface = FuzzyLookupSurface.build(engine, resolution)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            surface.compute(**inputs)
+            lookup_time = time.perf_counter() - start
+
+            report = surface_accuracy(surface)
+            print(f"{name:>7} {resolution:>5} {build_time:>8.2f} {lookup_time * 1000:>10.2f} {exact_time * 1000:>9.2f} "
+                  f"{report['mean_abs_error']:>9.2e} {report['p99_abs_error']:>9.2e} "
+                  f"{report['max_abs_error']:>9.2e} {report['output_mismatch_rate']:>9.2%}")
+
+
+def bench_prefs(sizes, n_preferences=5):
+    print(f"{'items':>8} {'loop s':>8} {'batch s':>9} {'speedup':>9} {'max diff':>10}")
+    for n_items in sizes:
+        items = synthetic_movies(n_items)
+        recommender = MovieRecommender(items)
+        preference_sets = synthetic_preferences(n_preferences)
+        rows = np.arange(n_items)
+
+        start = time.perf_counter()
+        loop_scores = [
+            [recommender.calculate_preference_score(item, preferences) for item in items]
+            for preferences in preference_sets
+        ]
+        loop_time = (time.perf_counter() - start) / n_preferences
+
+        start = time.perf_counter()
+        batch_scores = [
+            recommender.calculate_preference_scores(rows, recommender.preference_query(preferences))
+            for preferences in preference_sets
+        ]
+        batch_time = (time.perf_counter() - start) / n_preferences
+
+        max_diff = np.max(np.abs(np.asarray(loop_scores) - np.asarray(batch_scores)))
+        print(f"{n_items:>8} {loop_time:>8.3f} {batch_time:>9.4f} {loop_time / batch_time:>8.0f}x {max_diff:>10.2e}")
+
+
+def bench_stress(n_items, n_threads, rounds, n_preferences=8):
+    """Hammer one shared recommender from many threads and compare with serial results."""
+    items = synthetic_movies(n_items)
+    recommender = MovieRecommender(items)
+    preference_sets = synthetic_preferences(n_preferences)
+    history = {item['id'] for item in items[:20]}
+
+    def run(preferences):
+        return [(item['id'], score) for item, score in recommender.recommend(preferences, history)]
+
+    expected = [run(preferences) for preferences in preference_sets]
+    jobs = [i % n_preferences for i in range(rounds * n_preferences)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        results = list(executor.map(lambda i: (i, run(preference_sets[i])), jobs))
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(result != expected[i] for i, result in results)
+    print(f"{len(jobs)} calls on {n_threads} threads over {n_items} items in {elapsed:.2f}s: "
+          f"{mismatches} mismatches")
+    return mismatches == 0
+
+
+def legacy_rate_movies(user_id, ratings):
+    """The per-entry SELECT then INSERT/UPDATE loop the ratings routes used to run."""
+    for rating_data in ratings:
+        existing_rating = UserMovieRating.query.filter_by(
+            user_id=user_id, movie_id=rating_data['movie_id']).first()
+        if existing_rating:
+            existing_rating.rating = rating_data['rating']
+        else:
+            db.session.add(UserMovieRating(user_id=user_id, **rating_data))
+    db.session.commit()
+
+
+def bench_ratings(batches):
+    """Rate movies through the old per-entry loop and bulk_upsert on a scratch SQLite database."""
+    from flask import Flask
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'ratings.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([User(id=user_id, username=f'user{user_id}') for user_id in (1, 2)])
+            db.session.bulk_insert_mappings(Movie, [
+                {'id': i, 'title': f'Movie {i}', 'genre': 'Drama'} for i in range(1, max(batches) + 1)
+            ])
+            db.session.commit()
+
+            print(f"{'batch':>6} {'pass':>7} {'loop s':>8} {'upsert s':>9} {'speedup':>8}")
+            for batch in batches:
+                db.session.query(UserMovieRating).delete()
+                db.session.commit()
+                for label, rating in (('insert', 3.), ('update', 4.)):
+                    ratings = [{'movie_id': i, 'rating': rating} for i in range(1, batch + 1)]
+
+                    start = time.perf_counter()
+                    legacy_rate_movies(1, ratings)
+                    loop_time = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    bulk_upsert(UserMovieRating, [dict(row, user_id=2) for row in ratings],
+                                ['user_id', 'movie_id'], ['rating'])
+                    db.session.commit()
+                    upsert_time = time.perf_counter() - start
+
+                    print(f"{batch:>6} {label:>7} {loop_time:>8.4f} {upsert_time:>9.4f} "
+                          f"{loop_time / upsert_time:>7.0f}x")
+
+
+def synthetic_documents(n_documents, n_words=20000, words_per_document=60, seed=42):
+    """Random descriptions over a Zipf-distributed vocabulary of made-up words."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'w{i}x' for i in range(n_words)])
+    words = vocabulary[np.minimum(rng.zipf(1.3, size=(n_documents, words_per_document)), n_words) - 1]
+    return [' '.join(document) for document in words]
+
+
+def legacy_keywords(texts, top_n=5):
+    """The dense per-row argsort the uploaders used to run."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    tfidf = TfidfVectorizer(stop_words='english', max_features=1000)
+    tfidf_matrix = tfidf.fit_transform(texts)
+    feature_names = tfidf.get_feature_names_out()
+    return [
+        ', '.join(feature_names[i] for i in row.toarray().argsort()[0, -top_n:][::-1])
+        for row in tfidf_matrix
+    ]
+
+
+def bench_keywords(n_documents, worker_counts, top_n=5):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    texts = synthetic_documents(n_documents)
+    tfidf_matrix = TfidfVectorizer(stop_words='english', max_features=1000).fit_transform(texts)
+
+    # Top-n selection alone, on the same matrix
+    start = time.perf_counter()
+    for row in tfidf_matrix:
+        row.toarray().argsort()[0, -top_n:][::-1]
+    dense_time = time.perf_counter() - start
+    start = time.perf_counter()
+    top_n_per_row(tfidf_matrix, top_n)
+    csr_time = time.perf_counter() - start
+    print(f"{n_documents} documents, top-{top_n} selection: dense argsort {dense_time:.2f}s, "
+          f"CSR {csr_time:.3f}s ({dense_time / csr_time:.0f}x)")
+
+    # End to end, including tokenizing
+    start = time.perf_counter()
+    legacy_keywords(texts)
+    loop_time = time.perf_counter() - start
+    print(f"{n_documents} documents, dense per-row loop: {loop_time:.2f}s")
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        KeywordExtractor(workers=workers).fit_transform(texts)
+        elapsed = time.perf_counter() - start
+        print(f"{'':>10} KeywordExtractor, {workers} workers: {elapsed:.2f}s ({loop_time / elapsed:.1f}x)")
+
+
+def bench_snapshot(sizes):
+    print(f"{'items':>8} {'from dicts s':>13} {'snapshot s':>11} {'speedup':>9} {'same ranking':>13}")
+    preferences = synthetic_preferences(1)[0]
+    for n_items in sizes:
+        items = synthetic_movies(n_items)
+
+        # What a worker did per start: build the catalog from to_dict() rows and fit the index
+        start = time.perf_counter()
+        catalog = ItemCatalog.from_items(items)
+        tag_index = TagIndex.build(catalog)
+        build_time = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            save_snapshot('movies', catalog, tag_index, (1, n_items, n_items), directory)
+            start = time.perf_counter()
+            _, mapped_catalog, mapped_index = load_snapshot('movies', directory)
+            load_time = time.perf_counter() - start
+
+            expected = MovieRecommender(catalog, tag_index).recommend(preferences, k=10)
+            actual = MovieRecommender(mapped_catalog, mapped_index).recommend(preferences, k=10)
+        print(f"{n_items:>8} {build_time:>13.3f} {load_time:>11.4f} {build_time / load_time:>8.0f}x "
+              f"{str(expected == actual):>13}")
+
+
+def synthetic_ratings(n_ratings, n_items=5000, ratings_per_user=20, rank=8, seed=42):
+    """(user ids, item ids, ratings) from a hidden low-rank model plus noise, on a 1-10 scale."""
+    rng = np.random.default_rng(seed)
+    n_users = max(1, n_ratings // ratings_per_user)
+    users = rng.normal(size=(n_users, rank))
+    items = rng.normal(size=(n_items, rank))
+    pairs = np.unique(rng.integers(0, [n_users, n_items], size=(n_ratings, 2)), axis=0)
+    user_ids, item_ids = pairs[:, 0], pairs[:, 1]
+    ratings = np.einsum('ij,ij->i', users[user_ids], items[item_ids]) / np.sqrt(rank)
+    ratings = np.clip(np.round(5.5 + 1.5 * ratings + rng.normal(scale=0.5, size=len(ratings))), 1, 10)
+    return user_ids, item_ids + 1, ratings
+
+
+def bench_cf(sizes, n_queries=200):
+    print(f"{'ratings':>9} {'train s':>9} {'query ms':>9} {'rmse':>6} {'mean rmse':>10}")
+    for n_ratings in sizes:
+        user_ids, item_ids, ratings = synthetic_ratings(n_ratings)
+        held_out = np.random.default_rng(0).random(len(ratings)) < 0.1
+
+        start = time.perf_counter()
+        model = RatingFactors.train(user_ids[~held_out], item_ids[~held_out], ratings[~held_out])
+        train_time = time.perf_counter() - start
+
+        # Serving: fold the user in from their ratings, score every item, take the top 10
+        catalog_ids = np.arange(1, 5001)
+        item_factors = model.align(catalog_ids)
+        by_user = np.argsort(user_ids, kind='stable')
+        starts = np.searchsorted(user_ids[by_user], np.arange(user_ids.max() + 2))
+        errors = []
+        start = time.perf_counter()
+        for user in range(min(n_queries, user_ids.max() + 1)):
+            entries = by_user[starts[user]:starts[user + 1]]
+            train_entries = entries[~held_out[entries]]
+            user_vector = model.fold_in(item_factors, (item_ids[train_entries] - 1, ratings[train_entries]))
+            if user_vector is None:
+                continue
+            scores = model.scores(item_factors, user_vector)
+            top_k_indices(scores, 10)
+            test_entries = entries[held_out[entries]]
+            predicted = model.mean + item_factors[item_ids[test_entries] - 1] @ user_vector
+            errors.extend(predicted - ratings[test_entries])
+        query_time = (time.perf_counter() - start) / min(n_queries, user_ids.max() + 1)
+
+        rmse = np.sqrt(np.mean(np.square(errors))) if errors else float('nan')
+        mean_rmse = np.sqrt(np.mean(np.square(ratings[held_out] - model.mean)))
+        print(f"{n_ratings:>9} {train_time:>9.2f} {query_time * 1000:>9.3f} {rmse:>6.3f} {mean_rmse:>10.3f}")
+
+
+def bench_similar(sizes, k=10, n_queries=200):
+    print(f"{'items':>8} {'build s':>8} {'extend s':>9} {'brute ms':>9} {'exact ms':>9} {'lsh ms':>7} "
+          f"{'candidates':>11} {'lsh recall':>11}")
+    for n_items in sizes:
+        items = synthetic_movies(n_items)
+        tag_index = TagIndex.build(ItemCatalog.from_items(items))
+
+        start = time.perf_counter()
+        lsh = TagLSH.build(tag_index)
+        build_time = time.perf_counter() - start
+
+        # Insert the last 10% onto an index of the first 90%; the refitted IDF changes every vector
+        base_index = TagIndex.build(ItemCatalog.from_items(items[:n_items * 9 // 10]))
+        base = TagLSH.build(base_index)
+        start = time.perf_counter()
+        base.extend(tag_index, base_index)
+        extend_time = time.perf_counter() - start
+
+        matrix = tag_index.matrix
+        queries = np.random.default_rng(0).choice(n_items, size=min(n_queries, n_items), replace=False)
+        start = time.perf_counter()
+        for row in queries:
+            top_k_indices((matrix @ matrix[row].T).toarray().ravel(), k + 1)
+        brute_time = (time.perf_counter() - start) / len(queries)
+
+        # What CatalogStore.similar() runs below SIMILAR_LSH_MIN_ITEMS: recall is 1 by construction
+        postings = matrix.T.tocsr()
+        start = time.perf_counter()
+        for row in queries:
+            top_k_indices((matrix[row] @ postings).toarray().ravel(), k + 1)
+        exact_time = (time.perf_counter() - start) / len(queries)
+
+        n_candidates = 0
+        start = time.perf_counter()
+        for row in queries:
+            rows = tag_index.rows_for(lsh.candidates(matrix[row]))
+            n_candidates += len(rows)
+            top_k_indices((matrix[rows] @ matrix[row].T).toarray().ravel(), k + 1)
+        lsh_time = (time.perf_counter() - start) / len(queries)
+
+        recall = recall_at_k(lsh, tag_index, k, n_queries)
+        print(f"{n_items:>8} {build_time:>8.2f} {extend_time:>9.2f} {brute_time * 1000:>9.3f} "
+              f"{exact_time * 1000:>9.3f} {lsh_time * 1000:>7.3f} {n_candidates / len(queries):>11.0f} "
+              f"{recall:>11.3f}")
+
+
+def bench_profiles(history_sizes, n_items=50000, batch=10):
+    recommender = MovieRecommender(synthetic_movies(n_items))
+    rng = np.random.default_rng(3)
+    print(f"{'history':>8} {'rebuild ms':>11} {'batch ms':>9} {'score ms':>9}")
+    for n_history in history_sizes:
+        rated = rng.choice(n_items, size=n_history + batch, replace=False) + 1
+        ratings = rng.uniform(1, 10, size=len(rated))
+
+        # Recomputing the profile from every rating vs folding in one batch
+        start = time.perf_counter()
+        terms, _ = rating_deltas(recommender.catalog, [(i, None, r) for i, r in zip(rated.tolist(), ratings)])
+        rebuild_time = time.perf_counter() - start
+        start = time.perf_counter()
+        rating_deltas(recommender.catalog, [(i, None, r) for i, r in zip(rated[-batch:].tolist(), ratings[-batch:])])
+        batch_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        recommender.profile_scores(terms)
+        score_time = time.perf_counter() - start
+        print(f"{n_history:>8} {rebuild_time * 1000:>11.2f} {batch_time * 1000:>9.3f} {score_time * 1000:>9.3f}")
+
+
+def bench_batch(user_counts, n_items, history_size=20):
+    recommender = MovieRecommender(synthetic_movies(n_items))
+    preferences = synthetic_preferences(8)
+    rng = np.random.default_rng(5)
+    print(f"{'users':>6} {'per-user s':>11} {'batch s':>8} {'speedup':>8} {'same top 10':>12}")
+    for n_users in user_counts:
+        requests = [
+            (preferences[i % len(preferences)], set((rng.choice(n_items, size=history_size) + 1).tolist()), None, None)
+            for i in range(n_users)
+        ]
+
+        start = time.perf_counter()
+        single = [recommender.rank(*request) for request in requests]
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = recommender.rank_many(requests)
+        batch_time = time.perf_counter() - start
+
+        same = all(
+            np.array_equal(a.rows[top_k_indices(a.scores, 10)], b.rows[top_k_indices(b.scores, 10)])
+            for a, b in zip(single, batch)
+        )
+        print(f"{n_users:>6} {single_time:>11.2f} {batch_time:>8.2f} {single_time / batch_time:>7.1f}x {str(same):>12}")
+
+
+def bench_load(url, concurrency, n_requests, n_users=100):
+    """
+    p50/p99 latency of a mixed recommend/rate workload against a running
+    server: run it once against the Procfile (sync gunicorn) setup and once
+    against `gunicorn -k uvicorn.workers.UvicornWorker asgi:app`.
+    """
+    import json
+    import urllib.error
+    import urllib.request
+
+    preferences = synthetic_preferences(8)
+
+    def call(i):
+        # One generator per request: Generator objects are not thread-safe
+        rng = np.random.default_rng(i)
+        user_id = int(rng.integers(1, n_users + 1))
+        if i % 5 == 4:
+            path, body = '/ratings/rate/movies', {
+                'user_id': user_id,
+                'ratings': [{'movie_id': int(rng.integers(1, 1000)), 'rating': float(rng.integers(1, 11))}],
+            }
+        else:
+            path, body = '/recommend/movies', {'user_id': user_id, 'preferences': preferences[i % len(preferences)]}
+        request = urllib.request.Request(
+            url.rstrip('/') + path, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'}
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return path, status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{n_requests} requests, {concurrency} concurrent, {n_requests / elapsed:.0f} req/s")
+    print(f"{'path':>22} {'count':>6} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for path in sorted({path for path, _, _ in results}):
+        latencies = np.array([latency for p, _, latency in results if p == path])
+        errors = sum(1 for p, status, _ in results if p == path and status >= 500)
+        print(f"{path:>22} {len(latencies):>6} {errors:>7} {np.percentile(latencies, 50) * 1000:>8.1f} "
+              f"{np.percentile(latencies, 99) * 1000:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    cb_parser = subparsers.add_parser('cb', help='content-based scoring: per-item loop vs batch')
+    cb_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 50000])
+
+    fuzzy_parser = subparsers.add_parser('fuzzy', help='fuzzy inference: skfuzzy per item vs batch engine')
+    fuzzy_parser.add_argument('--items', type=int, default=5000)
+
+    surface_parser = subparsers.add_parser('surface', help='fuzzy lookup surface: accuracy and speed per grid size')
+    surface_parser.add_argument('--resolutions', type=int, nargs='+', default=[11, 21, 41, 81])
+    surface_parser.add_argument('--items', type=int, default=5000)
+
+    stress_parser = subparsers.add_parser('stress', help='concurrent recommend() calls on one shared instance')
+    stress_parser.add_argument('--items', type=int, default=2000)
+    stress_parser.add_argument('--threads', type=int, default=8)
+    stress_parser.add_argument('--rounds', type=int, default=20)
+
+    prefs_parser = subparsers.add_parser('prefs', help='preference scoring: per-item loop vs batch')
+    prefs_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 50000])
+
+    ratings_parser = subparsers.add_parser('ratings', help='batch rating writes: per-entry loop vs bulk upsert')
+    ratings_parser.add_argument('--batches', type=int, nargs='+', default=[10, 100, 1000])
+
+    keywords_parser = subparsers.add_parser('keywords', help='TF-IDF keywords: dense per-row loop vs CSR top-n')
+    keywords_parser.add_argument('--documents', type=int, default=20000)
+    keywords_parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='worker catalog load: item dicts vs mapped snapshot')
+    snapshot_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+
+    cf_parser = subparsers.add_parser('cf', help='collaborative factors: ALS training time and query latency')
+    cf_parser.add_argument('--ratings', type=int, nargs='+', default=[10000, 100000, 1000000])
+
+    similar_parser = subparsers.add_parser('similar', help='more like this: brute-force cosine vs LSH candidates')
+    similar_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+
+    profiles_parser = subparsers.add_parser('profiles', help='user profiles: full rebuild vs batch fold-in, scoring')
+    profiles_parser.add_argument('--history', type=int, nargs='+', default=[100, 1000, 10000])
+
+    batch_parser = subparsers.add_parser('batch', help='many users: per-user rank() vs one rank_many() pass')
+    batch_parser.add_argument('--users', type=int, nargs='+', default=[100, 1000])
+    batch_parser.add_argument('--items', type=int, default=20000)
+
+    load_parser = subparsers.add_parser('load', help='p50/p99 of recommend and rate requests against a running server')
+    load_parser.add_argument('--url', default='http://localhost:8000')
+    load_parser.add_argument('--concurrency', type=int, default=32)
+    load_parser.add_argument('--requests', type=int, default=2000)
+
+    args = parser.parse_args()
+    if args.benchmark == 'cb':
+        bench_cb(args.sizes)
+    elif args.benchmark == 'fuzzy':
+        if not bench_fuzzy(args.items):
+            sys.exit(1)
+    elif args.benchmark == 'surface':
+        bench_surface(args.resolutions, args.items)
+    elif args.benchmark == 'prefs':
+        bench_prefs(args.sizes)
+    elif args.benchmark == 'keywords':
+        bench_keywords(args.documents, args.workers)
+    elif args.benchmark == 'load':
+        bench_load(args.url, args.concurrency, args.requests)
+    elif args.benchmark == 'batch':
+        bench_batch(args.users, args.items)
+    elif args.benchmark == 'profiles':
+        bench_profiles(args.history)
+    elif args.benchmark == 'similar':
+        bench_similar(args.sizes)
+    elif args.benchmark == 'cf':
+        bench_cf(args.ratings)
+    elif args.benchmark == 'snapshot':
+        bench_snapshot(args.sizes)
+    elif args.benchmark == 'ratings':
+        bench_ratings(args.batches)
+    elif args.benchmark == 'stress':
+        if not bench_stress(args.items, args.threads, args.rounds):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
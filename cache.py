@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Optional: only needed when RESULT_CACHE_URL points at Redis
+    redis = None
+
+RESULT_CACHE_URL = os.getenv('RESULT_CACHE_URL')
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '300'))
+
+
+def preferences_key(preferences):
+    """
+    Canonical string for a preferences dict. Case, surrounding whitespace
+    and list order don't change recommendations, so they don't change the key.
+    """
+    normalized = dict(preferences)
+    if isinstance(normalized.get('genre'), str):
+        normalized['genre'] = normalized['genre'].lower()
+    for name in ('tags', 'actors'):
+        if isinstance(normalized.get(name), list) and all(isinstance(v, str) for v in normalized[name]):
+            normalized[name] = sorted(value.strip().lower() for value in normalized[name])
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class ResultCache:
+    """
+    Recommendation results keyed on (catalog, user, preferences, version),
+    with LRU and TTL eviction. Callers put the user's rating revision in
+    the version, so a rating taken by any worker makes every worker miss;
+    invalidate_user() also frees the entries in this one straight away.
+    """
+
+    # Calls go over the network, so async callers keep them off the event loop
+    remote = False
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        user_keys = self._user_keys.get(key[:2])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[:2]]
+
+    def get(self, catalog_name, user_id, preferences, version):
+        key = (catalog_name, str(user_id), preferences_key(preferences), version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, catalog_name, user_id, preferences, version, value):
+        key = (catalog_name, str(user_id), preferences_key(preferences), version)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, catalog_name, user_id):
+        with self._lock:
+            for key in list(self._user_keys.get((catalog_name, str(user_id)), ())):
+                self._drop(key)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'local',
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+            }
+
+
+class RedisResultCache(ResultCache):
+    """
+    ResultCache on a Redis-compatible server, shared by every worker.
+
+    Each (catalog, user) pair has a generation counter that is part of the
+    key; invalidating a user bumps it, and the orphaned entries expire by TTL.
+    """
+
+    remote = True
+
+    def __init__(self, url, ttl=RESULT_CACHE_TTL, prefix='rexys:results'):
+        super().__init__(maxsize=None, ttl=ttl)
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _generation_key(self, catalog_name, user_id):
+        return f'{self.prefix}:gen:{catalog_name}:{user_id}'
+
+    def _key(self, catalog_name, user_id, preferences, version):
+        generation = int(self.client.get(self._generation_key(catalog_name, user_id)) or 0)
+        digest = hashlib.sha1(f'{preferences_key(preferences)}|{version}'.encode()).hexdigest()
+        return f'{self.prefix}:{catalog_name}:{user_id}:{generation}:{digest}'
+
+    def get(self, catalog_name, user_id, preferences, version):
+        payload = self.client.get(self._key(catalog_name, user_id, preferences, version))
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(payload)
+
+    def set(self, catalog_name, user_id, preferences, version, value):
+        key = self._key(catalog_name, user_id, preferences, version)
+        self.client.set(key, pickle.dumps(value), ex=self.ttl)
+
+    def invalidate_user(self, catalog_name, user_id):
+        self.client.incr(self._generation_key(catalog_name, user_id))
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+def create_result_cache(url=RESULT_CACHE_URL):
+    if url:
+        if redis is None:
+            raise RuntimeError("RESULT_CACHE_URL is set but the redis package is not installed.")
+        return RedisResultCache(url)
+    return ResultCache()
+
+
+result_cache = create_result_cache()
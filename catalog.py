@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from catalog_terms import candidate_ids
+from collaborative import RatingFactors
+from item_catalog import ItemCatalog, StratifiedSampler
+from metrics import timed_query
+from models import db, Movie, Game, UserMovieRating, UserGameRating
+from recommender import MovieRecommender, GameRecommender, top_k_indices
+from similarity_index import SIMILAR_LSH_MIN_ITEMS, TagLSH
+from snapshot import catalog_version, load_snapshot
+from tag_index import load_tag_index
+
+# How often a worker checks whether its in-memory catalog is out of date
+CATALOG_CHECK_SECONDS = int(os.getenv('CATALOG_CHECK_SECONDS', '60'))
+
+
+class CatalogStore:
+    """
+    One warm recommender over a whole catalog table, loaded once per worker.
+
+    Every CATALOG_CHECK_SECONDS the store runs a cheap version query and
+    rebuilds the recommender only when the table has changed. When the
+    ingest-time snapshot matches that version, the catalog and tag index are
+    memory-mapped from it instead of being read from the table. Recommenders
+    are read-only, so requests keep using the old instance while a new one
+    is swapped in. Collaborative item factors from `flask train-cf` are
+    reloaded on the same schedule when the saved file changes.
+    """
+
+    def __init__(self, name, model, recommender_class, rating_model, rating_item_key,
+                 check_seconds=CATALOG_CHECK_SECONDS):
+        self.name = name
+        self.model = model
+        self.recommender_class = recommender_class
+        self.rating_model = rating_model
+        self.rating_item_column = getattr(rating_model, rating_item_key)
+        self.check_seconds = check_seconds
+
+        self._lock = threading.Lock()
+        self._recommender = None
+        self._sampler = None
+        self._similarity = None
+        self._version = None
+        self._factors_stamp = None
+        self._collaborative = None
+        self._checked_at = 0.
+
+    @property
+    def version(self):
+        """Version of the catalog and collaborative factors the current recommender uses."""
+        return self._version, self._factors_stamp
+
+    def current_version(self):
+        return catalog_version(self.name, self.model)
+
+    def rated_ids(self, user_id):
+        """Ids the user has rated, from one query on the (user_id, item_id) primary key."""
+        rows = db.session.query(self.rating_item_column).filter(self.rating_model.user_id == user_id)
+        return {item_id for (item_id,) in rows}
+
+    def user_ratings(self, user_id):
+        """{item id: rating} for the user, from one query on the (user_id, item_id) primary key."""
+        rows = db.session.query(self.rating_item_column, self.rating_model.rating).filter(
+            self.rating_model.user_id == user_id
+        )
+        return dict(rows.all())
+
+    def ratings_for_users(self, user_ids):
+        """{user id: {item id: rating}} for many users in one query; users without ratings are left out."""
+        ratings = {}
+        if not user_ids:
+            return ratings
+        rows = db.session.query(self.rating_model.user_id, self.rating_item_column, self.rating_model.rating).filter(
+            self.rating_model.user_id.in_(list(user_ids))
+        )
+        for user_id, item_id, rating in rows:
+            ratings.setdefault(user_id, {})[item_id] = rating
+        return ratings
+
+    def collaborative_scores(self, ratings, catalog):
+        """
+        Predicted 0..1 scores for every row of `catalog` from the user's
+        {item id: rating}, or None without trained factors or usable ratings.
+        """
+        collaborative = self._collaborative
+        # The factors may still be aligned to the catalog being replaced
+        if collaborative is None or not ratings or collaborative[2] is not catalog.ids or not len(catalog):
+            return None
+        factors, item_factors, _ = collaborative
+        rows = catalog.rows_for(np.fromiter(ratings, dtype=np.int64, count=len(ratings)))
+        values = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+        known = rows >= 0
+        user_vector = factors.fold_in(item_factors, (rows[known], values[known]))
+        if user_vector is None:
+            return None
+        return factors.scores(item_factors, user_vector)
+
+    def candidate_ids(self, filters):
+        """Ids matching hard genre/tag/rating filters, from the database indexes."""
+        return candidate_ids(self.model, filters)
+
+    def _load_snapshot(self, version):
+        """Catalog and tag index from the snapshot, or None if it is missing or stale."""
+        try:
+            snapshot = load_snapshot(self.name)
+        except (OSError, ValueError, KeyError) as e:  # Replaced or removed while reading
+            print(f"Could not read {self.name} catalog snapshot: {e}")
+            return None
+        if snapshot is None or snapshot[0] != tuple(version):
+            return None
+        return snapshot[1:]
+
+    def _load(self, version):
+        snapshot = self._load_snapshot(version)
+        if snapshot is not None:
+            catalog, tag_index = snapshot
+        else:
+            catalog = ItemCatalog.from_items(row.to_dict() for row in self.model.query.yield_per(1000))
+            tag_index = load_tag_index(self.name, catalog)
+        recommender = self.recommender_class(catalog, tag_index)
+        self._similarity = self._similarity_index(recommender)
+        self._recommender = recommender
+        self._sampler = StratifiedSampler(catalog)
+        self._version = version
+        source = 'snapshot' if snapshot is not None else 'database'
+        print(f"Loaded {self.name} catalog from {source} ({len(catalog)} items, version {version}).")
+
+    def _similarity_index(self, recommender):
+        """
+        (recommender, term-major tag matrix, None) for exact search, or
+        (recommender, None, TagLSH) once the catalog reaches
+        SIMILAR_LSH_MIN_ITEMS. Kept as one tuple so similar() never mixes
+        an index with another load's recommender.
+        """
+        tag_index = recommender.tag_index
+        if len(recommender.catalog) < SIMILAR_LSH_MIN_ITEMS:
+            return recommender, tag_index.matrix.T.tocsr(), None
+
+        # Hash only new and changed items when the tag vocabulary allows it
+        if self._similarity is not None:
+            previous_recommender, _, previous = self._similarity
+            if previous is not None and previous.can_extend(tag_index):
+                return recommender, None, previous.extend(tag_index, previous_recommender.tag_index)
+        return recommender, None, TagLSH.build(tag_index)
+
+    def _load_factors(self, stamp):
+        factors = RatingFactors.load(self.name)
+        if factors is None:
+            self._collaborative = None
+        else:
+            catalog_ids = self._recommender.catalog.ids
+            self._collaborative = (factors, factors.align(catalog_ids), catalog_ids)
+            print(f"Loaded {self.name} collaborative factors ({len(factors.item_ids)} items).")
+        self._factors_stamp = stamp
+
+    def fresh_recommender(self):
+        """The recommender if its version was checked within check_seconds, else None. Never queries."""
+        if self._recommender is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self._recommender
+        return None
+
+    def recommender(self):
+        now = time.monotonic()
+        if self._recommender is not None and now - self._checked_at < self.check_seconds:
+            return self._recommender
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._recommender is None or now - self._checked_at >= self.check_seconds:
+                with timed_query('catalog_version'):
+                    version = self.current_version()
+                reload = self._recommender is None or version != self._version
+                if reload:
+                    self._load(version)
+                # Factors are aligned to catalog rows, so a new catalog needs them realigned
+                stamp = RatingFactors.stamp(self.name)
+                if reload or stamp != self._factors_stamp:
+                    self._load_factors(stamp)
+                self._checked_at = time.monotonic()
+            return self._recommender
+
+    def similar(self, item_id, k=10):
+        """
+        (item, cosine score) pairs for the k items whose tag vectors are
+        closest to `item_id`'s, best first, or None if the item is unknown.
+        Catalogs below SIMILAR_LSH_MIN_ITEMS are searched exactly; above it
+        only the LSH candidates are scored.
+        """
+        self.recommender()
+        recommender, postings, lsh = self._similarity
+        catalog = recommender.catalog
+        row = catalog.rows_for([item_id])[0]
+        if row < 0:
+            return None
+
+        matrix = recommender.tag_index.matrix
+        vector = matrix[recommender.tag_rows[row]]
+        if lsh is None:
+            # Exact: the product only reads the posting lists of the item's own terms
+            scores = (vector @ postings).toarray().ravel()[recommender.tag_rows]
+            scores[row] = 0
+            positions = top_k_indices(scores, k)
+            positions = positions[scores[positions] > 0]
+            return [(catalog.item(p), float(scores[p])) for p in positions]
+
+        rows = catalog.rows_for(lsh.candidates(vector))
+        rows = rows[(rows >= 0) & (rows != row)]
+        # Tag rows are L2-normalized, so the dot product is the cosine similarity
+        scores = (matrix[recommender.tag_rows[rows]] @ vector.T).toarray().ravel()
+        positions = top_k_indices(scores, k)
+        positions = positions[scores[positions] > 0]
+        return [(catalog.item(rows[p]), float(scores[p])) for p in positions]
+
+    def sample(self, n, stratify=True):
+        """Random items for onboarding, drawn from the in-memory catalog instead of the table."""
+        self.recommender()
+        return self._sampler.sample(n, stratify=stratify)
+
+
+movie_catalog = CatalogStore('movies', Movie, MovieRecommender, UserMovieRating, 'movie_id')
+game_catalog = CatalogStore('games', Game, GameRecommender, UserGameRating, 'game_id')
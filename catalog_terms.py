@@ -0,0 +1,121 @@
+import re
+
+from sqlalchemy import select
+
+from models import (
+    db, Movie, Game, Genre, Tag, Actor,
+    movie_genres, movie_tags, movie_actors, game_genres, game_tags,
+)
+
+# Steam genres are ';'-separated, everything else uses commas
+TERM_SEPARATORS = re.compile(r'[,;]')
+TERM_SYNC_CHUNK_SIZE = 1000
+
+# Item model -> {string column: (term model, link table)}
+TERM_LINKS = {
+    Movie: {'genre': (Genre, movie_genres), 'tags': (Tag, movie_tags), 'actors': (Actor, movie_actors)},
+    Game: {'genre': (Genre, game_genres), 'tags': (Tag, game_tags)},
+}
+
+
+def split_terms(value):
+    """Distinct lowercased, stripped terms of a comma-separated column value."""
+    if not value:
+        return []
+    terms = (term.strip().lower()[:255] for term in TERM_SEPARATORS.split(value))
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def _term_ids(term_model, names):
+    """Ids for `names`, inserting the ones the term table doesn't have yet."""
+    term_ids = {}
+    names = list(names)
+    for start in range(0, len(names), TERM_SYNC_CHUNK_SIZE):
+        chunk = names[start:start + TERM_SYNC_CHUNK_SIZE]
+        term_ids.update(db.session.query(term_model.name, term_model.id).filter(term_model.name.in_(chunk)))
+
+    missing = [name for name in names if name not in term_ids]
+    if missing:
+        db.session.bulk_insert_mappings(term_model, [{'name': name} for name in missing])
+        for start in range(0, len(missing), TERM_SYNC_CHUNK_SIZE):
+            chunk = missing[start:start + TERM_SYNC_CHUNK_SIZE]
+            term_ids.update(db.session.query(term_model.name, term_model.id).filter(term_model.name.in_(chunk)))
+    return term_ids
+
+
+def sync_catalog_terms(model, item_ids=None):
+    """
+    Rebuild the genre/tag/actor link rows of `model` from its string columns,
+    for every item or only `item_ids`. Does not commit.
+    """
+    for column_name, (term_model, link) in TERM_LINKS[model].items():
+        item_column, term_column = link.c
+        query = db.session.query(model.id, getattr(model, column_name))
+        if item_ids is None:
+            db.session.execute(link.delete())
+            rows = query.yield_per(TERM_SYNC_CHUNK_SIZE)
+        else:
+            item_ids = list(item_ids)
+            rows = []
+            for start in range(0, len(item_ids), TERM_SYNC_CHUNK_SIZE):
+                chunk = item_ids[start:start + TERM_SYNC_CHUNK_SIZE]
+                db.session.execute(link.delete().where(item_column.in_(chunk)))
+                rows.extend(query.filter(model.id.in_(chunk)))
+
+        item_terms = [(item_id, split_terms(value)) for item_id, value in rows]
+        term_ids = _term_ids(term_model, {term for _, terms in item_terms for term in terms})
+
+        links = [
+            {item_column.name: item_id, term_column.name: term_ids[term]}
+            for item_id, terms in item_terms for term in terms
+        ]
+        for start in range(0, len(links), TERM_SYNC_CHUNK_SIZE):
+            db.session.execute(link.insert(), links[start:start + TERM_SYNC_CHUNK_SIZE])
+
+        print(f"Synced {len(links)} {model.__tablename__} {column_name} links ({len(term_ids)} terms).")
+
+
+def sync_all_catalog_terms():
+    for model in TERM_LINKS:
+        sync_catalog_terms(model)
+    db.session.commit()
+
+
+def _items_with_terms(model, column_name, names):
+    term_model, link = TERM_LINKS[model][column_name]
+    item_column, term_column = link.c
+    return (
+        select(item_column)
+        .join(term_model, term_model.id == term_column)
+        .where(term_model.name.in_(names))
+    )
+
+
+def candidate_ids(model, filters):
+    """
+    Ids of `model` items matching every filter, answered from the term link
+    and rating indexes:
+
+        {"genre": "Drama", "tags": ["war", "love"], "rating": {"min": 7, "max": 9}}
+
+    An item matches `tags` if it has any of them.
+    """
+    query = db.session.query(model.id)
+
+    genre = filters.get('genre')
+    if isinstance(genre, str) and genre.strip():
+        query = query.filter(model.id.in_(_items_with_terms(model, 'genre', [genre.strip().lower()])))
+
+    tags = filters.get('tags')
+    if isinstance(tags, list) and tags:
+        names = [tag.strip().lower() for tag in tags if isinstance(tag, str) and tag.strip()]
+        query = query.filter(model.id.in_(_items_with_terms(model, 'tags', names)))
+
+    rating = filters.get('rating')
+    if isinstance(rating, dict):
+        if rating.get('min') is not None:
+            query = query.filter(model.rating >= rating['min'])
+        if rating.get('max') is not None:
+            query = query.filter(model.rating <= rating['max'])
+
+    return {item_id for (item_id,) in query}
@@ -0,0 +1,177 @@
+import os
+import time
+
+import click
+import numpy as np
+import scipy.sparse as sp
+from flask.cli import with_appcontext
+
+from tag_index import INDEX_DIR
+
+CF_FACTORS = int(os.getenv('CF_FACTORS', '32'))
+CF_REGULARIZATION = float(os.getenv('CF_REGULARIZATION', '0.1'))
+CF_ITERATIONS = int(os.getenv('CF_ITERATIONS', '10'))
+# Share of the content score replaced by the collaborative prediction
+CF_WEIGHT = float(os.getenv('CF_WEIGHT', '0.3'))
+# Ratings whose outer products are summed at once while solving: the temporary
+# holds ALS_CHUNK_SIZE x CF_FACTORS^2 floats, about 16 MB at 2000 and 32 factors
+ALS_CHUNK_SIZE = int(os.getenv('ALS_CHUNK_SIZE', '2000'))
+
+
+def _solve_rows(matrix, fixed, regularization, chunk_size=ALS_CHUNK_SIZE):
+    """
+    Least-squares factors for every row of CSR `matrix` against the fixed
+    factors of its columns, with weighted-lambda regularization: row u
+    solves (V_u^T V_u + lambda n_u I) x = V_u^T r_u. Rows are solved in
+    batches of about chunk_size ratings, so the cost is a few vectorized
+    passes over the ratings; a row longer than that on its own (a popular
+    item) gets its Gram matrix from one matrix product instead.
+    """
+    n_factors = fixed.shape[1]
+    factors = np.zeros((matrix.shape[0], n_factors))
+    counts = np.diff(matrix.indptr)
+    rows = np.flatnonzero(counts)
+    starts, ends = matrix.indptr[rows], matrix.indptr[rows + 1]
+    identity = np.eye(n_factors)
+
+    position = 0
+    while position < len(rows):
+        stop = max(position + 1, int(np.searchsorted(ends, starts[position] + chunk_size, side='right')))
+        low, high = starts[position], ends[stop - 1]
+        vectors = fixed[matrix.indices[low:high]]
+        offsets = starts[position:stop] - low
+
+        if stop == position + 1:
+            gram = (vectors.T @ vectors)[None]
+        else:
+            gram = np.add.reduceat(vectors[:, :, None] * vectors[:, None, :], offsets, axis=0)
+        gram += regularization * counts[rows[position:stop], None, None] * identity
+        rhs = np.add.reduceat(vectors * matrix.data[low:high, None], offsets, axis=0)
+        factors[rows[position:stop]] = np.linalg.solve(gram, rhs[..., None])[..., 0]
+        position = stop
+    return factors
+
+
+class RatingFactors:
+    """
+    Item factors of the user x item rating matrix, trained offline with
+    alternating least squares on mean-centred explicit ratings.
+
+    Only item factors are kept. A user's vector is folded in at request time
+    from their current ratings, with one small solve, so ratings submitted
+    after training count immediately.
+    """
+
+    def __init__(self, item_ids, item_factors, mean, low, high, regularization=CF_REGULARIZATION):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.item_factors = np.asarray(item_factors, dtype=np.float64)
+        self.mean = float(mean)
+        self.low = float(low)
+        self.high = float(high)
+        self.regularization = float(regularization)
+
+    @classmethod
+    def train(cls, user_ids, item_ids, ratings, factors=CF_FACTORS, regularization=CF_REGULARIZATION,
+              iterations=CF_ITERATIONS, seed=42):
+        """Fit on parallel arrays of (user id, item id, rating)."""
+        ratings = np.asarray(ratings, dtype=np.float64)
+        users, user_rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        items, item_rows = np.unique(np.asarray(item_ids, dtype=np.int64), return_inverse=True)
+        if not len(ratings):
+            return cls(items, np.zeros((0, factors)), 0, 0, 1, regularization)
+
+        mean = ratings.mean()
+        by_user = sp.csr_matrix((ratings - mean, (user_rows, item_rows)), shape=(len(users), len(items)))
+        by_item = by_user.T.tocsr()
+
+        rng = np.random.default_rng(seed)
+        item_factors = rng.normal(scale=0.1, size=(len(items), factors))
+        for _ in range(iterations):
+            user_factors = _solve_rows(by_user, item_factors, regularization)
+            item_factors = _solve_rows(by_item, user_factors, regularization)
+        return cls(items, item_factors, mean, ratings.min(), ratings.max(), regularization)
+
+    def align(self, catalog_ids):
+        """Item factors in the order of `catalog_ids`; items the model never saw get zeros."""
+        aligned = np.zeros((len(catalog_ids), self.item_factors.shape[1]))
+        if len(self.item_ids):
+            positions = np.minimum(np.searchsorted(self.item_ids, catalog_ids), len(self.item_ids) - 1)
+            known = self.item_ids[positions] == catalog_ids
+            aligned[known] = self.item_factors[positions[known]]
+        aligned.flags.writeable = False
+        return aligned
+
+    def fold_in(self, item_factors, ratings):
+        """
+        A user's vector from their ratings, given as (rows of `item_factors`,
+        rating values). Returns None when the user has no usable ratings.
+        """
+        rows, values = ratings
+        vectors = item_factors[rows]
+        if not len(rows) or not vectors.any():
+            return None
+        gram = vectors.T @ vectors + self.regularization * len(rows) * np.eye(vectors.shape[1])
+        return np.linalg.solve(gram, vectors.T @ (np.asarray(values, dtype=np.float64) - self.mean))
+
+    def scores(self, item_factors, user_vector):
+        """Predicted ratings for every row of `item_factors`, scaled to 0..1 by the training range."""
+        predicted = self.mean + item_factors @ user_vector
+        return np.clip((predicted - self.low) / max(self.high - self.low, 1e-9), 0, 1)
+
+    def save(self, name, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{name}_cf.npz')
+        with open(f'{path}.tmp', 'wb') as f:
+            np.savez(f, item_ids=self.item_ids, item_factors=self.item_factors,
+                     params=np.array([self.mean, self.low, self.high, self.regularization]))
+        os.replace(f'{path}.tmp', path)
+
+    @staticmethod
+    def stamp(name, directory=INDEX_DIR):
+        """Modification time of the saved factors, or None; changes whenever they are retrained."""
+        try:
+            return os.stat(os.path.join(directory, f'{name}_cf.npz')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, name, directory=INDEX_DIR):
+        path = os.path.join(directory, f'{name}_cf.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            return cls(saved['item_ids'], saved['item_factors'], *saved['params'])
+
+
+def train_rating_factors(rating_model, item_key, **options):
+    """Train on every row of a UserMovieRating/UserGameRating table."""
+    from models import db
+
+    rows = db.session.query(
+        rating_model.user_id, getattr(rating_model, item_key), rating_model.rating
+    ).yield_per(10000)
+    user_ids, item_ids, ratings = [], [], []
+    for user_id, item_id, rating in rows:
+        user_ids.append(user_id)
+        item_ids.append(item_id)
+        ratings.append(rating)
+    return RatingFactors.train(user_ids, item_ids, ratings, **options), len(ratings)
+
+
+@click.command('train-cf')
+@click.option('--factors', default=CF_FACTORS, show_default=True, help='Latent factors per item.')
+@click.option('--iterations', default=CF_ITERATIONS, show_default=True, help='ALS sweeps.')
+@click.option('--regularization', default=CF_REGULARIZATION, show_default=True)
+@with_appcontext
+def train_cf_command(factors, iterations, regularization):
+    """Factorize the movie and game rating tables for collaborative scoring."""
+    from models import UserMovieRating, UserGameRating
+
+    for name, rating_model, item_key in (('movies', UserMovieRating, 'movie_id'),
+                                         ('games', UserGameRating, 'game_id')):
+        start = time.perf_counter()
+        model, n_ratings = train_rating_factors(rating_model, item_key, factors=factors,
+                                                iterations=iterations, regularization=regularization)
+        model.save(name)
+        print(f"Trained {name} factors on {n_ratings} ratings "
+              f"({len(model.item_ids)} items) in {time.perf_counter() - start:.1f}s.")
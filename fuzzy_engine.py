@@ -0,0 +1,240 @@
+import hashlib
+import os
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+from skfuzzy import control as ctrl
+from skfuzzy.control.term import Term, TermAggregate
+
+# Largest accepted difference from skfuzzy's own output
+FUZZY_TOLERANCE = 1e-9
+
+# Interpolated centroid areas at or below this count as "no rule fired"
+SURFACE_MIN_AREA = 1e-9
+
+
+class BatchFuzzyEngine:
+    """
+    Vectorized Mamdani inference for a skfuzzy ControlSystem.
+
+    Reproduces ControlSystemSimulation.compute() (input clipping, rule
+    aggregation, activation, accumulation and the upsampled centroid) for
+    whole arrays of inputs at once. Candidates for which no rule fires get
+    NaN, where skfuzzy would fail to produce an output.
+    """
+
+    def __init__(self, control_system):
+        self.antecedents = {antecedent.label: antecedent for antecedent in control_system.antecedents}
+        self.input_labels = list(self.antecedents)
+        self.rules = list(control_system.rules)
+
+        consequents = list(control_system.consequents)
+        if len(consequents) != 1:
+            raise ValueError("BatchFuzzyEngine supports a single consequent.")
+        self.consequent = consequents[0]
+        self.output_label = self.consequent.label
+        self.universe = np.asarray(self.consequent.universe, dtype=float)
+        self.accumulate = self.consequent.accumulation_method
+
+        # Only terms some rule writes to take part in defuzzification
+        self.output_terms = []
+        for rule in self.rules:
+            for weighted_term in rule.consequent:
+                if weighted_term.term not in self.output_terms:
+                    self.output_terms.append(weighted_term.term)
+
+    def _membership(self, term, inputs, rule):
+        if isinstance(term, Term):
+            antecedent = term.parent
+            return np.interp(inputs[antecedent.label], antecedent.universe, term.mf)
+        if isinstance(term, TermAggregate):
+            if term.kind == 'not':
+                return 1. - self._membership(term.term1, inputs, rule)
+            term1 = self._membership(term.term1, inputs, rule)
+            term2 = self._membership(term.term2, inputs, rule)
+            if term.kind == 'and':
+                return rule.and_func(term1, term2)
+            if term.kind == 'or':
+                return rule.or_func(term1, term2)
+        raise NotImplementedError(f"Unsupported antecedent {term!r}")
+
+    def cuts(self, **inputs):
+        """Activation level of every output term, shape (len(output_terms), n)."""
+        clipped = {}
+        for label, antecedent in self.antecedents.items():
+            values = np.atleast_1d(np.asarray(inputs[label], dtype=float))
+            clipped[label] = np.clip(values, antecedent.universe.min(), antecedent.universe.max())
+
+        n = len(next(iter(clipped.values())))
+        cuts = [None] * len(self.output_terms)
+        for rule in self.rules:
+            firing = self._membership(rule.antecedent, clipped, rule)
+            for weighted_term in rule.consequent:
+                position = self.output_terms.index(weighted_term.term)
+                activation = firing * weighted_term.weight
+                cuts[position] = activation if cuts[position] is None else self.accumulate(activation, cuts[position])
+
+        return np.vstack([np.broadcast_to(cut, (n,)) for cut in cuts])
+
+    def signature(self):
+        """Digest of the universes, membership functions and rules, for cache invalidation."""
+        digest = hashlib.sha1()
+        for antecedent in self.antecedents.values():
+            digest.update(antecedent.label.encode())
+            digest.update(np.ascontiguousarray(antecedent.universe, dtype=float).tobytes())
+            for label, term in antecedent.terms.items():
+                digest.update(label.encode())
+                digest.update(np.ascontiguousarray(term.mf, dtype=float).tobytes())
+        for term in self.output_terms:
+            digest.update(term.label.encode())
+            digest.update(np.ascontiguousarray(term.mf, dtype=float).tobytes())
+        for rule in self.rules:
+            digest.update(repr(rule).encode())
+        return digest.hexdigest()
+
+    def _upsampled_universe(self, cuts):
+        # Universe points plus every point where a term's mf crosses its cut level,
+        # as skfuzzy's find_memberships() does; missing crossings repeat x[0].
+        x = self.universe
+        columns = [np.broadcast_to(x, (cuts.shape[1], len(x)))]
+        for term, cut in zip(self.output_terms, cuts):
+            mf = term.mf
+            cut = cut[:, None]
+            above = np.where(cut == 0., mf > 0., mf >= cut)
+            crossing = above[:, :-1] != above[:, 1:]
+            slope = (x[1:] - x[:-1]) / np.where(mf[1:] == mf[:-1], 1., mf[1:] - mf[:-1])
+            points = x[:-1] + (cut - mf[:-1]) * slope
+            columns.append(np.where(crossing, points, x[0]))
+        return np.sort(np.hstack(columns), axis=1)
+
+    def centroid_parts(self, cuts):
+        """First moment and area of the aggregated output membership function."""
+        x = self._upsampled_universe(cuts)
+        y = np.zeros_like(x)
+        for term, cut in zip(self.output_terms, cuts):
+            clipped_mf = np.minimum(cut[:, None], np.interp(x, self.universe, term.mf))
+            np.maximum(y, clipped_mf, out=y)
+
+        x1, x2 = x[:, :-1], x[:, 1:]
+        y1, y2 = y[:, :-1], y[:, 1:]
+        area = 0.5 * (x2 - x1) * (y1 + y2)
+        moment = (x2 - x1) * (x1 * (2 * y1 + y2) + x2 * (y1 + 2 * y2)) / 6.
+        return moment.sum(axis=1), area.sum(axis=1)
+
+    def defuzzify(self, cuts):
+        moments, areas = self.centroid_parts(cuts)
+        result = moments / np.fmax(areas, np.finfo(float).eps)
+        result[areas == 0] = np.nan
+        return result
+
+    def compute(self, **inputs):
+        """Centroid-defuzzified output for arrays of crisp inputs keyed by antecedent label."""
+        return self.defuzzify(self.cuts(**inputs))
+
+
+def compare_with_skfuzzy(control_system, inputs):
+    """
+    Run `inputs` through both BatchFuzzyEngine and skfuzzy one by one.
+
+    Returns (batch, reference) arrays; skfuzzy failures are recorded as NaN.
+    """
+    batch = BatchFuzzyEngine(control_system).compute(**inputs)
+    simulation = ctrl.ControlSystemSimulation(control_system)
+    output_label = next(iter(control_system.consequents)).label
+
+    n = len(batch)
+    reference = np.full(n, np.nan)
+    for i in range(n):
+        for label, values in inputs.items():
+            simulation.input[label] = float(values[i])
+        try:
+            simulation.compute()
+            reference[i] = simulation.output[output_label]
+        except (KeyError, ValueError):
+            pass
+    return batch, reference
+
+
+class FuzzyLookupSurface:
+    """
+    BatchFuzzyEngine sampled once onto a regular grid over its antecedent
+    universes, answering compute() by linear (trilinear for three inputs)
+    interpolation.
+
+    The centroid's moment and area are interpolated separately and divided
+    afterwards, so the surface stays smooth next to regions where no rule
+    fires; those still come back as NaN.
+    """
+
+    def __init__(self, engine, resolution, moments, areas):
+        self.engine = engine
+        self.resolution = resolution
+        self.input_labels = engine.input_labels
+        self.axes = self.grid_axes(engine, resolution)
+        self.lower = np.array([axis[0] for axis in self.axes])
+        self.upper = np.array([axis[-1] for axis in self.axes])
+        self._interpolator = RegularGridInterpolator(self.axes, np.stack([moments, areas], axis=-1))
+
+    @staticmethod
+    def grid_axes(engine, resolution):
+        return [
+            np.linspace(antecedent.universe.min(), antecedent.universe.max(), resolution)
+            for antecedent in engine.antecedents.values()
+        ]
+
+    @classmethod
+    def build(cls, engine, resolution):
+        axes = cls.grid_axes(engine, resolution)
+        mesh = np.meshgrid(*axes, indexing='ij')
+        inputs = {label: values.ravel() for label, values in zip(engine.input_labels, mesh)}
+        moments, areas = engine.centroid_parts(engine.cuts(**inputs))
+        shape = mesh[0].shape
+        return cls(engine, resolution, moments.reshape(shape), areas.reshape(shape))
+
+    def save(self, path):
+        moments, areas = np.moveaxis(self._interpolator.values, -1, 0)
+        np.savez(path, signature=self.engine.signature(), moments=moments, areas=areas)
+
+    @classmethod
+    def load_or_build(cls, engine, resolution, path):
+        """Reuse the surface cached at `path` if it was sampled from the same rules and resolution."""
+        if os.path.exists(path):
+            cached = np.load(path)
+            if str(cached['signature']) == engine.signature() and cached['moments'].shape[0] == resolution:
+                return cls(engine, resolution, cached['moments'], cached['areas'])
+
+        surface = cls.build(engine, resolution)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        surface.save(path)
+        return surface
+
+    def compute(self, **inputs):
+        points = np.column_stack([
+            np.atleast_1d(np.asarray(inputs[label], dtype=float)) for label in self.input_labels
+        ])
+        points = np.clip(points, self.lower, self.upper)
+        moments, areas = self._interpolator(points).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(areas > SURFACE_MIN_AREA, moments / areas, np.nan)
+
+
+def surface_accuracy(surface, n_samples=100000, seed=42):
+    """Error of `surface` against its exact engine on uniformly sampled inputs."""
+    rng = np.random.default_rng(seed)
+    inputs = {
+        label: rng.uniform(low, high, size=n_samples)
+        for label, low, high in zip(surface.input_labels, surface.lower, surface.upper)
+    }
+    exact = surface.engine.compute(**inputs)
+    approx = surface.compute(**inputs)
+
+    both = ~np.isnan(exact) & ~np.isnan(approx)
+    errors = np.abs(exact[both] - approx[both])
+    return {
+        'resolution': surface.resolution,
+        'samples': n_samples,
+        'max_abs_error': float(errors.max()) if errors.size else 0.,
+        'mean_abs_error': float(errors.mean()) if errors.size else 0.,
+        'p99_abs_error': float(np.percentile(errors, 99)) if errors.size else 0.,
+        'output_mismatch_rate': float(np.mean(np.isnan(exact) != np.isnan(approx))),
+    }
@@ -1,20 +1,13 @@
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from models import db, Game
+from models import db, Game, CatalogVersion
 from app import create_app
+from tag_index import rebuild_tag_indexes
+from catalog_terms import sync_catalog_terms
+from keywords import extract_keywords
+from merger import MERGED_FILE, read_chunks
 
 
 def extract_tags_with_tfidf(df, column='detailed_description', top_n=5):
-    tfidf = TfidfVectorizer(stop_words='english', max_features=1000)
-    tfidf_matrix = tfidf.fit_transform(df[column])
-    feature_names = tfidf.get_feature_names_out()
-
-    tags_list = []
-    for row in tfidf_matrix:
-        indices = row.toarray().argsort()[0, -top_n:][::-1]
-        tags = [feature_names[i] for i in indices]
-        tags_list.append(', '.join(tags))
-    return tags_list
+    return extract_keywords(df[column], top_n=top_n)
 
 
 def extract_average_owners(owners_range):
@@ -27,8 +20,8 @@ def extract_average_owners(owners_range):
 
 def load_games(csv_path, limit=5000):
     # Load limited data
-    df = pd.read_csv(csv_path, nrows=limit).fillna('')
-    print(f"Loaded {len(df)} rows from CSV")
+    df = next(read_chunks(csv_path, chunk_size=limit)).fillna('')
+    print(f"Loaded {len(df)} rows from {csv_path}")
 
     # Generate tags
     df['Tags'] = extract_tags_with_tfidf(
@@ -61,7 +54,11 @@ def load_games(csv_path, limit=5000):
         db.session.bulk_save_objects(games)
         db.session.commit()
         print(f"Successfully inserted {len(games)} games")
+        sync_catalog_terms(Game)
+        CatalogVersion.bump('games')
+        db.session.commit()
+        rebuild_tag_indexes()
 
 
 if __name__ == "__main__":
-    load_games('data/merged_steam_data.csv', limit=5000)
+    load_games(MERGED_FILE, limit=5000)
@@ -0,0 +1,240 @@
+import numpy as np
+import scipy.sparse as sp
+
+NUMERIC_FIELDS = ('rating', 'cost', 'popularity')
+TERM_FIELDS = ('tags', 'actors')
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+class TermColumn:
+    """
+    Per-item lists of strings in CSR layout: row i holds the term ids
+    indices[indptr[i]:indptr[i + 1]] into the interned `terms` vocabulary.
+
+    Matching in the recommenders is case-insensitive, so every term is also
+    mapped once to a lowercased key; `key_ids` is the same layout over keys.
+    It is derived from `indices` unless given, e.g. from a catalog snapshot.
+    """
+
+    def __init__(self, indptr, indices, terms, key_ids=None):
+        self.indptr = _readonly(np.asarray(indptr, dtype=np.int64))
+        self.indices = _readonly(np.asarray(indices, dtype=np.int32))
+        self.terms = tuple(terms)
+
+        key_of = {}
+        term_keys = np.fromiter(
+            (key_of.setdefault(term.lower(), len(key_of)) for term in self.terms),
+            dtype=np.int32, count=len(self.terms),
+        )
+        self.key_lookup = key_of
+        self.keys = tuple(key_of)
+        if key_ids is None:
+            key_ids = term_keys[self.indices]
+        self.key_ids = _readonly(np.asarray(key_ids, dtype=np.int32))
+
+    @classmethod
+    def from_lists(cls, term_lists):
+        term_of = {}
+        indptr = [0]
+        indices = []
+        for terms in term_lists:
+            indices.extend(term_of.setdefault(term, len(term_of)) for term in terms)
+            indptr.append(len(indices))
+        return cls(indptr, indices, term_of)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row(self, i):
+        return [self.terms[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def row_keys(self, i):
+        return self.key_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def lookup(self, key):
+        """Key id of an already lowercased string, or -1 if no item has it."""
+        return self.key_lookup.get(key, -1)
+
+    def key_matrix(self):
+        """Binary row x key multi-hot matrix over the lowercased keys."""
+        data = np.ones(len(self.key_ids), dtype=np.float64)
+        matrix = sp.csr_matrix(
+            (data, self.key_ids.copy(), self.indptr.copy()), shape=(len(self), len(self.keys))
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.
+        return matrix
+
+    def counts(self):
+        """Item x term occurrence counts, as CountVectorizer would produce."""
+        data = np.ones(len(self.indices), dtype=np.float64)
+        matrix = sp.csr_matrix(
+            (data, self.indices.copy(), self.indptr.copy()), shape=(len(self), len(self.terms))
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+
+class ItemCatalog:
+    """
+    Columnar form of a list of Movie.to_dict()/Game.to_dict() items.
+
+    Numeric fields are float arrays (NaN where the value was None), string
+    lists are TermColumns, and genre strings are interned. Splitting,
+    stripping and lowercasing happen once here instead of on every request;
+    item(row) rebuilds the original dict for the handful of rows returned.
+    """
+
+    def __init__(self, fields, ids, titles, genre_labels, genre_label_ids, genres, numeric, term_columns):
+        self.fields = tuple(fields)
+        self.ids = _readonly(np.asarray(ids, dtype=np.int64))
+        self.titles = tuple(titles)
+        self.genre_labels = tuple(genre_labels)
+        self.genre_label_ids = _readonly(np.asarray(genre_label_ids, dtype=np.int32))
+        self.genres = genres
+        self.numeric = {name: _readonly(np.asarray(values, dtype=np.float64)) for name, values in numeric.items()}
+        self.term_columns = dict(term_columns)
+        self.id_order = _readonly(np.argsort(self.ids, kind='stable'))
+
+    @classmethod
+    def from_items(cls, items):
+        """Build from item dicts in one pass, so `items` can be a lazy generator."""
+        fields = None
+        ids, titles, genre_label_ids = [], [], []
+        label_of = {}
+        numeric = {name: [] for name in NUMERIC_FIELDS}
+        term_lists = {name: ([0], [], {}) for name in TERM_FIELDS}
+
+        for item in items:
+            if fields is None:
+                fields = list(item)
+            ids.append(item['id'])
+            titles.append(item.get('title'))
+            genre_label_ids.append(label_of.setdefault(item.get('genre') or '', len(label_of)))
+            for name, values in numeric.items():
+                value = item.get(name)
+                values.append(np.nan if value is None else value)
+            for name, (indptr, indices, term_of) in term_lists.items():
+                terms = item.get(name)
+                if isinstance(terms, list):
+                    indices.extend(term_of.setdefault(term, len(term_of)) for term in terms)
+                indptr.append(len(indices))
+
+        if fields is None:
+            fields = ['id', 'title', 'genre', 'tags', 'rating', 'popularity']
+
+        genres = TermColumn.from_lists(
+            [genre.strip() for genre in label.split(',')] for label in label_of
+        )
+
+        return cls(
+            fields,
+            ids,
+            titles,
+            label_of,
+            genre_label_ids,
+            genres,
+            {name: values for name, values in numeric.items() if name in fields},
+            {name: TermColumn(*term_lists[name]) for name in TERM_FIELDS if name in fields},
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, item_ids):
+        """Catalog rows of `item_ids`, with -1 for ids not in the catalog."""
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(item_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, item_ids, sorter=self.id_order), len(self.ids) - 1)
+        rows = self.id_order[positions]
+        return np.where(self.ids[rows] == item_ids, rows, -1)
+
+    @property
+    def tags(self):
+        return self.term_columns['tags']
+
+    def genre_keys(self, i):
+        """Lowercased genre key ids of item row i."""
+        return self.genres.row_keys(self.genre_label_ids[i])
+
+    def item(self, i):
+        values = {
+            'id': int(self.ids[i]),
+            'title': self.titles[i],
+            'genre': self.genre_labels[self.genre_label_ids[i]],
+        }
+        for name, column in self.term_columns.items():
+            values[name] = column.row(i)
+        for name, column in self.numeric.items():
+            value = column[i]
+            if np.isnan(value):
+                values[name] = None
+            else:
+                values[name] = int(value) if name == 'popularity' else float(value)
+        return {field: values.get(field) for field in self.fields}
+
+
+class StratifiedSampler:
+    """
+    Random items from an ItemCatalog, spread across (primary genre,
+    popularity bucket) strata so small samples stay diverse.
+
+    Rows are grouped by stratum once; a sample draws distinct strata and
+    then one row from each, so its cost depends on the number of strata
+    and the sample size, not on the catalog size.
+    """
+
+    def __init__(self, catalog, popularity_buckets=3):
+        self.catalog = catalog
+        n = len(catalog)
+
+        primary_genre = np.full(len(catalog.genre_labels), -1, dtype=np.int64)
+        for label_id in range(len(catalog.genre_labels)):
+            keys = catalog.genres.row_keys(label_id)
+            if len(keys):
+                primary_genre[label_id] = keys[0]
+        genre = primary_genre[catalog.genre_label_ids] if n else np.zeros(0, dtype=np.int64)
+
+        popularity = catalog.numeric.get('popularity', np.full(n, np.nan))
+        known = ~np.isnan(popularity)
+        bucket = np.full(n, popularity_buckets, dtype=np.int64)  # Unknown popularity is its own bucket
+        if known.any():
+            edges = np.quantile(popularity[known], np.linspace(0, 1, popularity_buckets + 1)[1:-1])
+            bucket[known] = np.searchsorted(edges, popularity[known], side='right')
+
+        stratum = (genre + 1) * (popularity_buckets + 1) + bucket
+        self.order = _readonly(np.argsort(stratum, kind='stable'))
+        _, starts = np.unique(stratum[self.order], return_index=True)
+        self.starts = _readonly(starts)
+        self.ends = _readonly(np.append(starts[1:], n))
+
+    def __len__(self):
+        return len(self.order)
+
+    def sample_rows(self, n, rng=None, stratify=True):
+        rng = np.random.default_rng() if rng is None else rng
+        n = min(n, len(self))
+        if not stratify or len(self.starts) == 0:
+            return rng.choice(len(self), size=n, replace=False)
+
+        strata = rng.permutation(len(self.starts))[:n]
+        picks = self.starts[strata] + (rng.random(len(strata)) * (self.ends - self.starts)[strata]).astype(np.int64)
+        rows = self.order[picks]
+
+        # Fewer strata than requested items: top up from the whole catalog
+        rows = rows.tolist()
+        chosen = set(rows)
+        while len(rows) < n:
+            row = int(rng.integers(len(self)))
+            if row not in chosen:
+                chosen.add(row)
+                rows.append(row)
+        return rows
+
+    def sample(self, n, rng=None, stratify=True):
+        return [self.catalog.item(row) for row in self.sample_rows(n, rng, stratify)]
@@ -0,0 +1,141 @@
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+KEYWORD_WORKERS = int(os.getenv('KEYWORD_WORKERS', str(os.cpu_count() or 1)))
+KEYWORD_CHUNK_SIZE = int(os.getenv('KEYWORD_CHUNK_SIZE', '2000'))
+
+
+def top_n_per_row(matrix, top_n):
+    """
+    Column indices of the top_n largest entries of each CSR row, best first,
+    found by sorting the stored entries instead of densifying rows. Ties go
+    to the lower column. Rows with fewer non-zero entries get fewer columns.
+    """
+    matrix = matrix.tocsr()
+    matrix.eliminate_zeros()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    keep = order[rank < top_n]
+    counts = np.bincount(rows[keep], minlength=matrix.shape[0])
+    return np.split(matrix.indices[keep], np.cumsum(counts)[:-1])
+
+
+def _clean(texts):
+    return ['' if text is None or text != text else str(text) for text in texts]
+
+
+def _count_terms(texts):
+    """Total and document frequency of every term in one chunk."""
+    vectorizer = CountVectorizer(stop_words='english')
+    try:
+        counts = vectorizer.fit_transform(_clean(texts))
+    except ValueError:  # Only empty or stop-word documents
+        return len(texts), {}, {}
+    terms = vectorizer.get_feature_names_out()
+    term_counts = np.asarray(counts.sum(axis=0)).ravel()
+    document_counts = np.diff(counts.tocsc().indptr)
+    return len(texts), dict(zip(terms, term_counts.tolist())), dict(zip(terms, document_counts.tolist()))
+
+
+def _keywords(counts, terms, idf, top_n):
+    scores = counts.multiply(idf).tocsr()
+    return [', '.join(terms[i] for i in row) for row in top_n_per_row(scores, top_n)]
+
+
+def _chunk_keywords(texts, terms, idf, top_n):
+    if not len(terms):
+        return [''] * len(texts)
+    vectorizer = CountVectorizer(stop_words='english', vocabulary=terms)
+    return _keywords(vectorizer.transform(_clean(texts)), terms, idf, top_n)
+
+
+def csv_text_chunks(csv_path, column, chunk_size=KEYWORD_CHUNK_SIZE):
+    """Lists of `column` values from a CSV, read chunk_size rows at a time."""
+    for chunk in pd.read_csv(csv_path, usecols=[column], chunksize=chunk_size):
+        yield chunk[column].tolist()
+
+
+class KeywordExtractor:
+    """
+    Top TF-IDF terms per document, as TfidfVectorizer(stop_words='english',
+    max_features=...) would rank them.
+
+    fit() and transform() take iterables of text chunks and only hold a few
+    chunks at a time, so the corpus can be larger than memory (pass the
+    chunks twice, e.g. csv_text_chunks). With workers > 1, chunks are
+    counted and scored across a process pool.
+    """
+
+    def __init__(self, top_n=5, max_features=1000, workers=KEYWORD_WORKERS):
+        self.top_n = top_n
+        self.max_features = max_features
+        self.workers = workers
+        self.terms = None
+        self.idf = None
+
+    def _map(self, workers, function, chunks, *args):
+        """Yield function(chunk, *args) in order, with a bounded number of chunks in flight."""
+        workers = self.workers if workers is None else workers
+        if workers <= 1:
+            for chunk in chunks:
+                yield function(chunk, *args)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(function, chunk, *args))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def fit(self, chunks, workers=None):
+        n_documents = 0
+        term_counts = Counter()
+        document_counts = Counter()
+        for chunk_documents, chunk_terms, chunk_documents_per_term in self._map(workers, _count_terms, chunks):
+            n_documents += chunk_documents
+            term_counts.update(chunk_terms)
+            document_counts.update(chunk_documents_per_term)
+
+        # Most frequent terms across the corpus; the same argsort as the vectorizer's
+        # max_features cut, so ties at the cutoff are broken the same way
+        terms = np.array(sorted(term_counts), dtype=object)
+        frequency = np.array([term_counts[term] for term in terms], dtype=np.int64)
+        self.terms = np.sort(terms[(-frequency).argsort()[:self.max_features]])
+        document_frequency = np.array([document_counts[term] for term in self.terms], dtype=np.float64)
+        self.idf = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+        return self
+
+    def transform(self, chunks, workers=None):
+        """Yield a list of ', '-joined keywords for each chunk."""
+        yield from self._map(workers, _chunk_keywords, chunks, self.terms, self.idf, self.top_n)
+
+    def fit_transform(self, texts, chunk_size=KEYWORD_CHUNK_SIZE):
+        texts = _clean(texts)
+        chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+        if len(chunks) > 1 and self.workers > 1:
+            self.fit(chunks)
+            return [keywords for chunk in self.transform(chunks) for keywords in chunk]
+
+        # In one process, tokenize once and score the same count matrix
+        vectorizer = CountVectorizer(stop_words='english', max_features=self.max_features)
+        try:
+            counts = vectorizer.fit_transform(texts)
+        except ValueError:  # Only empty or stop-word documents
+            self.terms, self.idf = np.array([], dtype=object), np.array([])
+            return [''] * len(texts)
+        self.terms = vectorizer.get_feature_names_out().astype(object)
+        self.idf = np.log((1 + len(texts)) / (1 + np.diff(counts.tocsc().indptr))) + 1
+        return _keywords(counts, self.terms, self.idf, self.top_n)
+
+
+def extract_keywords(texts, top_n=5, max_features=1000, workers=KEYWORD_WORKERS):
+    return KeywordExtractor(top_n, max_features, workers).fit_transform(texts)
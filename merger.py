@@ -1,28 +1,105 @@
+"""
+Merge a random sample of the Steam dataset with its descriptions and
+system requirements, without loading any of the source files whole.
+
+The sample of appids is drawn first from steam.csv's appid column, the
+same rows merged.sample(n, random_state=seed) used to pick. The three
+files are then read in chunks and only rows for sampled appids are kept,
+so peak memory depends on the sample size and chunk size, not on the
+size of the source files.
+
+Usage:
+    python merger.py --sample-size 5000 --seed 42
+    python merger.py --output data/merged_steam_data.csv
+"""
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 
-# File paths (update these paths if needed)
-steam_file = 'data/steam.csv'
-description_file = 'data/steam_description_data.csv'
-requirements_file = 'data/steam_requirements_data.csv'
+STEAM_FILE = 'data/steam.csv'
+DESCRIPTION_FILE = 'data/steam_description_data.csv'
+REQUIREMENTS_FILE = 'data/steam_requirements_data.csv'
+MERGED_FILE = 'data/merged_steam_data.parquet'
+MERGE_CHUNK_SIZE = int(os.getenv('MERGE_CHUNK_SIZE', '20000'))
+
+
+def read_chunks(path, columns=None, chunk_size=MERGE_CHUNK_SIZE):
+    """DataFrames of chunk_size rows from a CSV or Parquet file."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+
+
+def sample_appids(steam_file, sample_size, seed, chunk_size=MERGE_CHUNK_SIZE):
+    """
+    The appids of sample_size random rows of steam_file, in sample order.
+    Only the appid column is held in memory.
+    """
+    appids = np.concatenate([
+        chunk['appid'].to_numpy() for chunk in read_chunks(steam_file, ['appid'], chunk_size)
+    ])
+    if sample_size > len(appids):
+        raise ValueError(f"Cannot sample {sample_size} rows from {len(appids)} games")
+    # The draw DataFrame.sample makes, so a seed picks the same games as before
+    positions = np.random.RandomState(seed).choice(len(appids), size=sample_size, replace=False)
+    return appids[positions]
+
+
+def filter_chunks(path, appids, key='appid', chunk_size=MERGE_CHUNK_SIZE):
+    """The rows of `path` whose `key` is in appids, read chunk_size rows at a time."""
+    appids = pd.Index(appids)
+    parts = []
+    for chunk in read_chunks(path, chunk_size=chunk_size):
+        chunk = chunk.rename(columns={key: 'appid'})
+        parts.append(chunk[chunk['appid'].isin(appids)])
+    return pd.concat(parts, ignore_index=True)
+
+
+def merge_sample(sample_size=5000, seed=42, steam_file=STEAM_FILE, description_file=DESCRIPTION_FILE,
+                 requirements_file=REQUIREMENTS_FILE, chunk_size=MERGE_CHUNK_SIZE):
+    appids = sample_appids(steam_file, sample_size, seed, chunk_size)
+
+    steam_df = filter_chunks(steam_file, appids, chunk_size=chunk_size)
+    description_df = filter_chunks(description_file, appids, 'steam_appid', chunk_size)
+    requirements_df = filter_chunks(requirements_file, appids, 'steam_appid', chunk_size)
+
+    # Left joins on the sampled games, in sample order
+    order = pd.DataFrame({'appid': appids})
+    return order.merge(steam_df, on='appid', how='left') \
+                .merge(description_df, on='appid', how='left') \
+                .merge(requirements_df, on='appid', how='left')
 
-# Load the datasets
-steam_df = pd.read_csv(steam_file)
-description_df = pd.read_csv(description_file)
-requirements_df = pd.read_csv(requirements_file)
 
-description_df.rename(columns={'steam_appid': 'appid'}, inplace=True)
-requirements_df.rename(columns={'steam_appid': 'appid'}, inplace=True)
+def write_merged(merged_df, output):
+    if output.endswith('.parquet'):
+        merged_df.to_parquet(output, index=False)
+    else:
+        merged_df.to_csv(output, index=False)
 
 
-# Merge the datasets on 'appid'
-merged_df = steam_df.merge(description_df, on='appid', how='left') \
-                    .merge(requirements_df, on='appid', how='left')
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=MERGE_CHUNK_SIZE)
+    parser.add_argument('--steam', default=STEAM_FILE)
+    parser.add_argument('--descriptions', default=DESCRIPTION_FILE)
+    parser.add_argument('--requirements', default=REQUIREMENTS_FILE)
+    parser.add_argument('--output', default=MERGED_FILE, help='.parquet, or .csv for the old format')
+    args = parser.parse_args()
 
-# Assuming merged_df is your merged DataFrame
-merged_df = merged_df.sample(n=5000, random_state=42)
+    merged_df = merge_sample(args.sample_size, args.seed, args.steam, args.descriptions,
+                             args.requirements, args.chunk_size)
+    print(merged_df.head())
+    write_merged(merged_df, args.output)
+    print(f"Wrote {len(merged_df)} games to {args.output}")
 
-# Display the first few rows of the merged DataFrame
-print(merged_df.head())
 
-# Optionally save the merged DataFrame to a CSV
-merged_df.to_csv('merged_steam_data.csv', index=False)
+if __name__ == '__main__':
+    main()
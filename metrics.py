@@ -0,0 +1,290 @@
+"""
+In-process counters and histograms, rendered in the Prometheus text format
+on /metrics, plus sampled structured logs for the recommendation hot path.
+
+Metrics are recorded in the worker that serves the request. With
+METRICS_DIR set, each worker writes its values to <pid>.json there at most
+every METRICS_FLUSH_SECONDS, and /metrics adds up every file, so a scrape
+sees all workers (including ones gunicorn has since restarted) whichever
+one answers. Empty the directory when the server starts, as with
+prometheus_client's multiprocess mode. Without it every series carries a
+worker label, so the workers' counters never mix.
+"""
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Share of requests whose trace is logged; errors are always logged
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Directory the workers share their values through, and how often each one writes them
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+# Seconds; recommend() stages run from well under a millisecond to seconds on big catalogs
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_request_id = ContextVar('request_id', default=None)
+_sampled = ContextVar('sampled', default=None)
+
+logger = logging.getLogger('rexys')
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def _label_string(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        """{label values: value}, copied."""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values=None, extra=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        values = self.snapshot() if values is None else values
+        lines.extend(f'{self.name}{_label_string(self.labelnames, key, extra)} {value}'
+                     for key, value in sorted(values.items()))
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus expects."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.]
+            series[0][position] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """{label values: [per-bucket counts, sum]}, copied."""
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._series.items()}
+
+    @staticmethod
+    def merge(series, other):
+        for key, (counts, total) in other.items():
+            mine = series.get(key)
+            if mine is None:
+                series[key] = [list(counts), total]
+            else:
+                mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                mine[1] += total
+
+    def render(self, series=None, extra=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        series = self.snapshot() if series is None else series
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _label_string(self.labelnames, key, list(extra) + [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _label_string(self.labelnames, key, extra)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS):
+        self._metrics = []
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._flushed_at = 0.
+        self._flush_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def flush(self):
+        """Write this worker's values to <directory>/<pid>.json, replacing the last write."""
+        values = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                  for metric in self._metrics}
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(values, f)
+        os.replace(f'{path}.tmp', path)
+        self._flushed_at = time.monotonic()
+
+    def flush_if_due(self):
+        """flush() if METRICS_DIR is set and the last one is older than flush_seconds; called after each request."""
+        if self.directory is None or time.monotonic() - self._flushed_at < self.flush_seconds:
+            return
+        if self._flush_lock.acquire(blocking=False):
+            try:
+                self.flush()
+            finally:
+                self._flush_lock.release()
+
+    def _merged(self):
+        """Every worker's values summed, from the files in the directory."""
+        merged = {metric.name: {} for metric in self._metrics}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError) as e:  # Replaced or removed while reading
+                print(f"Could not read metrics file {path}: {e}")
+                continue
+            for metric in self._metrics:
+                metric.merge(merged[metric.name], {tuple(key): value for key, value in values.get(metric.name, [])})
+        return merged
+
+    def render(self):
+        lines = []
+        if self.directory is None:
+            worker = [('worker', os.getpid())]
+            for metric in self._metrics:
+                lines.extend(metric.render(extra=worker))
+        else:
+            with self._flush_lock:
+                self.flush()
+            merged = self._merged()
+            for metric in self._metrics:
+                lines.extend(metric.render(merged[metric.name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Time to serve an HTTP request.', ['method', 'endpoint', 'status']
+)
+STAGE_SECONDS = registry.histogram(
+    'recommender_stage_duration_seconds', 'Time spent in each recommend() stage.', ['catalog', 'stage']
+)
+STAGE_ITEMS = registry.counter(
+    'recommender_stage_items_total', 'Catalog rows entering each recommend() stage.', ['catalog', 'stage']
+)
+RANKINGS = registry.counter(
+    'recommender_rankings_total', 'recommend() calls by outcome.', ['catalog', 'outcome']
+)
+DB_QUERY_SECONDS = registry.histogram(
+    'db_query_duration_seconds', 'Time spent in database queries made while serving requests.', ['query']
+)
+
+
+def timed_query(name):
+    """Context manager recording one database query into DB_QUERY_SECONDS."""
+    return DB_QUERY_SECONDS.time(query=name)
+
+
+def start_trace(request_id=None):
+    """
+    Tag the current request (thread or task) with an id and decide once
+    whether its logs are sampled, so a request's lines are kept together.
+    """
+    request_id = (request_id or uuid.uuid4().hex)[:128]
+    _request_id.set(request_id)
+    _sampled.set(random.random() < LOG_SAMPLE_RATE)
+    return request_id
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    One JSON log line, written only for sampled requests (or, outside a
+    request, for a LOG_SAMPLE_RATE share of calls). Warnings and errors are
+    always written.
+    """
+    if level < logging.WARNING:
+        sampled = _sampled.get()
+        if not (random.random() < LOG_SAMPLE_RATE if sampled is None else sampled):
+            return
+    if not logger.isEnabledFor(level):
+        return
+    record = {'event': event, 'level': logging.getLevelName(level).lower(), 'time': round(time.time(), 3)}
+    request_id = _request_id.get()
+    if request_id is not None:
+        record['request_id'] = request_id
+    record.update(fields)
+    logger.log(level, json.dumps(record, default=str))
+
+
+class StageTimer:
+    """Durations of the stages of one recommend() call, recorded to STAGE_SECONDS and kept for its log line."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, items=None):
+        if items is not None:
+            STAGE_ITEMS.inc(items, catalog=self.catalog, stage=name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.) + elapsed
+            STAGE_SECONDS.observe(elapsed, catalog=self.catalog, stage=name)
+
+    def milliseconds(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
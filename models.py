@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
@@ -19,16 +21,77 @@ class User(db.Model):
         return f"<User {self.username}>"
 
 
+def term_link_table(name, item_table, term_table):
+    """Many-to-many link between catalog items and a term table, indexed both ways."""
+    item_column = f'{item_table[:-1]}_id'
+    term_column = f'{term_table[:-1]}_id'
+    return db.Table(
+        name,
+        db.Column(item_column, db.Integer, db.ForeignKey(f'{item_table}.id', ondelete='CASCADE'), primary_key=True),
+        db.Column(term_column, db.Integer, db.ForeignKey(f'{term_table}.id', ondelete='CASCADE'), primary_key=True),
+        db.Index(f'ix_{name}_{term_column}', term_column, item_column),
+    )
+
+
+# Lowercased, stripped genre/tag/actor names shared by both catalogs
+class Genre(db.Model):
+    __tablename__ = 'genres'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Genre {self.name}>"
+
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Tag {self.name}>"
+
+
+class Actor(db.Model):
+    __tablename__ = 'actors'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Actor {self.name}>"
+
+
+movie_genres = term_link_table('movie_genres', 'movies', 'genres')
+movie_tags = term_link_table('movie_tags', 'movies', 'tags')
+movie_actors = term_link_table('movie_actors', 'movies', 'actors')
+game_genres = term_link_table('game_genres', 'games', 'genres')
+game_tags = term_link_table('game_tags', 'games', 'tags')
+
+
 class Movie(db.Model):
     __tablename__ = 'movies'
+    __table_args__ = (db.UniqueConstraint('source_key', name='uq_movies_source_key'),)
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(500), nullable=False)
     genre = db.Column(db.String(500), nullable=False)
     tags = db.Column(db.Text, nullable=True)
-    rating = db.Column(db.Float, nullable=True)
+    rating = db.Column(db.Float, nullable=True, index=True)
     actors = db.Column(db.String(300), nullable=True)
-    popularity = db.Column(db.Integer, nullable=True)
+    popularity = db.Column(db.Integer, nullable=True, index=True)
+
+    # Identity in the source CSV ("imdb:<title>:<year>") and a hash of the
+    # ingested fields, so re-running ingestion only touches changed rows
+    source_key = db.Column(db.String(600), nullable=True)
+    content_hash = db.Column(db.BigInteger, nullable=True)
+
+    # Normalized copies of genre/tags/actors, kept in sync by catalog_terms
+    genre_terms = db.relationship('Genre', secondary=movie_genres, passive_deletes=True)
+    tag_terms = db.relationship('Tag', secondary=movie_tags, passive_deletes=True)
+    actor_terms = db.relationship('Actor', secondary=movie_actors, passive_deletes=True)
 
     # Many-to-many relationship
     rated_by_users = db.relationship(
@@ -51,14 +114,23 @@ class Movie(db.Model):
 
 class Game(db.Model):
     __tablename__ = 'games'
+    __table_args__ = (db.UniqueConstraint('source_key', name='uq_games_source_key'),)
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(500), nullable=False)
     genre = db.Column(db.String(500), nullable=False)
     tags = db.Column(db.Text, nullable=True)
-    rating = db.Column(db.Float, nullable=True)
+    rating = db.Column(db.Float, nullable=True, index=True)
     cost = db.Column(db.Float, nullable=True)
-    popularity = db.Column(db.Integer, nullable=True)
+    popularity = db.Column(db.Integer, nullable=True, index=True)
+
+    # Identity in the source CSV ("steam:<appid>") and a hash of the ingested fields
+    source_key = db.Column(db.String(600), nullable=True)
+    content_hash = db.Column(db.BigInteger, nullable=True)
+
+    # Normalized copies of genre/tags, kept in sync by catalog_terms
+    genre_terms = db.relationship('Genre', secondary=game_genres, passive_deletes=True)
+    tag_terms = db.relationship('Tag', secondary=game_tags, passive_deletes=True)
 
     # Many-to-many relationship
     rated_by_users = db.relationship(
@@ -83,6 +155,58 @@ class Game(db.Model):
         return self._cached_dict
 
 
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+
+    name = db.Column(db.String(50), primary_key=True)  # 'movies' or 'games'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @staticmethod
+    def bump(name):
+        """Mark a catalog as changed; workers rebuild their recommenders on the next check. Does not commit."""
+        catalog_version = db.session.get(CatalogVersion, name)
+        if catalog_version is None:
+            catalog_version = CatalogVersion(name=name, version=0)
+            db.session.add(catalog_version)
+        catalog_version.version += 1
+        catalog_version.updated_at = datetime.utcnow()
+        return catalog_version.version
+
+    def __repr__(self):
+        return f"<CatalogVersion {self.name} {self.version}>"
+
+
+class UserProfile(db.Model):
+    """Rating-weighted sum of the genre/tag/actor keys of the items a user rated, per catalog."""
+    __tablename__ = 'user_profiles'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    catalog = db.Column(db.String(50), primary_key=True)  # 'movies' or 'games'
+    terms = db.Column(db.JSON, nullable=False, default=dict)  # {"tags:space": summed rating, ...}
+    weight = db.Column(db.Float, nullable=False, default=0)  # Sum of the ratings folded in
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserProfile User {self.user_id}, {self.catalog}, {len(self.terms or {})} terms>"
+
+
+class UserRecommendation(db.Model):
+    """Precomputed top-N list for one user, catalog and preferences set, valid for one catalog version."""
+    __tablename__ = 'user_recommendations'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    catalog = db.Column(db.String(50), primary_key=True)  # 'movies' or 'games'
+    preferences_hash = db.Column(db.String(40), primary_key=True)  # sha1 of the canonical preferences
+    catalog_version = db.Column(db.String(200), nullable=False)
+    items = db.Column(db.JSON, nullable=False)  # [[item id, score], ...], best first
+    total = db.Column(db.Integer, nullable=False)  # Length of the full ranking the items were cut from
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserRecommendation User {self.user_id}, {self.catalog}, {len(self.items or [])} items>"
+
+
 class UserMovieRating(db.Model):
     __tablename__ = 'user_movie_ratings'
 
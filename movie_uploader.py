@@ -1,7 +1,9 @@
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from models import db, Movie
+from models import db, Movie, CatalogVersion
 from app import create_app  # Import your Flask app
+from tag_index import rebuild_tag_indexes
+from catalog_terms import sync_catalog_terms
+from keywords import extract_keywords
 
 
 def extract_tags_with_tfidf(df, column='Overview', top_n=5):
@@ -13,22 +15,7 @@ def extract_tags_with_tfidf(df, column='Overview', top_n=5):
     :param top_n: Number of top tags to extract.
     :return: List of top tags for each movie.
     """
-    # Initialize TF-IDF Vectorizer
-    tfidf = TfidfVectorizer(stop_words='english', max_features=1000)
-
-    # Fit TF-IDF on the Overview column
-    tfidf_matrix = tfidf.fit_transform(df[column])
-
-    # Get feature names (i.e., the terms)
-    feature_names = tfidf.get_feature_names_out()
-
-    # Extract top N tags for each movie
-    tags_list = []
-    for row in tfidf_matrix:
-        indices = row.toarray().argsort()[0, -top_n:][::-1]  # Top N indices
-        tags = [feature_names[i] for i in indices]
-        tags_list.append(', '.join(tags))
-    return tags_list
+    return extract_keywords(df[column], top_n=top_n)
 
 
 def load_movies_with_tfidf(csv_path):
@@ -63,7 +50,12 @@ def load_movies_with_tfidf(csv_path):
         db.session.commit()
         print(f"""Inserted {len(movies)}
               movies with TF-IDF tags into the database.""")
+        sync_catalog_terms(Movie)
+        CatalogVersion.bump('movies')
+        db.session.commit()
+        rebuild_tag_indexes()
 
 
 # Usage
-load_movies_with_tfidf('data/imdb_top_1000.csv')
+if __name__ == "__main__":
+    load_movies_with_tfidf('data/imdb_top_1000.csv')
@@ -0,0 +1,99 @@
+import os
+from datetime import datetime
+
+from models import db, UserProfile
+
+# Share of the content score replaced by similarity to the user's rating profile
+PROFILE_WEIGHT = float(os.getenv('PROFILE_WEIGHT', '0.2'))
+
+
+def item_profile_keys(catalog, row):
+    """'genre:<key>', 'tags:<key>' and 'actors:<key>' strings of one ItemCatalog row."""
+    keys = {f'genre:{catalog.genres.keys[key]}' for key in catalog.genre_keys(row)}
+    for name, column in catalog.term_columns.items():
+        keys.update(f'{name}:{column.keys[key]}' for key in column.row_keys(row))
+    return keys
+
+
+def rating_deltas(catalog, changes):
+    """
+    Change to a profile's term sums and total weight from (item id, old
+    rating or None, new rating) triples. Items the in-memory catalog does
+    not know yet contribute nothing.
+    """
+    changes = [(item_id, old or 0., new) for item_id, old, new in changes if new != old]
+    terms = {}
+    weight = 0.
+    if not changes:
+        return terms, weight
+
+    rows = catalog.rows_for([item_id for item_id, _, _ in changes])
+    for row, (_, old, new) in zip(rows.tolist(), changes):
+        if row < 0:
+            continue
+        weight += new - old
+        for key in item_profile_keys(catalog, row):
+            terms[key] = terms.get(key, 0.) + new - old
+    return terms, weight
+
+
+def update_user_profile(name, catalog, user_id, changes, load_ratings=None):
+    """
+    Fold a ratings batch, as (item id, old rating or None, new rating)
+    triples, into the user's profile in O(ratings in batch). A user without
+    a profile row gets one built from load_ratings() ({item id: rating},
+    including the batch), so ratings from before profiles existed still
+    count. Does not commit.
+    """
+    profile = db.session.query(UserProfile).filter_by(user_id=user_id, catalog=name).with_for_update().first()
+    if profile is None:
+        if load_ratings is not None:
+            changes = [(item_id, None, rating) for item_id, rating in load_ratings().items()]
+        profile = UserProfile(user_id=user_id, catalog=name, terms={}, weight=0.)
+        db.session.add(profile)
+
+    apply_rating_changes(profile, catalog, changes)
+    return profile
+
+
+def apply_rating_changes(profile, catalog, changes):
+    """Add the rating_deltas of `changes` to a UserProfile row in place."""
+    deltas, weight = rating_deltas(catalog, changes)
+    terms = dict(profile.terms or {})
+    for key, delta in deltas.items():
+        value = terms.get(key, 0.) + delta
+        # Keep the stored profile sparse
+        if abs(value) < 1e-9:
+            terms.pop(key, None)
+        else:
+            terms[key] = value
+
+    # Assign a new dict so the JSON column is marked as changed
+    profile.terms = terms
+    profile.weight = (profile.weight or 0.) + weight
+    profile.updated_at = datetime.utcnow()
+
+
+def rating_revision(name, user_id):
+    """
+    When the user's ratings in a catalog last changed (their profile's
+    updated_at), or None. Every rating write moves it, so it can be part
+    of a cache key that goes stale in every worker at once.
+    """
+    return db.session.query(UserProfile.updated_at).filter_by(user_id=user_id, catalog=name).scalar()
+
+
+def user_profile_terms(name, user_id):
+    """The user's {key: summed rating} profile for a catalog, or None."""
+    terms = db.session.query(UserProfile.terms).filter_by(user_id=user_id, catalog=name).scalar()
+    return terms or None
+
+
+def profile_terms_for_users(name, user_ids):
+    """{user id: profile terms} for the users that have a profile, in one query."""
+    if not user_ids:
+        return {}
+    rows = db.session.query(UserProfile.user_id, UserProfile.terms).filter(
+        UserProfile.catalog == name, UserProfile.user_id.in_(list(user_ids))
+    )
+    return {user_id: terms for user_id, terms in rows if terms}
@@ -1,27 +1,418 @@
+import logging
+import os
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
 import numpy as np
+import scipy.sparse as sp
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
+from collaborative import CF_WEIGHT
+from fuzzy_engine import BatchFuzzyEngine, FuzzyLookupSurface
+from item_catalog import ItemCatalog
+from metrics import RANKINGS, StageTimer, log_event
+from profiles import PROFILE_WEIGHT
+from tag_index import INDEX_DIR, TagIndex
+
+# Points per input axis of the cached fuzzy lookup surface; 0 runs exact inference
+FUZZY_GRID_RESOLUTION = int(os.getenv('FUZZY_GRID_RESOLUTION', '0'))
+# Rows per fuzzy inference call; its temporaries take a few KB per row
+FUZZY_BATCH_ROWS = int(os.getenv('FUZZY_BATCH_ROWS', '50000'))
+
+
+def top_k_indices(scores, k):
+    """
+    Positions of the k highest scores, best first, with ties kept in their
+    original order as a stable sort would. argpartition finds the k-th
+    score in O(n); only the entries at or above it are sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < len(scores):
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+class Ranking:
+    """Final scores of one recommend() call, paged without re-scoring."""
+
+    def __init__(self, catalog, rows, scores):
+        self.catalog = catalog
+        self.rows = rows
+        self.scores = scores
+
+    @classmethod
+    def empty(cls, catalog):
+        return cls(catalog, np.empty(0, dtype=np.int64), np.empty(0))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def page(self, offset=0, k=10):
+        """(item, score) pairs ranked offset .. offset + k - 1."""
+        positions = top_k_indices(self.scores, offset + k)[offset:]
+        return [(self.catalog.item(self.rows[p]), float(self.scores[p])) for p in positions]
 
 
 class BaseRecommender:
-    def __init__(self, items):
-        self.items = items
+    """
+    Recommenders are read-only once constructed: the catalog, tag index and
+    fuzzy engine are shared model state, and recommend() keeps everything it
+    computes in locals. One instance can therefore be built before gunicorn
+    forks (--preload) and used from any number of threads.
+    """
+
+    name = None
+    fuzzy_fields = ()
+    # Fuzzy inputs used when an item has no value for the field, instead of leaving it unscorable
+    fuzzy_defaults = {}
+
+    def __init__(self, items, tag_index=None, fuzzy_grid_resolution=None):
+        self.catalog = items if isinstance(items, ItemCatalog) else ItemCatalog.from_items(items)
+        self.item_ids = self.catalog.ids
+        # Reuse a prebuilt catalog index when it knows every item, otherwise fit one now
+        if tag_index is None or not tag_index.covers(self.catalog):
+            tag_index = TagIndex.build(self.catalog)
+        self.tag_index = tag_index
+        self.tag_rows = tag_index.rows_for(self.item_ids.tolist())
+        self.fuzzy_grid_resolution = FUZZY_GRID_RESOLUTION if fuzzy_grid_resolution is None else fuzzy_grid_resolution
+
+        # Multi-hot overlap matrices for batch preference scoring
+        self.genre_key_matrix = self.catalog.genres.key_matrix().tocsc()
+        self.key_matrices = {name: column.key_matrix() for name, column in self.catalog.term_columns.items()}
+        self.profile_matrix, self.profile_columns = self._profile_matrix()
+
+        # Items missing a value the fuzzy system needs can never be scored
+        self.scorable = np.ones(len(self.catalog), dtype=bool)
+        for name in self.fuzzy_fields:
+            if name not in self.fuzzy_defaults:
+                self.scorable &= ~np.isnan(self.numeric(name))
+        self.scorable.flags.writeable = False
+
+    def _profile_matrix(self):
+        """
+        L2-normalized item x key multi-hot matrix over genres, tags and
+        actors, and the column of each 'genre:<key>'/'tags:<key>'/... string
+        that user profiles are stored under.
+        """
+        catalog = self.catalog
+        blocks = [('genre', catalog.genres.keys, catalog.genres.key_matrix()[catalog.genre_label_ids])]
+        blocks.extend((name, catalog.term_columns[name].keys, matrix) for name, matrix in self.key_matrices.items())
+
+        columns = {}
+        for name, keys, _ in blocks:
+            # The generator runs while update() grows the dict, so take the offset first
+            offset = len(columns)
+            columns.update((f'{name}:{key}', offset + i) for i, key in enumerate(keys))
+        matrix = sp.hstack([matrix for _, _, matrix in blocks], format='csr')
+        if 0 in matrix.shape:  # Empty catalog: normalize() refuses zero-sized input
+            return matrix, columns
+        return normalize(matrix, norm='l2', axis=1), columns
+
+    def profile_scores(self, profile_terms):
+        """
+        Cosine similarity of every catalog row to a user profile ({key:
+        summed rating}), from one sparse matrix-vector product. None if no
+        profile key is in this catalog.
+        """
+        columns, weights = [], []
+        for key, weight in profile_terms.items():
+            column = self.profile_columns.get(key)
+            if column is not None:
+                columns.append(column)
+                weights.append(weight)
+        if not columns:
+            return None
+
+        vector = np.zeros(self.profile_matrix.shape[1])
+        vector[columns] = weights
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return np.clip(self.profile_matrix @ (vector / norm), 0, 1)
+
+    def numeric(self, name):
+        """Numeric catalog column, or zeros when items don't carry the field at all."""
+        if name in self.catalog.numeric:
+            return self.catalog.numeric[name]
+        return np.zeros(len(self.catalog))
+
+    def fuzzy_simulation(self):
+        """A fresh skfuzzy simulation for callers that need one; never share it between threads."""
+        return ctrl.ControlSystemSimulation(self.fuzzy_system)
+
+    def _create_fuzzy_engine(self, control_system):
+        engine = BatchFuzzyEngine(control_system)
+        if self.fuzzy_grid_resolution <= 0:
+            return engine
+
+        path = os.path.join(INDEX_DIR, f'{self.name}_fuzzy_{self.fuzzy_grid_resolution}.npz')
+        return FuzzyLookupSurface.load_or_build(engine, self.fuzzy_grid_resolution, path)
 
     def calculate_cb_score(self, item_index, tfidf_matrix):
         similarities = cosine_similarity(
-            tfidf_matrix[item_index], tfidf_matrix[:len(self.items)]
+            tfidf_matrix[item_index], tfidf_matrix[:len(self.catalog)]
         ).flatten()
         return np.mean(similarities)
 
-    def recommend(self, user_preferences, user_history):
+    def calculate_cb_scores(self, tfidf_matrix):
+        """
+        Batch version of calculate_cb_score for every row of `tfidf_matrix`.
+
+        With L2-normalized rows the mean cosine similarity of row i against
+        the reference rows is x_i . (sum of reference rows) / n, so a single
+        sparse matrix-vector product scores all candidates at once.
+        """
+        normalized = normalize(tfidf_matrix, norm='l2', axis=1)
+        reference = normalized[:len(self.catalog)]
+        column_sums = np.asarray(reference.sum(axis=0)).ravel()
+        return normalized @ column_sums / reference.shape[0]
+
+    def fuzzy_inputs(self, rows, overall_scores):
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def preference_query(self, user_preferences):
+        """
+        Normalize the user's preferences once per request into key ids of
+        the catalog's interned genre/tag/actor vocabularies. Terms no item
+        carries get id -1: they still count towards the number of preferred
+        terms but can never match.
+        """
+        catalog = self.catalog
+        query = {}
+
+        if 'genre' in user_preferences and 'genre' in catalog.fields:
+            query['genre'] = catalog.genres.lookup(user_preferences['genre'].lower())
+
+        for name in ('tags', 'actors'):
+            if name in user_preferences and name in catalog.term_columns and name in self.weights:
+                keys = [term.strip().lower() for term in user_preferences[name]]
+                column = catalog.term_columns[name]
+                query[name] = (np.array([column.lookup(key) for key in set(keys)], dtype=np.int32), len(keys))
+
+        if 'rating' in user_preferences and 'rating' in catalog.fields:
+            query['rating'] = (
+                user_preferences['rating'].get('min', float('-inf')),
+                user_preferences['rating'].get('max', float('inf')),
+            )
+
+        if 'cost' in user_preferences and 'cost' in catalog.fields and 'cost' in self.weights:
+            query['cost'] = user_preferences['cost'].get('max', float('inf'))
+
+        return query
+
+    def calculate_preference_scores(self, rows, query):
+        """
+        calculate_preference_score for every catalog row in `rows` at once,
+        using a preference_query(). Overlaps come from sparse multi-hot
+        matrix-vector products and range checks from array comparisons;
+        weights are added in the same order as the per-item version.
+        """
+        catalog = self.catalog
+        scores = np.zeros(len(rows))
+
+        if 'genre' in query and query['genre'] >= 0:
+            label_matches = self.genre_key_matrix[:, query['genre']].toarray().ravel()
+            scores += self.weights['genre'] * (label_matches[catalog.genre_label_ids[rows]] > 0)
+
+        if 'tags' in query:
+            scores += self._overlap_scores('tags', rows, *query['tags'])
+
+        if 'rating' in query:
+            min_rating, max_rating = query['rating']
+            ratings = catalog.numeric['rating'][rows]
+            scores += self.weights['rating'] * ((min_rating <= ratings) & (ratings <= max_rating))
+
+        if 'actors' in query:
+            scores += self._overlap_scores('actors', rows, *query['actors'])
+
+        if 'cost' in query:
+            scores += self.weights['cost'] * (catalog.numeric['cost'][rows] <= query['cost'])
+
+        return np.nan_to_num(scores, nan=0)
+
+    def _overlap_scores(self, name, rows, pref_keys, pref_count):
+        if not pref_count:
+            return 0.
+        key_matrix = self.key_matrices[name]
+        wanted = np.zeros(key_matrix.shape[1])
+        wanted[pref_keys[pref_keys >= 0]] = 1.
+        matching = key_matrix @ wanted
+        return self.weights[name] * matching[rows] / pref_count
+
+    def history_mask(self, user_history):
+        """
+        Boolean mask over the catalog rows marking what the user already has.
+
+        Accepts a precomputed mask, a collection of item ids, or (as before)
+        a list of item dicts.
+        """
+        if isinstance(user_history, np.ndarray) and user_history.dtype == bool:
+            return user_history
+
+        history_ids = [entry['id'] if isinstance(entry, dict) else entry for entry in user_history]
+        return np.isin(self.item_ids, np.fromiter(history_ids, dtype=np.int64, count=len(history_ids)))
+
+    def overall_scores(self, rows, user_preferences, cb_scores, collaborative_scores=None, profile_terms=None):
+        """Fuzzy-system input score of `rows`: preferences and content, then the personal blends."""
+        query = self.preference_query(user_preferences)
+        preference_scores = self.calculate_preference_scores(rows, query)
+
+        overall_scores = 0.7 * preference_scores + 0.3 * cb_scores
+        if collaborative_scores is not None:
+            overall_scores = (1 - CF_WEIGHT) * overall_scores + CF_WEIGHT * collaborative_scores[rows]
+        personal_scores = self.profile_scores(profile_terms) if profile_terms else None
+        if personal_scores is not None:
+            overall_scores = (1 - PROFILE_WEIGHT) * overall_scores + PROFILE_WEIGHT * personal_scores[rows]
+        return np.nan_to_num(overall_scores, nan=0.5)
+
+    def _prepare(self, user_preferences, user_history, collaborative_scores, profile_terms, timer):
+        """
+        Every stage of rank() before fuzzy inference, for one request.
+        Returns (outcome, rows, fuzzy inputs, log fields); outcome is None
+        when there are rows left to score.
+        """
+        with timer.stage('filter', items=len(self.catalog)):
+            available_rows = np.flatnonzero(~self.history_mask(() if user_history is None else user_history))
+
+        if not len(available_rows):
+            return 'no_candidates', None, None, {'available': 0}
+
+        with timer.stage('tfidf', items=len(available_rows)):
+            tfidf_matrix = self.tag_index.matrix[self.tag_rows[available_rows]]
+
+        if tfidf_matrix.nnz == 0:
+            return 'no_tags', None, None, {'available': len(available_rows)}
+
+        with timer.stage('cosine', items=len(available_rows)):
+            cb_scores = self.calculate_cb_scores(tfidf_matrix)
+
+        scorable = self.scorable[available_rows]
+        rows = available_rows[scorable]
+        fields = {'available': len(available_rows), 'unscorable': len(available_rows) - len(rows)}
+        if not len(rows):
+            return 'unscorable', None, None, fields
+
+        with timer.stage('preference', items=len(rows)):
+            overall_scores = self.overall_scores(
+                rows, user_preferences, cb_scores[scorable], collaborative_scores, profile_terms
+            )
+            return None, rows, self.fuzzy_inputs(rows, overall_scores), fields
+
+    def _compute_fuzzy(self, inputs):
+        """
+        fuzzy_engine.compute() in slices of at most FUZZY_BATCH_ROWS rows.
+        Inference is row by row, so slicing only bounds its working memory.
+        """
+        n_rows = len(next(iter(inputs.values())))
+        if n_rows <= FUZZY_BATCH_ROWS:
+            return self.fuzzy_engine.compute(**inputs)
+        return np.concatenate([
+            self.fuzzy_engine.compute(**{name: values[start:start + FUZZY_BATCH_ROWS] for name, values in inputs.items()})
+            for start in range(0, n_rows, FUZZY_BATCH_ROWS)
+        ])
+
+    def rank(self, user_preferences, user_history=None, collaborative_scores=None, profile_terms=None):
+        """
+        Score every candidate once; pages are then cut from the returned
+        Ranking. `collaborative_scores`, one 0..1 prediction per catalog row,
+        are blended into the content score with weight CF_WEIGHT, and
+        similarity to the user's rating profile with weight PROFILE_WEIGHT.
+        """
+        timer = StageTimer(self.name)
+        try:
+            outcome, rows, inputs, fields = self._prepare(
+                user_preferences, user_history, collaborative_scores, profile_terms, timer
+            )
+            if outcome is not None:
+                return self._traced(timer, Ranking.empty(self.catalog), outcome, **fields)
+
+            # NaN marks items no rule fired for
+            with timer.stage('fuzzy', items=len(rows)):
+                final_scores = self._compute_fuzzy(inputs)
+                fired = ~np.isnan(final_scores)
+
+            return self._traced(timer, Ranking(self.catalog, rows[fired], final_scores[fired]), 'ranked', **fields)
+
+        except Exception as e:
+            RANKINGS.inc(catalog=self.name, outcome='error')
+            log_event('recommend_failed', level=logging.ERROR, catalog=self.name, error=repr(e),
+                      stages_ms=timer.milliseconds())
+            return Ranking.empty(self.catalog)
+
+    def _traced(self, timer, ranking, outcome, **fields):
+        """Count a rank() outcome and write its sampled log line."""
+        RANKINGS.inc(catalog=self.name, outcome=outcome)
+        log_event('recommend', catalog=self.name, outcome=outcome, ranked=len(ranking),
+                  stages_ms=timer.milliseconds(), **fields)
+        return ranking
+
+    def rank_many(self, requests):
+        """
+        rank() for many (user_preferences, user_history, collaborative_scores,
+        profile_terms) requests; returns the same Rankings as calling rank()
+        on each. Every request goes through rank()'s own per-user stages, and
+        only fuzzy inference is shared: prepared requests are stacked until
+        they reach FUZZY_BATCH_ROWS rows, so memory stays bounded whatever
+        the number of requests.
+        """
+        rankings = [Ranking.empty(self.catalog) for _ in requests]
+        timer = StageTimer(self.name)
+        pending, pending_rows, ranked = [], 0, 0
+        for index, (user_preferences, user_history, collaborative_scores, profile_terms) in enumerate(requests):
+            try:
+                outcome, rows, inputs, _ = self._prepare(
+                    user_preferences, user_history, collaborative_scores, profile_terms, timer
+                )
+            except Exception as e:
+                RANKINGS.inc(catalog=self.name, outcome='error')
+                log_event('recommend_failed', level=logging.ERROR, catalog=self.name, request=index, error=repr(e))
+                continue
+            if outcome is not None:
+                RANKINGS.inc(catalog=self.name, outcome=outcome)
+                continue
+
+            pending.append((index, rows, inputs))
+            pending_rows += len(rows)
+            if pending_rows >= FUZZY_BATCH_ROWS:
+                ranked += self._rank_pending(pending, rankings, timer)
+                pending, pending_rows = [], 0
+        if pending:
+            ranked += self._rank_pending(pending, rankings, timer)
+
+        log_event('recommend_many', catalog=self.name, requests=len(requests), ranked=ranked,
+                  stages_ms=timer.milliseconds())
+        return rankings
+
+    def _rank_pending(self, pending, rankings, timer):
+        """One fuzzy pass over the stacked inputs of prepared (index, rows, inputs) requests."""
+        with timer.stage('fuzzy', items=sum(len(rows) for _, rows, _ in pending)):
+            inputs = {name: np.concatenate([fuzzy_inputs[name] for _, _, fuzzy_inputs in pending])
+                      for name in pending[0][2]}
+            final_scores = self._compute_fuzzy(inputs)
+        splits = np.cumsum([len(rows) for _, rows, _ in pending])[:-1]
+        for (index, rows, _), scores in zip(pending, np.split(final_scores, splits)):
+            fired = ~np.isnan(scores)
+            rankings[index] = Ranking(self.catalog, rows[fired], scores[fired])
+        RANKINGS.inc(len(pending), catalog=self.name, outcome='ranked')
+        return len(pending)
+
+    def recommend(self, user_preferences, user_history=None, k=10, offset=0):
+        return self.rank(user_preferences, user_history).page(offset, k)
+
 
 class MovieRecommender(BaseRecommender):
-    def __init__(self, items):
-        super().__init__(items)
+    name = 'movies'
+    fuzzy_fields = ('rating', 'popularity')
+
+    def __init__(self, items, tag_index=None, fuzzy_grid_resolution=None):
+        super().__init__(items, tag_index, fuzzy_grid_resolution)
         self.weights = {
             'genre': 0.27,
             'tags': 0.29,
@@ -29,6 +420,7 @@ class MovieRecommender(BaseRecommender):
             'actors': 0.20,
         }
         self.fuzzy_system = self._create_fuzzy_system()
+        self.fuzzy_engine = self._create_fuzzy_engine(self.fuzzy_system)
 
     def _create_fuzzy_system(self):
         overall_score = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'overall_score')
@@ -36,9 +428,9 @@ class MovieRecommender(BaseRecommender):
         pop = ctrl.Antecedent(np.arange(0, 1000000, 1000), 'popularity')
         recommendation = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'recommendation')
 
-        overall_score.automf(3)
+        overall_score.automf(names=['poor', 'average', 'high'])
         rating.automf(3)
-        pop.automf(3)
+        pop.automf(names=['low', 'average', 'high'])
 
         recommendation['poor'] = fuzz.trimf(recommendation.universe, [0, 0, 0.5])
         recommendation['average'] = fuzz.trimf(recommendation.universe, [0.3, 0.5, 0.7])
@@ -50,8 +442,7 @@ class MovieRecommender(BaseRecommender):
             ctrl.Rule(overall_score['poor'] & rating['poor'] & pop['low'], recommendation['poor']),
         ]
 
-        ranking_ctrl = ctrl.ControlSystem(rules)
-        return ctrl.ControlSystemSimulation(ranking_ctrl)
+        return ctrl.ControlSystem(rules)
 
     def calculate_preference_score(self, item, user_preferences):
         score = 0
@@ -83,65 +474,25 @@ class MovieRecommender(BaseRecommender):
 
         return np.nan_to_num(score, nan=0)  # Ensure score is not NaN
 
+    def fuzzy_inputs(self, rows, overall_scores):
+        rating = self.numeric('rating')[rows]
+        popularity = np.minimum(self.numeric('popularity')[rows], 1000000)
 
-    def recommend(self, user_preferences, user_history=None):
-        if user_history is None:
-            user_history = []
-
-        try:
-            available_items = [item for item in self.items if item not in user_history]
-            print(f"Filtered available items count: {len(available_items)}")
-
-            if not available_items:
-                print("No available items after filtering.")
-                return []
-
-            tfidf_vectorizer = TfidfVectorizer(tokenizer=lambda x: x, preprocessor=lambda x: x)
-            item_tags = [item.get('tags', []) for item in available_items if isinstance(item.get('tags', list))]
-
-            if not item_tags or all(len(tags) == 0 for tags in item_tags):
-                print("No valid tags for TF-IDF. Skipping similarity calculations.")
-                return []
-
-            tfidf_matrix = tfidf_vectorizer.fit_transform(item_tags)
-            print("TF-IDF matrix generated.")
-
-            scores = []
-            for idx, item in enumerate(available_items):
-                try:
-                    preference_score = self.calculate_preference_score(item, user_preferences)
-                    cb_score = self.calculate_cb_score(idx, tfidf_matrix)
-
-                    overall_score = 0.7 * preference_score + 0.3 * cb_score
-                    overall_score = np.nan_to_num(overall_score, nan=0.5)
-
-                    rating = float(item.get('rating', 0))
-                    popularity = float(min(item.get('popularity', 0), 1000000))
-
-                    self.fuzzy_system.input['overall_score'] = max(0, min(overall_score, 1))
-                    self.fuzzy_system.input['rating'] = max(0, min(rating, 10))
-                    self.fuzzy_system.input['popularity'] = max(0, min(popularity, 1000000))
-
-                    self.fuzzy_system.compute()
-                    final_score = float(self.fuzzy_system.output['recommendation'])
-                    final_score = np.nan_to_num(final_score, nan=0.5)
-
-                    scores.append((item, final_score))
-
-                except Exception as e:
-                    print(f"Error processing item {item.get('title', 'Unknown')}: {e}")
+        return {
+            'overall_score': np.clip(overall_scores, 0, 1),
+            'rating': np.clip(rating, 0, 10),
+            'popularity': np.clip(popularity, 0, 1000000),
+        }
 
-            ranked_items = sorted(scores, key=lambda x: x[1], reverse=True)
-            print(f"Final recommended count: {len(ranked_items)}")
-            return ranked_items[:10]
 
-        except Exception as e:
-            print(f"Critical error in recommendation process: {e}")
-            return []
+class GameRecommender(BaseRecommender):
+    name = 'games'
+    fuzzy_fields = ('rating', 'cost', 'popularity')
+    # The Steam dump has no prices, so seeded games carry no cost: treat it as 'moderate'
+    fuzzy_defaults = {'cost': 50.}
 
-class GameRecommender:
-    def __init__(self, items):
-        self.items = items
+    def __init__(self, items, tag_index=None, fuzzy_grid_resolution=None):
+        super().__init__(items, tag_index, fuzzy_grid_resolution)
         self.weights = {
             'genre': 0.21,
             'tags': 0.20,
@@ -150,31 +501,39 @@ class GameRecommender:
             'system_requirements': 0.21
         }
         self.fuzzy_system = self._create_fuzzy_system()
+        self.fuzzy_engine = self._create_fuzzy_engine(self.fuzzy_system)
 
     def _create_fuzzy_system(self):
-        rating = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'rating')
+        overall_score = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'overall_score')
+        # Seeded and uploaded games are rated on a 1-10 scale, like movies
+        rating = ctrl.Antecedent(np.arange(0, 10.1, 0.1), 'rating')
         cost = ctrl.Antecedent(np.arange(0, 100.1, 0.1), 'cost')
         popularity = ctrl.Antecedent(np.arange(0, 15000000, 100000), 'popularity')
         recommendation = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'recommendation')
 
-        rating.automf(3)  # low, medium, high
-        cost.automf(3)    # cheap, moderate, expensive
-        popularity.automf(3)  # low, medium, high
+        overall_score.automf(names=['poor', 'average', 'high'])
+        rating.automf(3)  # poor, average, good
+        cost.automf(names=['cheap', 'moderate', 'expensive'])
+        popularity.automf(names=['low', 'medium', 'high'])
 
         recommendation['poor'] = fuzz.trimf(recommendation.universe, [0, 0, 0.5])
         recommendation['average'] = fuzz.trimf(recommendation.universe, [0.3, 0.5, 0.7])
         recommendation['excellent'] = fuzz.trimf(recommendation.universe, [0.5, 1, 1])
 
         rules = [
+            # How well the game matches this user: preferences, content, ratings and profile
+            ctrl.Rule(overall_score['high'], recommendation['excellent']),
+            ctrl.Rule(overall_score['average'], recommendation['average']),
+            ctrl.Rule(overall_score['poor'], recommendation['poor']),
+            # How good a pick the game is for anyone
             ctrl.Rule(rating['good'] & cost['cheap'] & popularity['high'], recommendation['excellent']),
-            ctrl.Rule(rating['good'] & cost['moderate'] & popularity['medium'], recommendation['good']),
+            ctrl.Rule(rating['good'] & cost['moderate'] & popularity['medium'], recommendation['excellent']),
             ctrl.Rule(rating['poor'] & cost['expensive'] & popularity['low'], recommendation['poor']),
             ctrl.Rule(rating['average'] & cost['moderate'] & popularity['high'], recommendation['average']),
-            ctrl.Rule(rating['average'] & cost['cheap'] & popularity['medium'], recommendation['good']),
+            ctrl.Rule(rating['average'] & cost['cheap'] & popularity['medium'], recommendation['excellent']),
         ]
 
-        ranking_ctrl = ctrl.ControlSystem(rules)
-        return ctrl.ControlSystemSimulation(ranking_ctrl)
+        return ctrl.ControlSystem(rules)
 
     def calculate_preference_score(self, item, user_preferences):
         score = 0
@@ -208,65 +567,14 @@ class GameRecommender:
 
         return np.nan_to_num(score, nan=0)  # Ensure score is not NaN
 
-    def recommend(self, user_preferences, user_history=None):
-        if user_history is None:
-            user_history = []
-
-        try:
-            available_items = [item for item in self.items if item not in user_history]
-            print(f"Filtered available items count: {len(available_items)}")
-
-            if not available_items:
-                print("No available items after filtering.")
-                return []
-
-            tfidf_vectorizer = TfidfVectorizer(tokenizer=lambda x: x, preprocessor=lambda x: x)
-            item_tags = [item.get('tags', []) for item in available_items if isinstance(item.get('tags', list))]
-
-            if not item_tags or all(len(tags) == 0 for tags in item_tags):
-                print("No valid tags for TF-IDF. Skipping similarity calculations.")
-                return []
-
-            tfidf_matrix = tfidf_vectorizer.fit_transform(item_tags)
-            print("TF-IDF matrix generated.")
-
-            scores = []
-            for idx, item in enumerate(available_items):
-                try:
-                    preference_score = self.calculate_preference_score(item, user_preferences)
-                    cb_score = self.calculate_cb_score(idx, tfidf_matrix)
-
-                    overall_score = 0.7 * preference_score + 0.3 * cb_score
-                    overall_score = np.nan_to_num(overall_score, nan=0.5)
-
-                    rating = float(item.get('rating', 0))
-                    cost = float(item.get('cost', 0))
-                    popularity = float(min(item.get('popularity', 0), 15000000))
-
-                    self.fuzzy_system.input['rating'] = max(0, min(rating, 1))
-                    self.fuzzy_system.input['cost'] = max(0, min(cost, 100))
-                    self.fuzzy_system.input['popularity'] = max(0, min(popularity, 15000000))
-
-                    self.fuzzy_system.compute()
-                    final_score = float(self.fuzzy_system.output['recommendation'])
-                    final_score = np.nan_to_num(final_score, nan=0.5)
-
-                    scores.append((item, final_score))
-
-                except Exception as e:
-                    print(f"Error processing item {item.get('title', 'Unknown')}: {e}")
-
-            ranked_items = sorted(scores, key=lambda x: x[1], reverse=True)
-            print(f"Final recommended count: {len(ranked_items)}")
-            return ranked_items[:10]
-
-        except Exception as e:
-            print(f"Critical error in recommendation process: {e}")
-            return []
-
-    def calculate_cb_score(self, item_index, tfidf_matrix):
-        similarities = cosine_similarity(
-            tfidf_matrix[item_index], tfidf_matrix[:len(self.items)]
-        ).flatten()
-        return np.mean(similarities)
+    def fuzzy_inputs(self, rows, overall_scores):
+        rating = self.numeric('rating')[rows]
+        cost = np.nan_to_num(self.numeric('cost')[rows], nan=self.fuzzy_defaults['cost'])
+        popularity = np.minimum(self.numeric('popularity')[rows], 15000000)
 
+        return {
+            'overall_score': np.clip(overall_scores, 0, 1),
+            'rating': np.clip(rating, 0, 10),
+            'cost': np.clip(cost, 0, 100),
+            'popularity': np.clip(popularity, 0, 15000000),
+        }
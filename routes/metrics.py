@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage, query and request histograms in the Prometheus text format: all workers with METRICS_DIR, else this one."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,8 +1,16 @@
-from sqlalchemy.sql import func  # Import func for random ordering
 from flask import Blueprint, request, jsonify
 from models import db, UserMovieRating, UserGameRating, Movie, Game
+from cache import result_cache
+from catalog import movie_catalog, game_catalog
+from batch import discard_stored_recommendations
+from metrics import timed_query
+from profiles import update_user_profile
+from routes.recommend import integer_id
+from upsert import bulk_upsert
 ratings_bp = Blueprint('ratings', __name__)
 
+MAX_INITIAL_ITEMS = 50
+
 
 # Batch rate movies
 
@@ -11,53 +19,157 @@ ratings_bp = Blueprint('ratings', __name__)
 def get_initial_items(type):
     try:
         if type == 'movie':
-            items = Movie.query.order_by(func.random()).limit(
-                5).all()  # Fetch 5 random movies
+            catalog = movie_catalog
         elif type == 'game':
-            items = Game.query.order_by(func.random()).limit(
-                5).all()  # Fetch 5 random games
+            catalog = game_catalog
         else:
             return jsonify({"error": "Invalid type"}), 400
 
-        return jsonify([item.to_dict() for item in items])
+        count = min(request.args.get('count', 5, type=int), MAX_INITIAL_ITEMS)
+        stratify = request.args.get('stratify', 'true').lower() != 'false'
+        # Spread across genres and popularity so the onboarding set stays diverse
+        return jsonify(catalog.sample(max(count, 0), stratify=stratify))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@ratings_bp.route('/rate/movies', methods=['POST'])
-def rate_movies():
-    data = request.get_json()
+def validate_ratings(ratings, item_key):
+    """
+    Split a ratings batch into (item_id, rating) pairs and rejected entries.
+    Ids sent as numeric strings are accepted. A later entry for the same
+    item replaces an earlier one.
+    """
+    accepted = {}
+    rejected = []
+    for index, rating_data in enumerate(ratings):
+        if not isinstance(rating_data, dict):
+            rejected.append({"index": index, "entry": rating_data, "error": "Rating must be an object"})
+            continue
+
+        item_id = integer_id(rating_data.get(item_key))
+        rating = rating_data.get('rating')
+
+        if item_id is None or item_id <= 0:
+            rejected.append({"index": index, "entry": rating_data, "error": f"{item_key} must be a positive integer"})
+        elif not isinstance(rating, (int, float)) or isinstance(rating, bool):
+            rejected.append({"index": index, "entry": rating_data, "error": "rating must be a number"})
+        else:
+            accepted.pop(item_id, None)
+            accepted[item_id] = (index, rating_data, float(rating))
+    return accepted, rejected
+
+
+def save_ratings(catalog, rating_model, item_model, item_key, user_id, ratings):
+    """
+    Validate a ratings batch once, then write it with a single upsert and
+    fold it into the user's profile in the same commit.
+    Returns (accepted, rejected) lists for the response.
+    """
+    accepted, rejected = validate_ratings(ratings, item_key)
+
+    known_ids = set()
+    if accepted:
+        with timed_query('known_items'):
+            rows = db.session.query(item_model.id).filter(item_model.id.in_(list(accepted)))
+            known_ids = {item_id for (item_id,) in rows}
+    reject_unknown(accepted, rejected, known_ids, item_key)
+
+    item_column = getattr(rating_model, item_key)
+    previous = {}
+    if accepted:
+        with timed_query('previous_ratings'):
+            previous = dict(db.session.query(item_column, rating_model.rating).filter(
+                rating_model.user_id == user_id, item_column.in_(list(accepted))
+            ).all())
+
+    with timed_query('upsert_ratings'):
+        bulk_upsert(
+            rating_model,
+            [{'user_id': user_id, item_key: item_id, 'rating': rating} for item_id, (_, _, rating) in accepted.items()],
+            ['user_id', item_key],
+            ['rating'],
+        )
+    if accepted:
+        changes = [(item_id, previous.get(item_id), rating) for item_id, (_, _, rating) in accepted.items()]
+        item_catalog = catalog.recommender().catalog
+        with timed_query('update_profile'):
+            update_user_profile(catalog.name, item_catalog, user_id, changes, lambda: catalog.user_ratings(user_id))
+        with timed_query('discard_stored'):
+            discard_stored_recommendations(catalog.name, user_id)
+    with timed_query('commit'):
+        db.session.commit()
+
+    return rating_results(accepted, rejected, item_key)
+
+
+def reject_unknown(accepted, rejected, known_ids, item_key):
+    """Move accepted entries for items that don't exist to `rejected`."""
+    for item_id in [item_id for item_id in accepted if item_id not in known_ids]:
+        index, rating_data, _ = accepted.pop(item_id)
+        rejected.append({"index": index, "entry": rating_data, "error": f"Unknown {item_key}"})
+
+
+def rating_results(accepted, rejected, item_key):
+    """(accepted, rejected) lists for the response."""
+    rejected.sort(key=lambda entry: entry["index"])
+    return [{item_key: item_id, "rating": rating} for item_id, (_, _, rating) in accepted.items()], rejected
+
+
+def parsed_ratings(user_id, ratings):
+    """The parsers' result, with user_id converted the way /recommend converts it."""
+    user_id = integer_id(user_id)
+    if user_id is None:
+        return None, ({"error": "user_id must be an integer"}, 400)
+    return (user_id, ratings), None
+
+
+def parse_movie_ratings(data):
+    """((user_id, ratings), None) from a /rate/movies body, or (None, (error body, status))."""
     if not data:
-        return jsonify({"error": "Request body must be JSON"}), 400
+        return None, ({"error": "Request body must be JSON"}, 400)
 
     user_id = data.get('user_id')
     ratings = data.get('ratings')
 
     if not user_id:
-        return jsonify({"error": "User ID is required"}), 400
+        return None, ({"error": "User ID is required"}, 400)
 
     if not isinstance(ratings, list):
-        return jsonify({"error": "Ratings should be a list"}), 400
+        return None, ({"error": "Ratings should be a list"}, 400)
+    return parsed_ratings(user_id, ratings)
 
-    for rating_data in ratings:
-        movie_id = rating_data.get('movie_id')
-        rating = rating_data.get('rating')
 
-        if not movie_id or not isinstance(rating, (int, float)):
-            continue  # Skip invalid entries and log if necessary
+def parse_game_ratings(data):
+    """((user_id, ratings), None) from a /rate/games body, or (None, (error body, status))."""
+    user_id = data.get('user_id')
+    ratings = data.get('ratings')  # Expecting a list of game ratings
 
-        existing_rating = UserMovieRating.query.filter_by(
-            user_id=user_id, movie_id=movie_id).first()
+    if not user_id or not ratings:
+        return None, ({"error": "User ID and ratings are required"}, 400)
 
-        if existing_rating:
-            existing_rating.rating = rating
-        else:
-            new_rating = UserMovieRating(
-                user_id=user_id, movie_id=movie_id, rating=rating)
-            db.session.add(new_rating)
+    if not isinstance(ratings, list):
+        return None, ({"error": "Ratings should be a list"}, 400)
+    return parsed_ratings(user_id, ratings)
 
-    db.session.commit()
-    return jsonify({"message": "Movie ratings submitted successfully"}), 201
+
+def ratings_response(label, accepted, rejected):
+    return {
+        "message": f"{label} ratings submitted successfully",
+        "accepted": accepted,
+        "rejected": rejected
+    }
+
+
+@ratings_bp.route('/rate/movies', methods=['POST'])
+def rate_movies():
+    parsed, error = parse_movie_ratings(request.get_json())
+    if error:
+        return jsonify(error[0]), error[1]
+    user_id, ratings = parsed
+
+    accepted, rejected = save_ratings(movie_catalog, UserMovieRating, Movie, 'movie_id', user_id, ratings)
+    result_cache.invalidate_user('movies', user_id)
+    return jsonify(ratings_response("Movie", accepted, rejected)), 201
 
 
 # Batch rate games
@@ -68,29 +180,11 @@ def rate_games():
     """
     Allows a user to submit multiple game ratings in one request.
     """
-    data = request.get_json()
-    user_id = data.get('user_id')
-    ratings = data.get('ratings')  # Expecting a list of game ratings
-
-    if not user_id or not ratings:
-        return jsonify({"error": "User ID and ratings are required"}), 400
-
-    for rating_data in ratings:
-        game_id = rating_data.get('game_id')
-        rating = rating_data.get('rating')
-
-        if not game_id or not rating:
-            continue  # Skip invalid entries
-
-        existing_rating = UserGameRating.query.filter_by(
-            user_id=user_id, game_id=game_id).first()
-        if existing_rating:
-            existing_rating.rating = rating  # Update existing rating
-        else:
-            new_rating = UserGameRating(
-                user_id=user_id, game_id=game_id, rating=rating)
-            db.session.add(new_rating)
-
-    db.session.commit()
-
-    return jsonify({"message": "Game ratings submitted successfully"}), 201
+    parsed, error = parse_game_ratings(request.get_json())
+    if error:
+        return jsonify(error[0]), error[1]
+    user_id, ratings = parsed
+
+    accepted, rejected = save_ratings(game_catalog, UserGameRating, Game, 'game_id', user_id, ratings)
+    result_cache.invalidate_user('games', user_id)
+    return jsonify(ratings_response("Game", accepted, rejected)), 201
@@ -1,70 +1,274 @@
+import numpy as np
 from flask import Blueprint, request, jsonify
-from models import Movie, Game, UserMovieRating
+from batch import recommend_batch, save_batch, stored_recommendations, version_key
+from cache import result_cache
+from catalog import movie_catalog, game_catalog
+from metrics import StageTimer, timed_query
+from models import db
+from profiles import rating_revision, user_profile_terms
+from recommender import Ranking
 
 recommend_bp = Blueprint('recommend', __name__)
 
+MAX_PAGE_SIZE = 100
+MAX_BATCH_REQUESTS = 1000
+CATALOGS = {'movies': movie_catalog, 'games': game_catalog}
+
+
+def items_with_scores(item_catalog, item_ids, scores):
+    """Item dicts with their scores, skipping ids the in-memory catalog no longer has."""
+    rows = item_catalog.rows_for(item_ids)
+    return [dict(item_catalog.item(row), score=score) for row, score in zip(rows.tolist(), scores) if row >= 0]
+
+
+def stored_page(catalog, user_id, preferences, offset, k):
+    """A response page cut from a precomputed list, or None if it is missing, stale or too short."""
+    with timed_query('stored_recommendations'):
+        stored = stored_recommendations(catalog, user_id, preferences)
+    return page_from_stored(catalog, stored, offset, k)
+
+
+def page_from_stored(catalog, stored, offset, k):
+    if stored is None:
+        return None
+    items, total = stored
+    if offset + k > len(items) and len(items) < total:
+        return None
+
+    page = items[offset:offset + k]
+    recommendations = items_with_scores(
+        catalog.recommender().catalog, [item_id for item_id, _ in page], [score for _, score in page]
+    )
+    if len(recommendations) < len(page):
+        return None
+    next_offset = offset + len(recommendations)
+    return {
+        "recommendations": recommendations,
+        "total_recommendations": len(recommendations),
+        "next_offset": next_offset if next_offset < total else None
+    }
+
+
+def integer_id(value):
+    """
+    An id from a JSON body as an int, so both servers bind it the same way.
+    Numeric strings are converted as the old handlers let the database do;
+    anything else gives None.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_recommend_request(data):
+    """(parameters, None) from a /recommend/<catalog> body, or (None, (error body, status))."""
+    user_id = data.get('user_id')
+    preferences = data.get('preferences') or {}  # Includes genre, rating range, tags
+    filters = data.get('filters')  # Optional hard genre/tags/rating filters
+
+    if not user_id:
+        return None, ({"error": "user_id is required"}, 400)
+    user_id = integer_id(user_id)
+    if user_id is None:
+        return None, ({"error": "user_id must be an integer"}, 400)
+
+    try:
+        k = int(data.get('k', 10))
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        return None, ({"error": "k and offset must be integers"}, 400)
+
+    if not 1 <= k <= MAX_PAGE_SIZE or offset < 0:
+        return None, ({"error": f"k must be between 1 and {MAX_PAGE_SIZE} and offset must not be negative"}, 400)
+
+    if filters is not None and not isinstance(filters, dict):
+        return None, ({"error": "filters must be an object"}, 400)
+
+    return {'user_id': user_id, 'preferences': preferences, 'filters': filters, 'k': k, 'offset': offset}, None
+
+
+def cache_key(preferences, filters):
+    return dict(preferences, filters=filters) if filters else preferences
+
+
+def cache_version(catalog, user_id):
+    """Result cache version: the catalog's, plus the user's rating revision so a rating in any worker misses."""
+    with timed_query('rating_revision'):
+        return catalog.version, rating_revision(catalog.name, user_id)
+
+
+def ranking_page(catalog_name, ranking, offset, k):
+    with StageTimer(catalog_name).stage('sort', items=len(ranking)):
+        page = ranking.page(offset, k)
+    recommendations = [dict(item, score=score) for item, score in page]
+    next_offset = offset + len(recommendations)
+    return {
+        "recommendations": recommendations,
+        "total_recommendations": len(recommendations),
+        "next_offset": next_offset if next_offset < len(ranking) else None
+    }
+
+
+def recommend_from_catalog(catalog):
+    parsed, error = parse_recommend_request(request.get_json())
+    if error:
+        return jsonify(error[0]), error[1]
+    user_id, preferences, filters = parsed['user_id'], parsed['preferences'], parsed['filters']
+    k, offset = parsed['k'], parsed['offset']
+
+    recommender = catalog.recommender()
+    key = cache_key(preferences, filters)
+    version = cache_version(catalog, user_id)
+
+    # Repeat and "load more" requests page through the cached ranking
+    cached = result_cache.get(catalog.name, user_id, key, version)
+    if cached is not None:
+        ranking = Ranking(recommender.catalog, *cached)
+    else:
+        # Lists written by the precompute job are served as they are
+        stored = None if filters else stored_page(catalog, user_id, preferences, offset, k)
+        if stored is not None:
+            return jsonify(stored)
+
+        with timed_query('user_ratings'):
+            ratings = catalog.user_ratings(user_id)
+        history = set(ratings)
+        if filters:
+            with timed_query('candidate_ids'):
+                candidates = np.fromiter(catalog.candidate_ids(filters), dtype=np.int64)
+            history = recommender.history_mask(history) | ~np.isin(recommender.item_ids, candidates)
+        profile_terms = None
+        if ratings:
+            with timed_query('user_profile'):
+                profile_terms = user_profile_terms(catalog.name, user_id)
+        ranking = recommender.rank(
+            preferences, history,
+            collaborative_scores=catalog.collaborative_scores(ratings, recommender.catalog),
+            profile_terms=profile_terms,
+        )
+        result_cache.set(catalog.name, user_id, key, version, (ranking.rows, ranking.scores))
+
+    return jsonify(ranking_page(catalog.name, ranking, offset, k))
+
+
+def similar_from_catalog(catalog, item_id):
+    k = request.args.get('k', 10, type=int)
+    if not 1 <= k <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"k must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    similar = catalog.similar(item_id, k)
+    if similar is None:
+        return jsonify({"error": "Item not found"}), 404
+
+    recommendations = [dict(item, score=score) for item, score in similar]
+    return jsonify({
+        "item_id": item_id,
+        "recommendations": recommendations,
+        "total_recommendations": len(recommendations)
+    })
+
+
+@recommend_bp.route('/batch', methods=['POST'])
+def recommend_batch_route():
+    """
+    Top-k lists for many (user_id, preferences) pairs against one shared
+    catalog pass. With "store": true they are also written to
+    user_recommendations for the per-user routes to serve.
+    """
+    try:
+        data = request.get_json() or {}
+        catalog = CATALOGS.get(data.get('catalog'))
+        if catalog is None:
+            return jsonify({"error": "catalog must be 'movies' or 'games'"}), 400
+
+        entries = data.get('requests')
+        if not isinstance(entries, list) or not 1 <= len(entries) <= MAX_BATCH_REQUESTS:
+            return jsonify({"error": f"requests must be a list of 1 to {MAX_BATCH_REQUESTS} entries"}), 400
+
+        try:
+            k = int(data.get('k', 10))
+        except (TypeError, ValueError):
+            return jsonify({"error": "k must be an integer"}), 400
+        if not 1 <= k <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"k must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+        pairs = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get('user_id'):
+                return jsonify({"error": "every request needs a user_id"}), 400
+            user_id = integer_id(entry['user_id'])
+            if user_id is None:
+                return jsonify({"error": "user_id must be an integer"}), 400
+            preferences = entry.get('preferences') or {}
+            if not isinstance(preferences, dict):
+                return jsonify({"error": "preferences must be an object"}), 400
+            pairs.append((user_id, preferences))
+
+        store = bool(data.get('store', False))
+        item_catalog = catalog.recommender().catalog
+        version = version_key(catalog)
+        results = []
+        for chunk, chunk_results in recommend_batch(catalog, pairs, k):
+            if store:
+                save_batch(catalog, version, chunk, chunk_results)
+            for (user_id, _, _, _), (item_ids, scores, _) in zip(chunk, chunk_results):
+                recommendations = items_with_scores(item_catalog, item_ids, scores)
+                results.append({
+                    "user_id": user_id,
+                    "recommendations": recommendations,
+                    "total_recommendations": len(recommendations)
+                })
+        if store:
+            with timed_query('commit'):
+                db.session.commit()
+        return jsonify({"results": results})
+    except Exception as e:
+        print(f"Error in recommend_batch: {e}")
+        db.session.rollback()
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@recommend_bp.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
 @recommend_bp.route('/movies', methods=['POST'])
 def recommend_movies():
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
-        preferences = data.get('preferences')  # Includes genre, rating range, tags
-
-        if not user_id:
-            return jsonify({"error": "user_id is required"}), 400
-
-        # Example recommendation logic based on user's preferences
-        query = Movie.query
-        if preferences.get('genre'):
-            query = query.filter(Movie.genre.ilike(f"%{preferences['genre']}%"))
-        if preferences.get('rating'):
-            query = query.filter(
-                Movie.rating >= preferences['rating']['min'],
-                Movie.rating <= preferences['rating']['max']
-            )
-        if preferences.get('tags'):
-            tags = preferences['tags']
-            query = query.filter(Movie.tags.any(lambda t: t.name.in_(tags)))  # Example for tag filtering
-
-        recommendations = [movie.to_dict() for movie in query.limit(10).all()]  # Limit results to 10
-
-        return jsonify({
-            "recommendations": recommendations,
-            "total_recommendations": len(recommendations)
-        })
+        return recommend_from_catalog(movie_catalog)
     except Exception as e:
         print(f"Error in recommend_movies: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+
 @recommend_bp.route('/games', methods=['POST'])
 def recommend_games():
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
-        preferences = data.get('preferences')  # Includes genre, rating range, tags
-
-        if not user_id:
-            return jsonify({"error": "user_id is required"}), 400
-
-        # Example recommendation logic for games
-        query = Game.query
-        if preferences.get('genre'):
-            query = query.filter(Game.genre.ilike(f"%{preferences['genre']}%"))
-        if preferences.get('rating'):
-            query = query.filter(
-                Game.rating >= preferences['rating']['min'],
-                Game.rating <= preferences['rating']['max']
-            )
-        if preferences.get('tags'):
-            tags = preferences['tags']
-            query = query.filter(Game.tags.any(lambda t: t.name.in_(tags)))  # Example for tag filtering
-
-        recommendations = [game.to_dict() for game in query.limit(10).all()]  # Limit results to 10
-
-        return jsonify({
-            "recommendations": recommendations,
-            "total_recommendations": len(recommendations)
-        })
+        return recommend_from_catalog(game_catalog)
     except Exception as e:
         print(f"Error in recommend_games: {e}")
         return jsonify({"error": "Internal server error"}), 500
+
+
+@recommend_bp.route('/movies/<int:item_id>/similar', methods=['GET'])
+def similar_movies(item_id):
+    try:
+        return similar_from_catalog(movie_catalog, item_id)
+    except Exception as e:
+        print(f"Error in similar_movies: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@recommend_bp.route('/games/<int:item_id>/similar', methods=['GET'])
+def similar_games(item_id):
+    try:
+        return similar_from_catalog(game_catalog, item_id)
+    except Exception as e:
+        print(f"Error in similar_games: {e}")
+        return jsonify({"error": "Internal server error"}), 500
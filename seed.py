@@ -1,121 +1,238 @@
+import csv
+import io
+import os
+import time
+
+import click
+import numpy as np
 import pandas as pd
-from models import db,  Movie, Game
+from flask.cli import with_appcontext
+from models import db,  Movie, Game, CatalogVersion
+from tag_index import rebuild_tag_indexes
+from catalog_terms import sync_catalog_terms
+from merger import MERGED_FILE, read_chunks
+from snapshot import has_snapshot
+
+MOVIES_CSV = os.getenv('MOVIES_CSV', 'data/imdb_top_1000.csv')
+# Where merger.py writes by default; CSV and Parquet are both read in chunks
+GAMES_CSV = os.getenv('GAMES_CSV', MERGED_FILE)
+# Rows read, converted and committed at a time; bounds the seeder's memory
+SEED_CHUNK_SIZE = int(os.getenv('SEED_CHUNK_SIZE', '5000'))
 
-def seed_games_and_movies():
-    seed_movies()
-    seed_games()
+
+def seed_games_and_movies(chunk_size=SEED_CHUNK_SIZE):
+    changed = seed_movies(chunk_size) + seed_games(chunk_size)
+    if changed or not (has_snapshot('movies') and has_snapshot('games')):
+        rebuild_tag_indexes()
 
     print(Game.query.count())
     print(Movie.query.count())
 
-def seed_movies():
-    print("Loading movies data...")
-    try:
-        # Load the CSV file and select only the necessary columns
-        movies_data = pd.read_csv('data/imdb_top_1000.csv', usecols=[
-            'Series_Title', 'Genre', 'IMDB_Rating', 'Overview',
-            'Star1', 'Star2', 'Star3', 'Star4', 'No_of_Votes'
-        ])
-
-        # Rename columns and combine stars into 'actors'
-        movies_data = movies_data.rename(columns={
-            'Series_Title': 'title',
-            'Genre': 'genre',
-            'IMDB_Rating': 'rating',
-            'Overview': 'tags',
-            'No_of_Votes': 'popularity'
-        })
-
-        movies_data['actors'] = movies_data[['Star1', 'Star2',
-                                             'Star3', 'Star4']].apply(lambda x: ', '.join(x), axis=1)
-        movies_data = movies_data.drop(
-            columns=['Star1', 'Star2', 'Star3', 'Star4'])
-
-        # Create Movie objects
-        movies = [
-            Movie(
-                title=row['title'][:255],
-                genre=row['genre'][:255],
-                tags=row['tags'][:500],
-                rating=row['rating'],
-                # Ensure actors fit into a reasonable column length
-                actors=row['actors'][:500],
-                popularity=row['popularity']
-            )
-            for _, row in movies_data.iterrows()
-        ]
-
-        # Insert into the database
-        db.session.bulk_save_objects(movies)
-        print("Movies data loaded successfully!")
-    except Exception as e:
-        print(f"Error seeding movies: {e}")
-        db.session.rollback()
 
-def seed_games():
-    print("Loading games data...")
-    try:
-        # Load the CSV file and select only the necessary columns
-        games_data = pd.read_csv('data/merged_steam_data.csv', usecols=[
-            'name', 'categories', 'genres', 
-            'positive_ratings', 'negative_ratings', 'owners'
-        ])
-        
-        # Rename columns to match the database schema
-        games_data = games_data.rename(columns={
-            'name': 'title',
-            'categories': 'tags',
-            'genres': 'genre'
-        })
-
-        # Calculate the normalized rating on a scale of 1 to 10
-        games_data['rating'] = games_data.apply(
-            lambda row: calculate_game_rating(row['positive_ratings'], row['negative_ratings']), axis=1
+def insert_rows(model, frame):
+    """
+    Insert a chunk of rows with PostgreSQL COPY, or one Core executemany
+    INSERT on other databases. Missing values become NULL.
+    """
+    columns = list(frame.columns)
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
         )
+        return
+
+    connection.execute(model.__table__.insert(), records(frame))
+
+
+def records(frame):
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def content_hashes(frame):
+    """Stable 64-bit hash of each row's values, independent of the chunk's dtypes."""
+    normalized = pd.DataFrame({
+        column: values.astype(np.float64) if pd.api.types.is_numeric_dtype(values)
+        else values.fillna('').astype(str)
+        for column, values in frame.items()
+    })
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy().view(np.int64)
+
+
+def ingest_rows(model, frame):
+    """
+    Insert the rows of `frame` whose source_key is new and update the ones
+    whose content hash changed; unchanged rows are not written. Rows seeded
+    before source keys existed are matched by title and adopted.
+    Returns (inserted, updated, unchanged) counts. Does not commit.
+    """
+    frame = frame.drop_duplicates('source_key', keep='last').copy()
+    frame['content_hash'] = content_hashes(frame.drop(columns='source_key'))
+
+    existing = {
+        source_key: (item_id, content_hash)
+        for source_key, item_id, content_hash in db.session.query(
+            model.source_key, model.id, model.content_hash
+        ).filter(model.source_key.in_(frame['source_key'].tolist()))
+    }
+    known = frame['source_key'].isin(list(existing))
+    new = frame[~known]
+
+    # Titles can repeat; legacy rows were inserted in CSV order, so match them up by id
+    legacy = {}
+    if len(new):
+        for title, item_id in (
+            db.session.query(model.title, model.id)
+            .filter(model.source_key.is_(None), model.title.in_(new['title'].unique().tolist()))
+            .order_by(model.id)
+        ):
+            legacy.setdefault(title, []).append(item_id)
+
+    updates = []
+    for row in records(frame[known]):
+        item_id, content_hash = existing[row['source_key']]
+        if content_hash != row['content_hash']:
+            updates.append(dict(row, id=item_id))
+
+    inserts = []
+    for position, row in enumerate(records(new)):
+        item_ids = legacy.get(row['title'])
+        item_id = item_ids.pop(0) if item_ids else None
+        if item_id is None:
+            inserts.append(position)
+        else:
+            updates.append(dict(row, id=item_id))
+
+    if inserts:
+        insert_rows(model, new.iloc[inserts])
+    if updates:
+        db.session.bulk_update_mappings(model, updates)
+
+    changed_ids = [row['id'] for row in updates]
+    if inserts:
+        inserted_keys = new['source_key'].iloc[inserts].tolist()
+        changed_ids.extend(
+            item_id for (item_id,) in db.session.query(model.id).filter(model.source_key.in_(inserted_keys))
+        )
+    if changed_ids:
+        sync_catalog_terms(model, changed_ids)
 
-        # Parse owners range and calculate the average for popularity
-        games_data['popularity'] = games_data['owners'].apply(parse_average_owners)
-
-        print("Preview of games to be inserted:")
-        print(games_data[['title', 'genre', 'rating', 'popularity']].head())  # Preview the data
-
-        games = [
-            Game(
-                title=row['title'][:255],
-                genre=row['genre'][:255] if pd.notna(row['genre']) else '',
-                tags=row['tags'][:500] if pd.notna(row['tags']) else '',
-                rating=row['rating'],
-                popularity=row['popularity']  # Average of owners range
-            )
-            for _, row in games_data.iterrows()
-        ]
+    return len(inserts), len(updates), len(frame) - len(inserts) - len(updates)
 
-        db.session.bulk_save_objects(games)
-        db.session.commit()
-        print("Games data loaded successfully!")
 
+def seed_csv(name, model, path, columns, convert, chunk_size):
+    """
+    Stream `path` in chunks through `convert` and ingest each chunk
+    incrementally, committing it together with a catalog version bump when
+    anything changed. Returns the number of inserted or updated rows.
+    """
+    print(f"Loading {name} data from {path}...")
+    start = time.perf_counter()
+    total = inserted = updated = 0
+    try:
+        for chunk in read_chunks(path, columns, chunk_size):
+            chunk_inserted, chunk_updated, _ = ingest_rows(model, convert(chunk))
+            if chunk_inserted or chunk_updated:
+                CatalogVersion.bump(name)
+            db.session.commit()
+            total += len(chunk)
+            inserted += chunk_inserted
+            updated += chunk_updated
+            elapsed = time.perf_counter() - start
+            print(f"  {name}: {total} rows, {inserted} new, {updated} changed ({total / elapsed:.0f} rows/s)")
+        print(f"{name.capitalize()} data loaded successfully! "
+              f"{total} rows in {time.perf_counter() - start:.1f}s")
     except Exception as e:
-        print(f"Error seeding games: {e}")
+        print(f"Error seeding {name} after {total} rows: {e}")
         db.session.rollback()
+    return inserted + updated
+
+
+def convert_movies(chunk):
+    # Combine stars into 'actors'
+    actors = chunk['Star1'].fillna('').str.cat(
+        chunk[['Star2', 'Star3', 'Star4']].fillna(''), sep=', ')
+    return pd.DataFrame({
+        'source_key': ('imdb:' + chunk['Series_Title'] + ':' + chunk['Released_Year'].astype(str)).str[:600],
+        'title': chunk['Series_Title'].str[:255],
+        'genre': chunk['Genre'].str[:255],
+        'tags': chunk['Overview'].str[:500],
+        'rating': chunk['IMDB_Rating'],
+        # Ensure actors fit into a reasonable column length
+        'actors': actors.str[:500],
+        'popularity': chunk['No_of_Votes'],
+    })
+
+
+def seed_movies(chunk_size=SEED_CHUNK_SIZE):
+    return seed_csv('movies', Movie, MOVIES_CSV, [
+        'Series_Title', 'Released_Year', 'Genre', 'IMDB_Rating', 'Overview',
+        'Star1', 'Star2', 'Star3', 'Star4', 'No_of_Votes'
+    ], convert_movies, chunk_size)
+
+
+def convert_games(chunk):
+    return pd.DataFrame({
+        'source_key': 'steam:' + chunk['appid'].astype(str),
+        'title': chunk['name'].str[:255],
+        'genre': chunk['genres'].fillna('').str[:255],
+        'tags': chunk['categories'].fillna('').str[:500],
+        'rating': calculate_game_rating(chunk['positive_ratings'], chunk['negative_ratings']),
+        'popularity': parse_average_owners(chunk['owners']),  # Average of owners range
+    })
+
+
+def seed_games(chunk_size=SEED_CHUNK_SIZE):
+    return seed_csv('games', Game, GAMES_CSV, [
+        'appid', 'name', 'categories', 'genres',
+        'positive_ratings', 'negative_ratings', 'owners'
+    ], convert_games, chunk_size)
 
 
 def calculate_game_rating(positive_ratings, negative_ratings):
-    """Calculate a normalized rating on a scale of 1 to 10."""
-    total_ratings = positive_ratings + negative_ratings
+    """Normalized ratings on a scale of 1 to 10, for scalars or whole columns."""
+    positive_ratings = np.asarray(positive_ratings, dtype=np.float64)
+    total_ratings = positive_ratings + np.asarray(negative_ratings, dtype=np.float64)
 
-    if total_ratings == 0:
-        return 5.0  # Default neutral rating if no ratings exist
-
-    normalized_rating = positive_ratings / total_ratings
-    return round(1 + 9 * normalized_rating, 1)  # Scale to 1-10 range
+    # Default neutral rating if no ratings exist
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normalized_rating = positive_ratings / total_ratings
+    return np.where(total_ratings == 0, 5.0, np.round(1 + 9 * normalized_rating, 1))  # Scale to 1-10 range
 
 
 def parse_average_owners(owners_range):
-    """Parse the owners range and calculate the average."""
-    try:
-        # Owners range format: "100,000 .. 200,000"
-        min_owners, max_owners = map(lambda x: int(x.replace(',', '').strip()), owners_range.split('..'))
-        return (min_owners + max_owners) // 2  # Calculate the average
-    except Exception as e:
-        print(f"Error parsing owners range '{owners_range}': {e}")
-        return 0  # Default popularity if parsing fails
+    """Average of "100,000 .. 200,000" style owners ranges; 0 where unparseable."""
+    owners_range = pd.Series(owners_range, dtype=object)
+    bounds = (
+        owners_range.astype(str)
+        .str.replace(',', '', regex=False)
+        .str.split('..', n=1, expand=True, regex=False)
+    )
+    if bounds.shape[1] < 2:
+        bounds[1] = None
+    min_owners = pd.to_numeric(bounds[0].str.strip(), errors='coerce')
+    max_owners = pd.to_numeric(bounds[1].str.strip(), errors='coerce')
+
+    average = (min_owners + max_owners) // 2
+    invalid = average.isna()
+    if invalid.any():
+        print(f"Could not parse {int(invalid.sum())} owners ranges, e.g. '{owners_range[invalid].iloc[0]}'")
+    return average.fillna(0).astype(np.int64).to_numpy()  # Default popularity if parsing fails
+
+
+@click.command('seed')
+@click.option('--reset', is_flag=True, help='Drop and recreate all tables first, deleting user ratings.')
+@click.option('--chunk-size', default=SEED_CHUNK_SIZE, show_default=True, help='Rows per insert and commit.')
+@with_appcontext
+def seed_command(reset, chunk_size):
+    """Load new and changed movies and games from their CSV files."""
+    if reset:
+        db.drop_all()
+        db.create_all()
+        print("Database tables recreated!")
+    seed_games_and_movies(chunk_size)
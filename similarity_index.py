@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+# Hash tables and hyperplanes per table; more tables raise recall, more bits shrink buckets.
+# Tuned for recall@10 >= 0.95 against exact search (`python benchmark.py similar`).
+SIMILAR_TABLES = int(os.getenv('SIMILAR_TABLES', '64'))
+SIMILAR_BITS = int(os.getenv('SIMILAR_BITS', '6'))
+# Catalogs smaller than this are searched exactly through the tag posting lists,
+# which is faster than LSH at the sizes benchmarked so far
+SIMILAR_LSH_MIN_ITEMS = int(os.getenv('SIMILAR_LSH_MIN_ITEMS', '1000000'))
+
+
+class TagLSH:
+    """
+    Random-projection LSH over the catalog TF-IDF tag vectors, for cosine
+    "more like this" queries without scoring every item.
+
+    Each of n_tables tables hashes a vector to the signs of its projections
+    on n_bits random hyperplanes. Items sharing a bucket with the query in
+    any table are candidates, and the caller re-ranks them exactly. Buckets
+    are sorted code arrays searched with searchsorted.
+
+    The index stores item ids and codes, not vectors, so codes are only
+    valid for the tag vectors they were hashed from. extend() compares the
+    old and new tag matrices, hashes new and changed items into a new index
+    and leaves this one untouched for concurrent readers.
+    """
+
+    def __init__(self, vocabulary, planes, item_ids, codes):
+        self.vocabulary = tuple(vocabulary)
+        self.planes = planes
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.codes = codes
+        self.n_tables = codes.shape[1]
+        self.n_bits = planes.shape[1] // self.n_tables
+
+        # Per table: item positions ordered by code, and the codes in that order
+        self.order = np.argsort(codes, axis=0, kind='stable')
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=0)
+        for array in (self.item_ids, self.codes, self.order, self.sorted_codes):
+            array.flags.writeable = False
+
+    @staticmethod
+    def _hash(planes, vectors, n_tables):
+        projections = np.asarray(vectors @ planes)
+        n_bits = planes.shape[1] // n_tables
+        bits = (projections > 0).reshape(len(projections), n_tables, n_bits).astype(np.int64)
+        return bits @ (1 << np.arange(n_bits, dtype=np.int64))
+
+    @staticmethod
+    def _indexable(vectors):
+        """Rows with at least one tag; empty vectors hash together and match nothing."""
+        return np.diff(vectors.tocsr().indptr) > 0
+
+    @classmethod
+    def build(cls, tag_index, n_tables=SIMILAR_TABLES, n_bits=SIMILAR_BITS, seed=42):
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((len(tag_index.vocabulary), n_tables * n_bits))
+        keep = cls._indexable(tag_index.matrix)
+        codes = cls._hash(planes, tag_index.matrix[keep], n_tables)
+        return cls(tag_index.vocabulary, planes, tag_index.item_ids[keep], codes)
+
+    def can_extend(self, tag_index):
+        """True when `tag_index` only appends terms to this index's vocabulary."""
+        return tag_index.vocabulary[:len(self.vocabulary)] == self.vocabulary
+
+    def extend(self, tag_index, previous, seed=None):
+        """
+        A new index over the items of `tag_index`, which replaces
+        `previous`, the TagIndex this index was built or last extended
+        from. Items whose tag vector is unchanged keep their codes; new
+        items and changed ones (every item, when TF-IDF was refitted) are
+        hashed again, and items no longer present are dropped. New terms
+        get new random hyperplane rows.
+        """
+        planes = self.planes
+        new_terms = len(tag_index.vocabulary) - len(self.vocabulary)
+        if new_terms:
+            rng = np.random.default_rng(seed)
+            planes = np.vstack([planes, rng.standard_normal((new_terms, planes.shape[1]))])
+
+        present = self.item_ids[np.isin(self.item_ids, tag_index.item_ids)]
+        unchanged = present[~changed_rows(previous, tag_index, present)]
+        keep = np.isin(self.item_ids, unchanged)
+        rehash = ~np.isin(tag_index.item_ids, unchanged) & self._indexable(tag_index.matrix)
+        codes = self._hash(planes, tag_index.matrix[rehash], self.n_tables)
+        return TagLSH(
+            tag_index.vocabulary,
+            planes,
+            np.concatenate([self.item_ids[keep], tag_index.item_ids[rehash]]),
+            np.vstack([self.codes[keep], codes]),
+        )
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def candidates(self, vector):
+        """Ids of items sharing a bucket with `vector` (a 1 x terms row) in any table."""
+        if not len(self.item_ids) or vector.shape[1] > len(self.planes):
+            return np.empty(0, dtype=np.int64)
+        codes = self._hash(self.planes[:vector.shape[1]], vector, self.n_tables)[0]
+        positions = []
+        for table, code in enumerate(codes):
+            column = self.sorted_codes[:, table]
+            start, stop = np.searchsorted(column, code), np.searchsorted(column, code, side='right')
+            positions.append(self.order[start:stop, table])
+        return self.item_ids[np.unique(np.concatenate(positions))]
+
+
+def changed_rows(previous, tag_index, item_ids):
+    """
+    True for each of `item_ids` whose tag vector differs between two
+    TagIndexes, where `tag_index`'s vocabulary extends `previous`'s. Items
+    `previous` does not have count as changed.
+    """
+    item_ids = np.asarray(item_ids, dtype=np.int64)
+    known = np.isin(item_ids, previous.item_ids)
+    changed = ~known
+    if known.any():
+        old = previous.matrix[previous.rows_for(item_ids[known])]
+        new = tag_index.matrix[tag_index.rows_for(item_ids[known])]
+        # Appended terms are new columns on the right; pad the old rows to match
+        old = sp.csr_matrix((old.data, old.indices, old.indptr), shape=new.shape)
+        difference = (new - old).tocsr()
+        difference.eliminate_zeros()
+        changed[known] = np.diff(difference.indptr) > 0
+    return changed
+
+
+def recall_at_k(lsh, tag_index, k=10, n_queries=200, seed=0):
+    """
+    Mean share of the exact top-k cosine neighbours (brute force over every
+    item, ignoring ones sharing no tag) that the LSH candidates contain,
+    over random query items.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = tag_index.matrix
+    rows = np.flatnonzero(np.diff(matrix.indptr) > 0)
+    if not len(rows):
+        return float('nan')
+
+    recalls = []
+    for row in rng.choice(rows, size=min(n_queries, len(rows)), replace=False):
+        scores = (matrix @ matrix[row].T).toarray().ravel()
+        scores[row] = 0
+        nearest = np.argsort(-scores, kind='stable')[:k]
+        exact = tag_index.item_ids[nearest[scores[nearest] > 0]]
+        if not len(exact):
+            continue
+        found = np.isin(exact, lsh.candidates(matrix[row]))
+        recalls.append(found.mean())
+    return float(np.mean(recalls)) if recalls else float('nan')
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import scipy.sparse as sp
+
+from item_catalog import ItemCatalog, TermColumn
+from tag_index import TagIndex
+
+SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR', os.path.join('data', 'snapshot'))
+
+
+def catalog_version(name, model):
+    """
+    The ingestion version, bumped whenever catalog rows are inserted or
+    changed, plus row count and max id for writes that don't bump it.
+    """
+    from sqlalchemy import func
+    from models import db, CatalogVersion
+
+    version = db.session.query(CatalogVersion.version).filter_by(name=name).scalar()
+    count, max_id = db.session.query(func.count(model.id), func.max(model.id)).one()
+    return version, count, max_id
+
+
+def _term_column_arrays(prefix, column):
+    return {
+        f'{prefix}.indptr': column.indptr,
+        f'{prefix}.indices': column.indices,
+        f'{prefix}.key_ids': column.key_ids,
+    }
+
+
+def has_snapshot(name, directory=SNAPSHOT_DIR):
+    return os.path.exists(os.path.join(directory, f'{name}.current'))
+
+
+def save_snapshot(name, catalog, tag_index, version, directory=SNAPSHOT_DIR):
+    """
+    Write the catalog columns and its TF-IDF tag index as one .npy file per
+    array plus a JSON file of strings, into a fresh directory. The
+    `<name>.current` pointer is then swapped atomically, so a worker never
+    sees a half-written snapshot; workers that still map an older one keep
+    their pages until they reload.
+    """
+    arrays = {
+        'ids': catalog.ids,
+        'genre_label_ids': catalog.genre_label_ids,
+        'tag_item_ids': tag_index.item_ids,
+        'tfidf.data': tag_index.matrix.data,
+        'tfidf.indices': tag_index.matrix.indices,
+        'tfidf.indptr': tag_index.matrix.indptr,
+    }
+    arrays.update(_term_column_arrays('genres', catalog.genres))
+    for column_name, column in catalog.term_columns.items():
+        arrays.update(_term_column_arrays(f'terms.{column_name}', column))
+    for column_name, values in catalog.numeric.items():
+        arrays[f'numeric.{column_name}'] = values
+
+    meta = {
+        'version': list(version),
+        'fields': list(catalog.fields),
+        'titles': list(catalog.titles),
+        'genre_labels': list(catalog.genre_labels),
+        'genre_terms': list(catalog.genres.terms),
+        'term_columns': {column_name: list(column.terms) for column_name, column in catalog.term_columns.items()},
+        'numeric': list(catalog.numeric),
+        'tfidf_shape': list(tag_index.matrix.shape),
+        'vocabulary': list(tag_index.vocabulary),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    snapshot_name = f'{name}-{uuid.uuid4().hex[:12]}'
+    path = os.path.join(directory, snapshot_name)
+    os.makedirs(path)
+    for array_name, values in arrays.items():
+        np.save(os.path.join(path, f'{array_name}.npy'), np.ascontiguousarray(values))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    pointer = os.path.join(directory, f'{name}.current')
+    with open(f'{pointer}.tmp', 'w') as f:
+        f.write(snapshot_name)
+    os.replace(f'{pointer}.tmp', pointer)
+
+    # Mapped files stay readable after unlinking, so older snapshots can go
+    for entry in os.listdir(directory):
+        if entry.startswith(f'{name}-') and entry != snapshot_name:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return path
+
+
+def load_snapshot(name, directory=SNAPSHOT_DIR):
+    """
+    (version, catalog, tag_index) from the current snapshot of `name`, or
+    None if there is none. Arrays are memory-mapped read-only, so every
+    worker on the host shares the same pages.
+    """
+    try:
+        with open(os.path.join(directory, f'{name}.current')) as f:
+            path = os.path.join(directory, f.read().strip())
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    def array(array_name):
+        return np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode='r')
+
+    def term_column(prefix, terms):
+        return TermColumn(array(f'{prefix}.indptr'), array(f'{prefix}.indices'), terms,
+                          key_ids=array(f'{prefix}.key_ids'))
+
+    catalog = ItemCatalog(
+        meta['fields'],
+        array('ids'),
+        meta['titles'],
+        meta['genre_labels'],
+        array('genre_label_ids'),
+        term_column('genres', meta['genre_terms']),
+        {column_name: array(f'numeric.{column_name}') for column_name in meta['numeric']},
+        {column_name: term_column(f'terms.{column_name}', terms)
+         for column_name, terms in meta['term_columns'].items()},
+    )
+    matrix = sp.csr_matrix(
+        (array('tfidf.data'), array('tfidf.indices'), array('tfidf.indptr')),
+        shape=tuple(meta['tfidf_shape']), copy=False,
+    )
+    tag_index = TagIndex(matrix, meta['vocabulary'], array('tag_item_ids'))
+    return tuple(meta['version']), catalog, tag_index
+
+
+def write_catalog_snapshots(catalogs, directory=SNAPSHOT_DIR):
+    """Snapshot (name, model, catalog, tag_index) tuples at the current table versions."""
+    for name, model, catalog, tag_index in catalogs:
+        save_snapshot(name, catalog, tag_index, catalog_version(name, model), directory)
+        print(f"Wrote {name} catalog snapshot ({len(catalog)} items).")
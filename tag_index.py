@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+
+from item_catalog import ItemCatalog
+
+INDEX_DIR = os.getenv('TAG_INDEX_DIR', os.path.join('data', 'index'))
+
+
+class TagIndex:
+    """
+    Catalog-wide TF-IDF matrix over item tags, built once and shared by
+    every recommend() call. Rows follow the order of `item_ids`.
+    """
+
+    def __init__(self, matrix, vocabulary, item_ids):
+        self.matrix = sp.csr_matrix(matrix)
+        self.vocabulary = tuple(vocabulary)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+
+        # Shared between request threads, so guard against accidental in-place edits
+        for array in (self.matrix.data, self.matrix.indices, self.matrix.indptr, self.item_ids):
+            array.flags.writeable = False
+
+    @classmethod
+    def build(cls, catalog):
+        """Fit TF-IDF over the tag column of an ItemCatalog (or a list of item dicts)."""
+        if not isinstance(catalog, ItemCatalog):
+            catalog = ItemCatalog.from_items(catalog)
+
+        tags = catalog.tags
+        if not tags.terms:
+            return cls(sp.csr_matrix((len(catalog), 0)), [], catalog.ids)
+
+        # Same weighting TfidfVectorizer applies to the raw tag lists, minus the re-tokenizing
+        matrix = TfidfTransformer().fit_transform(tags.counts())
+        return cls(matrix, tags.terms, catalog.ids)
+
+    def covers(self, catalog):
+        ids = catalog.ids if isinstance(catalog, ItemCatalog) else [item['id'] for item in catalog]
+        return bool(np.isin(ids, self.item_ids).all())
+
+    def rows_for(self, item_ids):
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if np.array_equal(item_ids, self.item_ids):
+            return np.arange(len(item_ids))
+        order = np.argsort(self.item_ids, kind='stable')
+        return order[np.searchsorted(self.item_ids, item_ids, sorter=order)]
+
+    def save(self, name, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        sp.save_npz(os.path.join(directory, f'{name}_tfidf.npz'), self.matrix)
+        with open(os.path.join(directory, f'{name}_tags.json'), 'w') as f:
+            json.dump({'vocabulary': list(self.vocabulary), 'item_ids': self.item_ids.tolist()}, f)
+
+    @classmethod
+    def load(cls, name, directory=INDEX_DIR):
+        matrix_path = os.path.join(directory, f'{name}_tfidf.npz')
+        meta_path = os.path.join(directory, f'{name}_tags.json')
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return cls(sp.load_npz(matrix_path), meta['vocabulary'], meta['item_ids'])
+
+
+def load_tag_index(name, catalog, directory=INDEX_DIR):
+    """Load the saved index for `name`, rebuilding it if it no longer matches `catalog`."""
+    tag_index = TagIndex.load(name, directory)
+    if tag_index is None or not tag_index.covers(catalog):
+        print(f"Rebuilding {name} tag index for {len(catalog)} items...")
+        tag_index = TagIndex.build(catalog)
+        tag_index.save(name, directory)
+    return tag_index
+
+
+def rebuild_tag_indexes(directory=INDEX_DIR):
+    """
+    Rebuild the saved movie and game indexes from the current catalog
+    tables, and write the catalog snapshots workers start from.
+    """
+    from models import Movie, Game
+    from snapshot import write_catalog_snapshots
+
+    catalogs = []
+    for name, model in (('movies', Movie), ('games', Game)):
+        catalog = ItemCatalog.from_items(row.to_dict() for row in model.query.yield_per(1000))
+        tag_index = TagIndex.build(catalog)
+        tag_index.save(name, directory)
+        print(f"Rebuilt {name} tag index ({len(catalog)} items).")
+        catalogs.append((name, model, catalog, tag_index))
+    write_catalog_snapshots(catalogs)
@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# Modules live at the repository root, as the app and scripts import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Route tests run the app on a throwaway SQLite database; these are read at import
+_data_dir = tempfile.mkdtemp(prefix='rexys-tests-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_data_dir, 'rexys.db')}")
+os.environ.setdefault('TAG_INDEX_DIR', os.path.join(_data_dir, 'index'))
+os.environ.setdefault('CATALOG_SNAPSHOT_DIR', os.path.join(_data_dir, 'snapshot'))
+os.environ.setdefault('CATALOG_CHECK_SECONDS', '0')
+os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+
+GENRES = ['Action', 'Adventure', 'Indie', 'RPG', 'Strategy', 'Casual']
+CATEGORIES = ['Single-player', 'Multi-player', 'Co-op', 'Steam Achievements', 'Controller support']
+
+
+def steam_rows(n):
+    """Rows shaped like merger.py's output, as seed_games reads them."""
+    return pd.DataFrame({
+        'appid': range(10, 10 + n),
+        'name': [f'Game {i}' for i in range(n)],
+        'categories': [';'.join(CATEGORIES[i % 5:i % 5 + 2]) for i in range(n)],
+        'genres': [';'.join(GENRES[i % 6:i % 6 + 2]) for i in range(n)],
+        'positive_ratings': [100 + 37 * i for i in range(n)],
+        'negative_ratings': [10 + 11 * (i % 7) for i in range(n)],
+        'owners': ['20,000 .. 50,000' if i % 2 else '0 .. 20,000' for i in range(n)],
+    })
+
+
+def imdb_rows(n):
+    """Rows shaped like data/imdb_top_1000.csv, as seed_movies reads them."""
+    return pd.DataFrame({
+        'Series_Title': [f'Movie {i}' for i in range(n)],
+        'Released_Year': [1990 + i % 30 for i in range(n)],
+        'Genre': [', '.join(['Drama', 'Crime', 'Comedy', 'Action', 'Sci-Fi'][i % 5:i % 5 + 2]) for i in range(n)],
+        'IMDB_Rating': [7 + (i % 20) / 10 for i in range(n)],
+        'Overview': [f'A story about {["space", "crime", "love", "war"][i % 4]} and {["friends", "heists"][i % 2]}'
+                     for i in range(n)],
+        'Star1': [f'Actor {i % 9}' for i in range(n)],
+        'Star2': [f'Actor {i % 5}' for i in range(n)],
+        'Star3': [None] * n,
+        'Star4': [None] * n,
+        'No_of_Votes': [1000 * (i + 1) for i in range(n)],
+    })
+
+
+@pytest.fixture
+def app():
+    """The Flask app on an empty database, with fresh catalog stores and result cache."""
+    from app import app
+    from cache import result_cache
+    from catalog import movie_catalog, game_catalog
+    from models import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    for store in (movie_catalog, game_catalog):
+        store._recommender = None
+        store._similarity = None
+        store._version = None
+    result_cache._entries.clear()
+    result_cache._user_keys.clear()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def seeded(app):
+    """Seed-shaped movies and games ingested the way `flask seed` does, plus one user."""
+    from models import db, CatalogVersion, Game, Movie, User
+    from seed import convert_games, convert_movies, ingest_rows
+
+    with app.app_context():
+        ingest_rows(Movie, convert_movies(imdb_rows(40)))
+        CatalogVersion.bump('movies')
+        ingest_rows(Game, convert_games(steam_rows(40)))
+        CatalogVersion.bump('games')
+        db.session.add(User(id=1, username='tester'))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def client(seeded):
+    return seeded.test_client()
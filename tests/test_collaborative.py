@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from collaborative import RatingFactors, _solve_rows
+
+
+def test_solve_rows_does_not_depend_on_the_chunk_size():
+    rng = np.random.default_rng(1)
+    # Row 3 alone holds more ratings than the small chunk, like a popular item
+    counts = [5, 2, 0, 40, 7, 1, 12]
+    rows = np.repeat(np.arange(len(counts)), counts)
+    columns = np.concatenate([rng.choice(50, size=n, replace=False) for n in counts])
+    matrix = sp.csr_matrix((rng.normal(size=len(rows)), (rows, columns)), shape=(len(counts), 50))
+    fixed = rng.normal(size=(50, 6))
+
+    expected = _solve_rows(matrix, fixed, 0.1, chunk_size=10 ** 6)
+    np.testing.assert_allclose(_solve_rows(matrix, fixed, 0.1, chunk_size=10), expected, atol=1e-12)
+    np.testing.assert_array_equal(expected[2], 0)
+
+
+def taste_groups(n_users=60, n_items=40, seed=2):
+    """Two groups of users: each rates its own half of the items high and the other half low."""
+    rng = np.random.default_rng(seed)
+    user_ids, item_ids, ratings = [], [], []
+    for user in range(n_users):
+        for item in rng.choice(n_items, size=15, replace=False):
+            liked = (item < n_items // 2) == (user % 2 == 0)
+            user_ids.append(user + 1)
+            item_ids.append(item + 100)  # Item ids need not start at 0 or be dense
+            ratings.append(9. if liked else 2.)
+    return user_ids, item_ids, ratings
+
+
+@pytest.fixture(scope='module')
+def factors():
+    return RatingFactors.train(*taste_groups(), factors=4, iterations=8)
+
+
+def test_folded_in_user_gets_their_group_scored_higher(factors):
+    item_factors = factors.align(np.arange(100, 140))
+    # A new user who loves three first-half items and dislikes one second-half item
+    user_vector = factors.fold_in(item_factors, ([0, 3, 7, 25], [10., 9., 9., 1.]))
+    scores = factors.scores(item_factors, user_vector)
+
+    assert scores.shape == (40,) and 0 <= scores.min() and scores.max() <= 1
+    assert scores[:20].mean() > scores[20:].mean() + 0.3
+
+
+def test_align_follows_the_catalog_order(factors):
+    catalog_ids = np.array([139, 5, 100, 120, 1000])
+    aligned = factors.align(catalog_ids)
+    by_id = dict(zip(factors.item_ids.tolist(), factors.item_factors))
+
+    for row, item_id in enumerate(catalog_ids):
+        expected = by_id.get(int(item_id), np.zeros(factors.item_factors.shape[1]))
+        np.testing.assert_array_equal(aligned[row], expected)
+    assert not aligned.flags.writeable  # Shared by every request against the catalog
+
+
+def test_fold_in_without_known_items_gives_none(factors):
+    aligned = factors.align(np.array([1, 2, 3]))  # None of these were rated in training
+    assert factors.fold_in(aligned, ([0, 1], [8., 3.])) is None
+    assert factors.fold_in(aligned, ([], [])) is None
+
+
+def test_training_on_no_ratings_scores_nothing():
+    empty = RatingFactors.train([], [], [], factors=4, iterations=2)
+    aligned = empty.align(np.array([1, 2]))
+    np.testing.assert_array_equal(aligned, 0)
+    assert empty.fold_in(aligned, ([0], [7.])) is None
+
+
+def test_factors_round_trip_through_save(factors, tmp_path):
+    factors.save('movies', str(tmp_path))
+    loaded = RatingFactors.load('movies', str(tmp_path))
+    np.testing.assert_array_equal(loaded.item_ids, factors.item_ids)
+    np.testing.assert_array_equal(loaded.item_factors, factors.item_factors)
+    assert (loaded.mean, loaded.low, loaded.high) == (factors.mean, factors.low, factors.high)
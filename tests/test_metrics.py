@@ -0,0 +1,43 @@
+import os
+
+import metrics
+
+
+def worker_registry(directory):
+    registry = metrics.Registry(directory=directory)
+    counter = registry.counter('rankings_total', 'Rankings.', ['outcome'])
+    histogram = registry.histogram('stage_seconds', 'Stage time.', ['stage'], buckets=(0.1, 1))
+    return registry, counter, histogram
+
+
+def test_shared_directory_adds_up_every_worker(tmp_path, monkeypatch):
+    first, first_counter, first_histogram = worker_registry(str(tmp_path))
+    first_counter.inc(3, outcome='ranked')
+    first_histogram.observe(0.05, stage='fuzzy')
+    monkeypatch.setattr(os, 'getpid', lambda: 101)
+    first.flush()
+
+    second, second_counter, second_histogram = worker_registry(str(tmp_path))
+    second_counter.inc(2, outcome='ranked')
+    second_counter.inc(outcome='error')
+    second_histogram.observe(0.5, stage='fuzzy')
+    monkeypatch.setattr(os, 'getpid', lambda: 102)
+    lines = second.render().splitlines()
+
+    assert 'rankings_total{outcome="ranked"} 5' in lines
+    assert 'rankings_total{outcome="error"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fuzzy",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fuzzy",le="1"} 2' in lines
+    assert 'stage_seconds_count{stage="fuzzy"} 2' in lines
+    assert sorted(os.listdir(tmp_path)) == ['101.json', '102.json']
+
+
+def test_without_a_directory_series_carry_the_worker(monkeypatch):
+    registry, counter, histogram = worker_registry(None)
+    counter.inc(outcome='ranked')
+    histogram.observe(0.5, stage='fuzzy')
+    monkeypatch.setattr(os, 'getpid', lambda: 7)
+    lines = registry.render().splitlines()
+
+    assert 'rankings_total{outcome="ranked",worker="7"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fuzzy",worker="7",le="1"} 1' in lines
@@ -0,0 +1,49 @@
+import asyncio
+
+from models import UserMovieRating, UserProfile, db
+from routes.rating import validate_ratings
+
+
+def test_validate_ratings_accepts_numeric_string_ids():
+    accepted, rejected = validate_ratings(
+        [{'movie_id': '5', 'rating': 8}, {'movie_id': 'five', 'rating': 8}, {'movie_id': 5.5, 'rating': 8},
+         {'movie_id': True, 'rating': 8}, {'movie_id': '-2', 'rating': 8}],
+        'movie_id',
+    )
+    assert list(accepted) == [5]
+    assert [entry['index'] for entry in rejected] == [1, 2, 3, 4]
+
+
+def test_rating_sent_with_a_string_id_is_stored(client):
+    response = client.post('/ratings/rate/movies', json={'user_id': '1', 'ratings': [{'movie_id': '3', 'rating': 7}]})
+    assert response.status_code == 201
+    assert response.get_json()['accepted'] == [{'movie_id': 3, 'rating': 7.0}]
+
+    with client.application.app_context():
+        assert [(row.user_id, row.movie_id, row.rating) for row in UserMovieRating.query] == [(1, 3, 7.0)]
+
+
+def test_both_servers_write_ratings_the_same_way(client):
+    from asgi import AsyncServer
+    from test_recommend_routes import asgi_post
+
+    body = {'user_id': 1, 'ratings': [{'movie_id': 3, 'rating': 7}, {'movie_id': 999, 'rating': 7}]}
+    flask_response = client.post('/ratings/rate/movies', json=body)
+
+    with client.application.app_context():
+        flask_profile = UserProfile.query.filter_by(user_id=1, catalog='movies').one().terms
+        UserMovieRating.query.delete()
+        UserProfile.query.delete()
+        db.session.commit()
+
+    async def rate():
+        server = AsyncServer(client.application)
+        try:
+            return await asgi_post(server, '/ratings/rate/movies', body)
+        finally:
+            await server.engine.dispose()
+
+    assert asyncio.run(rate()) == (flask_response.status_code, flask_response.get_json())
+    with client.application.app_context():
+        assert UserProfile.query.filter_by(user_id=1, catalog='movies').one().terms == flask_profile
+        assert [(row.movie_id, row.rating) for row in UserMovieRating.query] == [(3, 7.0)]
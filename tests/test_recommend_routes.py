@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from models import Game, Movie, UserMovieRating
+
+
+def recommended_ids(response):
+    assert response.status_code == 200, response.get_json()
+    return [item['id'] for item in response.get_json()['recommendations']]
+
+
+def test_rating_taken_by_another_worker_misses_the_cached_ranking(client):
+    from catalog import movie_catalog
+    from routes.rating import save_ratings
+
+    first = recommended_ids(client.post('/recommend/movies', json={'user_id': 1, 'k': 5}))
+    assert recommended_ids(client.post('/recommend/movies', json={'user_id': 1, 'k': 5})) == first
+
+    # Another worker takes the rating: this worker's result cache is never told
+    with client.application.app_context():
+        accepted, rejected = save_ratings(
+            movie_catalog, UserMovieRating, Movie, 'movie_id', 1, [{'movie_id': first[0], 'rating': 9}]
+        )
+    assert accepted and not rejected
+
+    assert first[0] not in recommended_ids(client.post('/recommend/movies', json={'user_id': 1, 'k': 5}))
+
+
+def test_seeded_games_without_cost_are_recommended(client):
+    with client.application.app_context():
+        assert Game.query.filter(Game.cost.isnot(None)).count() == 0
+
+    response = client.post('/recommend/games', json={'user_id': 1, 'k': 5, 'preferences': {'genre': 'indie'}})
+    assert len(recommended_ids(response)) == 5
+
+
+async def asgi_post(server, path, body):
+    """(status, JSON body) of one POST through the ASGI app."""
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await server({'type': 'http', 'method': 'POST', 'path': path, 'headers': []}, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def test_both_servers_apply_the_same_user_id_rule(client):
+    from asgi import AsyncServer
+
+    bodies = [{'user_id': 'abc', 'k': 5}, {'user_id': '1', 'k': 5}, {'user_id': 1, 'k': 5}]
+    flask_results = []
+    for body in bodies:
+        response = client.post('/recommend/movies', json=body)
+        flask_results.append((response.status_code, response.get_json()))
+
+    async def asgi_results():
+        server = AsyncServer(client.application)
+        try:
+            return [await asgi_post(server, '/recommend/movies', body) for body in bodies]
+        finally:
+            await server.engine.dispose()
+
+    assert asyncio.run(asgi_results()) == flask_results
+    assert [status for status, _ in flask_results] == [400, 200, 200]
+    assert flask_results[1] == flask_results[2]
+
+
+def test_batch_converts_user_ids_like_the_per_user_routes(client):
+    response = client.post('/recommend/batch', json={
+        'catalog': 'movies', 'k': 3, 'requests': [{'user_id': 1}, {'user_id': '2'}],
+    })
+    assert response.status_code == 200, response.get_json()
+    assert [result['user_id'] for result in response.get_json()['results']] == [1, 2]
+
+    response = client.post('/recommend/batch', json={'catalog': 'movies', 'requests': [{'user_id': 'abc'}]})
+    assert response.status_code == 400
+
+
+def test_stored_batch_lists_are_served_by_the_per_user_route(client):
+    from models import UserRecommendation, db
+
+    body = {'user_id': 1, 'k': 5, 'preferences': {'genre': 'Drama'}}
+    response = client.post('/recommend/batch', json={
+        'catalog': 'movies', 'k': 20, 'store': True,
+        'requests': [{'user_id': '1', 'preferences': body['preferences']}],
+    })
+    assert response.status_code == 200, response.get_json()
+    batch_ids = [item['id'] for item in response.get_json()['results'][0]['recommendations']]
+
+    # Reorder the stored list so a response computed afresh would differ from it
+    with client.application.app_context():
+        stored = UserRecommendation.query.filter_by(user_id=1, catalog='movies').one()
+        assert [item_id for item_id, _ in stored.items] == batch_ids
+        stored.items = stored.items[::-1]
+        db.session.commit()
+
+    assert recommended_ids(client.post('/recommend/movies', json=body)) == batch_ids[::-1][:5]
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import recommender
+from recommender import GameRecommender, MovieRecommender
+
+GENRES = ['Drama', 'Crime', 'Action', 'Comedy']
+
+
+def movies(n_items, seed=3):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'id': i + 1,
+            'title': f'Movie {i + 1}',
+            'genre': ', '.join(rng.choice(GENRES, size=2, replace=False)),
+            'tags': [f'tag{t}' for t in rng.choice(40, size=4, replace=False)],
+            'actors': [f'Actor {a}' for a in rng.choice(60, size=3, replace=False)],
+            'rating': round(float(rng.uniform(5, 10)), 1),
+            'popularity': int(rng.integers(1000, 900000)),
+        }
+        for i in range(n_items)
+    ]
+
+
+def games(n_items, seed=4):
+    """Games shaped like seeded Steam rows: 1-10 ratings, owner-range popularity and no cost."""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'id': i + 1,
+            'title': f'Game {i + 1}',
+            'genre': ', '.join(rng.choice(['Action', 'RPG', 'Indie', 'Strategy'], size=2, replace=False)),
+            'tags': [f'tag{t}' for t in rng.choice(20, size=3, replace=False)],
+            'rating': round(float(rng.uniform(1, 10)), 1),
+            'cost': None,
+            'popularity': int(rng.choice([10000, 35000, 75000, 350000])),
+        }
+        for i in range(n_items)
+    ]
+
+
+@pytest.fixture(scope='module')
+def game_recommender():
+    return GameRecommender(games(200), fuzzy_grid_resolution=0)
+
+
+@pytest.fixture(scope='module')
+def movie_recommender():
+    return MovieRecommender(movies(300), fuzzy_grid_resolution=0)
+
+
+def requests(n_users, n_items, seed=5):
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            {'genre': GENRES[i % len(GENRES)], 'tags': [f'tag{i % 40}', f'tag{(i * 7) % 40}']},
+            set((rng.choice(n_items, size=10, replace=False) + 1).tolist()),
+            rng.random(n_items) if i % 3 == 0 else None,
+            {'genre:drama': 8.0, f'tags:tag{i % 40}': 5.0} if i % 2 else None,
+        )
+        for i in range(n_users)
+    ]
+
+
+def assert_same_rankings(batch, single):
+    assert len(batch) == len(single)
+    for a, b in zip(batch, single):
+        np.testing.assert_array_equal(a.rows, b.rows)
+        np.testing.assert_array_equal(a.scores, b.scores)
+
+
+def test_rank_many_matches_rank(movie_recommender):
+    reqs = requests(25, 300)
+    assert_same_rankings(movie_recommender.rank_many(reqs), [movie_recommender.rank(*r) for r in reqs])
+
+
+def test_fuzzy_slices_do_not_change_rankings(movie_recommender, monkeypatch):
+    reqs = requests(6, 300, seed=9)
+    single = [movie_recommender.rank(*r) for r in reqs]
+
+    # Fewer rows than one request has: every fuzzy pass is split into slices
+    monkeypatch.setattr(recommender, 'FUZZY_BATCH_ROWS', 37)
+    assert_same_rankings(movie_recommender.rank_many(reqs), single)
+    assert_same_rankings([movie_recommender.rank(*r) for r in reqs], single)
+
+
+def test_profile_columns_address_their_own_key(movie_recommender):
+    catalog = movie_recommender.catalog
+    columns = movie_recommender.profile_columns
+    assert sorted(columns.values()) == list(range(movie_recommender.profile_matrix.shape[1]))
+
+    # A profile of one actor scores exactly the movies that actor is in
+    scores = movie_recommender.profile_scores({'actors:actor 7': 5.0})
+    has_actor = np.array([
+        'actor 7' in (actor.lower() for actor in catalog.item(row)['actors']) for row in range(len(catalog))
+    ])
+    assert has_actor.any()
+    np.testing.assert_array_equal(scores > 0, has_actor)
+
+
+def ranked_ids(ranking):
+    return [item['id'] for item, _ in ranking.page(0, len(ranking))]
+
+
+def test_collaborative_scores_change_a_game_ranking(game_recommender):
+    catalog = game_recommender.catalog
+    plain = ranked_ids(game_recommender.rank({'genre': 'Action'}))
+    collaborative = np.zeros(len(catalog))
+    collaborative[catalog.rows_for(plain[-5:])] = 1.  # The CF model loves the five games ranked last
+    blended = ranked_ids(game_recommender.rank({'genre': 'Action'}, collaborative_scores=collaborative))
+
+    assert len(plain) == len(blended) == len(catalog)
+    assert set(blended[:5]) == set(plain[-5:])
+
+
+def test_game_rating_spans_one_to_ten(game_recommender):
+    catalog = game_recommender.catalog
+    rows = catalog.rows_for(ranked_ids(game_recommender.rank({})))
+    # Among games of the same popularity, with no preferences, the better-rated come first
+    popularity = catalog.numeric['popularity'][rows]
+    ratings = catalog.numeric['rating'][rows][popularity == popularity[0]]
+    assert ratings[:10].mean() > ratings[-10:].mean() + 3
+
+
+def test_profile_changes_a_game_ranking(game_recommender):
+    catalog = game_recommender.catalog
+    is_rpg = np.array(['rpg' in catalog.item(row)['genre'].lower() for row in range(len(catalog))])
+    plain = catalog.rows_for(ranked_ids(game_recommender.rank({'genre': 'Action'})))
+    profiled = catalog.rows_for(ranked_ids(
+        game_recommender.rank({'genre': 'Action'}, profile_terms={'genre:rpg': 9.})
+    ))
+
+    assert is_rpg[profiled[:20]].sum() > is_rpg[plain[:20]].sum()
+
+
+def test_empty_catalogs_build():
+    for recommender_class in (MovieRecommender, GameRecommender):
+        assert len(recommender_class([]).rank({})) == 0
+
+
+@pytest.mark.parametrize('recommender_fixture', ['movie_recommender', 'game_recommender'])
+def test_shared_recommender_gives_serial_results_under_threads(recommender_fixture, request):
+    shared = request.getfixturevalue(recommender_fixture)
+    reqs = requests(8, len(shared.catalog), seed=11)
+    serial = [shared.rank(*r) for r in reqs]
+
+    jobs = [i % len(reqs) for i in range(8 * len(reqs))]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: shared.rank(*reqs[i]), jobs))
+    assert_same_rankings(results, [serial[i] for i in jobs])
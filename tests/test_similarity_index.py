@@ -0,0 +1,90 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+from similarity_index import TagLSH, changed_rows, recall_at_k
+from tag_index import TagIndex
+
+
+def tag_index(rows, n_terms, item_ids):
+    matrix = normalize(sp.csr_matrix(np.asarray(rows, dtype=float)), norm='l2', axis=1)
+    vocabulary = [f'tag{t}' for t in range(n_terms)]
+    return TagIndex(sp.csr_matrix(matrix), vocabulary, item_ids)
+
+
+def random_rows(n_items, n_terms, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((n_items, n_terms)) < 0.2) * rng.random((n_items, n_terms))
+
+
+def codes_by_id(lsh):
+    return {int(item_id): lsh.codes[i].tolist() for i, item_id in enumerate(lsh.item_ids)}
+
+
+def test_changed_rows_ignores_unchanged_and_appended_terms():
+    rows = random_rows(6, 8)
+    previous = tag_index(rows, 8, range(1, 7))
+    rows = np.hstack([rows, np.zeros((6, 2))])
+    rows[2, 9] = 0.5
+    current = tag_index(rows, 10, range(1, 7))
+
+    changed = changed_rows(previous, current, [1, 2, 3, 4, 7])
+    assert changed.tolist() == [False, False, True, False, True]
+
+
+def test_extend_rehashes_items_whose_tags_changed():
+    rows = random_rows(50, 20)
+    previous = tag_index(rows, 20, range(1, 51))
+    lsh = TagLSH.build(previous, n_tables=4, n_bits=6)
+
+    # Tags of existing items edited in place, plus one new item
+    rows = rows.copy()
+    rows[[3, 17]] = random_rows(2, 20, seed=1)
+    rows = np.vstack([rows, random_rows(1, 20, seed=2)])
+    current = tag_index(rows, 20, range(1, 52))
+
+    extended = lsh.extend(current, previous)
+    # Same hyperplanes, so every code must equal a fresh build over the new vectors
+    assert codes_by_id(extended) == codes_by_id(TagLSH.build(current, n_tables=4, n_bits=6))
+
+
+def test_extend_keeps_codes_of_unchanged_items_and_drops_removed_ones():
+    rows = random_rows(30, 12)
+    previous = tag_index(rows, 12, range(1, 31))
+    lsh = TagLSH.build(previous, n_tables=4, n_bits=6)
+
+    current = tag_index(rows[1:], 12, range(2, 31))
+    extended = lsh.extend(current, previous)
+    before = codes_by_id(lsh)
+    assert codes_by_id(extended) == {item_id: codes for item_id, codes in before.items() if item_id != 1}
+
+
+class NearestNeighbours:
+    """Stands in for an LSH index: its candidates are the true m nearest items, by dense cosine."""
+
+    def __init__(self, rows, item_ids, m):
+        self.unit = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+        self.item_ids = np.asarray(item_ids)
+        self.m = m
+
+    def candidates(self, vector):
+        query = np.asarray(vector.todense()).ravel()
+        scores = self.unit @ (query / np.linalg.norm(query))
+        scores[np.argmax(scores)] = -1  # The query item itself
+        return self.item_ids[np.argsort(-scores)[:self.m]]
+
+
+def test_recall_at_k_measures_against_brute_force():
+    rows = np.random.default_rng(3).random((80, 12))  # Every item has every tag, so no empty rows or ties
+    index = tag_index(rows, 12, range(1, 81))
+
+    assert recall_at_k(NearestNeighbours(rows, range(1, 81), 10), index, k=10, n_queries=30) == 1.0
+    assert recall_at_k(NearestNeighbours(rows, range(1, 81), 5), index, k=10, n_queries=30) == 0.5
+    assert recall_at_k(NearestNeighbours(rows, range(1, 81), 0), index, k=10, n_queries=30) == 0.0
+
+
+def test_lsh_recall_rises_with_more_candidates():
+    index = tag_index(random_rows(400, 30, seed=4), 30, range(1, 401))
+    few = recall_at_k(TagLSH.build(index, n_tables=2, n_bits=8), index, n_queries=50)
+    many = recall_at_k(TagLSH.build(index, n_tables=32, n_bits=4), index, n_queries=50)
+    assert 0 <= few < many <= 1
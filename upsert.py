@@ -0,0 +1,49 @@
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db
+
+# Rows per statement, keeping PostgreSQL/SQLite bind parameter counts in range
+UPSERT_CHUNK_SIZE = 1000
+
+
+def upsert_statement(dialect, model, rows, key_columns, update_columns):
+    """One INSERT ... ON CONFLICT DO UPDATE for PostgreSQL or SQLite, or None on other databases."""
+    if dialect not in ('postgresql', 'sqlite'):
+        return None
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(model).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+
+
+def bulk_upsert(model, rows, key_columns, update_columns):
+    """
+    Insert `rows` (dicts of column values) into `model`'s table, updating
+    `update_columns` where a row with the same `key_columns` already exists.
+
+    PostgreSQL and SQLite get a single INSERT ... ON CONFLICT DO UPDATE;
+    other databases fall back to one SELECT for the existing keys followed
+    by bulk inserts and updates. Rows must be unique on `key_columns`.
+    """
+    if len(rows) > UPSERT_CHUNK_SIZE:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            bulk_upsert(model, rows[start:start + UPSERT_CHUNK_SIZE], key_columns, update_columns)
+        return
+
+    if not rows:
+        return
+
+    statement = upsert_statement(db.session.get_bind().dialect.name, model, rows, key_columns, update_columns)
+    if statement is not None:
+        db.session.execute(statement)
+        return
+
+    key_attributes = [getattr(model, column) for column in key_columns]
+    keys = [tuple(row[column] for column in key_columns) for row in rows]
+    existing = set(db.session.query(*key_attributes).filter(tuple_(*key_attributes).in_(keys)))
+
+    db.session.bulk_update_mappings(model, [row for row, key in zip(rows, keys) if key in existing])
+    db.session.bulk_insert_mappings(model, [row for row, key in zip(rows, keys) if key not in existing])